@@ -16,6 +16,8 @@ import os
 import sys
 import time
 import argparse
+import threading
+import wx.lib.newevent
 import matplotlib
 import numpy as np
 import pandas as pd
@@ -25,13 +27,16 @@ from datetime import datetime
 from matplotlib.backends.backend_wxagg import FigureCanvasWxAgg as FigureCanvas
 from matplotlib.figure import Figure
 from matplotlib.patches import Rectangle
+from matplotlib.transforms import Bbox
 import matplotlib.cm as cm
 import matplotlib.pyplot as plt
-matplotlib.use('WXAgg')
+matplotlib.use('Agg') # pyplot only saves figures (from the parameter testing thread), the GUI has its own canvas
 
 ## Local imports
-from detector import detector
+from detector import detector, frame_reader
 
+## Event posted by the parameter testing thread as each step finishes
+TestStepEvent, EVT_TEST_STEP = wx.lib.newevent.NewEvent()
 
 ## Set up wxPython application window
 class App(wx.App):
@@ -58,6 +63,19 @@ class main_gui(wx.Frame):
 
         ## Default rectangle variable
         self.pressed=False
+
+        ## Parameter testing runs on a worker thread, drawing as each step finishes
+        self.test_thread, self.test_cancel = None, threading.Event()
+        self.Bind(EVT_TEST_STEP, self.on_test_step)
+
+        ## The ROI rectangle and filter sliders redraw only their artists, over a cached
+        ## background of their subplot
+        self.roi_drawing, self.roi_background = False, None
+        self.filter_backgrounds = None
+
+        ## Frames for the frame slider are decoded on demand
+        self.frame_reader, self.frame_timer = None, None
+        self.canvas.mpl_connect('draw_event', self.on_draw)
         
         ## Initialize bottom text bar
         self.box_sizer.Add(self.status_bar, 0, border=0, flag=0)
@@ -169,6 +187,9 @@ class main_gui(wx.Frame):
         
         ## Set up
         self.status_bar.SetStatusText("Loading video",0)
+        self.enable_filter_sliders(False)
+        self.roi_drawing = False
+        self.slider_frame.Enable(False)
         self.figure.clear()
         self.axes   = [self.figure.add_subplot(111), ]
         
@@ -183,15 +204,17 @@ class main_gui(wx.Frame):
             self.checkBox_fixed_ROI.Enable(True)
             self.input_convert_to_cm_sec.Enable(True)
 
-            ## Busy cursor while the detector object is called and initialized
+            ## Busy cursor while the detector object is called and initialized. Only the first
+            ## frame is decoded here, the region of interest is decoded when testing parameters
             wx.BeginBusyCursor()
             try:
                 vars = self.update_variables()
                 self.detector = detector(self.video_file,
                                         gui=True,
-                                        variables = vars)
+                                        variables = vars,
+                                        proxy = True)
             
-                self.axes[0].imshow(self.detector.image_stack[0])
+                self.frame_image = self.axes[0].imshow(self.detector.image_stack[0])
                 self.figure.canvas.draw()
             finally:
                 wx.EndBusyCursor()
@@ -201,8 +224,15 @@ class main_gui(wx.Frame):
             self.canvas.mpl_connect('button_press_event', self.draw_rectangle)
             self.canvas.mpl_connect('button_release_event', self.on_release)
             self.canvas.mpl_connect('motion_notify_event', self.on_motion)
-            self.rect = Rectangle((0,0), 1, 1, fill=False, ec='r')
+            self.rect = Rectangle((0,0), 1, 1, fill=False, ec='r', animated=True)
             self.axes[0].add_patch(self.rect)
+            self.roi_drawing = True
+
+            ## Frame slider over the whole video
+            self.frame_reader = frame_reader(self.video_file, self.detector.width, self.detector.height)
+            self.slider_frame.SetRange(0, max(self.detector.n_frames - 1, 1))
+            self.slider_frame.SetValue(0)
+            self.slider_frame.Enable(True)
 
             ## Auto-set GUI parameters from the video
             self.input_blank_0.SetValue('0')
@@ -227,7 +257,7 @@ class main_gui(wx.Frame):
             
             ## Try to make the local linear regression window size 2 seconds, but if not then 35% of the frames in the video
             if self.detector.n_frames < self.input_frame_rate*2:
-                self.input_window.SetValue(str(int(len(self.detector.image_stack) * .35)))                
+                self.input_window.SetValue(str(int(self.detector.n_frames * .35)))                
             else:
                 self.input_window.SetValue(str(int(self.input_frame_rate)*2))
 
@@ -301,7 +331,7 @@ class main_gui(wx.Frame):
                     self.rect.set_width(self.x1 - self.x0)
                     self.rect.set_height(self.y1 - self.y0)
                     self.rect.set_xy((self.x0, self.y0))
-                    self.canvas.draw()
+                    self.blit_rect()
                 
                 ## Set the values in the GUI and program to drawn rectangle
                 self.input_x.SetValue(str(self.x0))
@@ -344,13 +374,26 @@ class main_gui(wx.Frame):
                 self.rect.set_width(self.x1 - self.x0)
                 self.rect.set_height(self.y1 - self.y0)
                 
-                self.canvas.draw()
+                self.blit_rect()
             else:
                 pass
         except:
             pass
         return
 
+    def blit_rect(self, restore = True):
+        '''Redraws only the ROI rectangle, over the cached frame
+        ----
+        Inputs:
+          restore (bool): Restores the cached frame first
+        ----
+        Returns:
+          None'''
+        if restore: self.canvas.restore_region(self.roi_background)
+        self.axes[0].draw_artist(self.rect)
+        self.canvas.blit(self.axes[0].bbox)
+        return
+
     def update_ROIdisp(self):
         '''Updates the ROI coordinates as the rectangle is drawn.'''
         self.input_x.SetValue(str(self.x0))
@@ -360,8 +403,17 @@ class main_gui(wx.Frame):
         return
 
     def OnButton_testParButton(self, event):
-        '''Tests the entered parameters when the `Test parameters` button is pressed'''
+        '''Tests the entered parameters when the `Test parameters` button is pressed. The
+        detector runs on a worker thread and each subplot is drawn as its step finishes;
+        pressing the button again (`Cancel test`) stops testing after the current step.'''
         if args.debug: print('main_gui.OnButton_testParButton')
+
+        ## Cancelling a test that is running
+        if self.test_thread != None and self.test_thread.is_alive():
+            self.test_cancel.set()
+            self.button_test_parameters.Enable(False)
+            self.status_bar.SetStatusText("Cancelling after the current step...",0)
+            return
         self.status_bar.SetStatusText("Testing parameters...",0)
 
         #Prep the parameters
@@ -369,6 +421,9 @@ class main_gui(wx.Frame):
         self.checkBox_fixed_ROI.Enable(False)
 
         ## Set up figure for plots
+        self.enable_filter_sliders(False)
+        self.roi_drawing = False
+        self.slider_frame.Enable(False)
         self.figure.clear()
         self.axes = [self.figure.add_subplot(231),
                      self.figure.add_subplot(232),
@@ -376,24 +431,204 @@ class main_gui(wx.Frame):
                      self.figure.add_subplot(234),
                      self.figure.add_subplot(235),
                      self.figure.add_subplot(236)]
+        self.canvas.draw_idle()
+
+        ## Other buttons would change the detector while it runs
+        for button in [self.button_browse_video, self.button_reload_video, self.button_store_parameters]:
+            button.Enable(False)
+        self.button_test_parameters.SetLabel('Cancel test')
+
+        ## Runs the detector on a worker thread
+        variables = variables + ['debug='+str(args.debug)]
+        self.test_cancel = threading.Event()
+        self.test_thread = threading.Thread(target = self.run_parameter_testing,
+                                            args = (variables, self.axes, self.test_cancel))
+        self.test_thread.daemon = True
+        self.test_thread.start()
+        return
 
-        ## Busy cursor while the main function runs
-        wx.BeginBusyCursor()
+    def run_parameter_testing(self, variables, axes, cancel):
+        '''Worker thread for parameter testing. Posts each step's plots back to the GUI
+        thread, which does all the drawing, and stops between steps once cancelled.
+        ----
+        Inputs:
+          variables (list): Variables from the GUI
+          axes (list): Six subplots to fill
+          cancel (threading.Event): Set to stop testing after the current step
+        ----
+        Returns:
+          None -- posts TestStepEvent objects to the GUI'''
+        outcome, status = 'complete', None
         try:
-            variables = variables + ['debug='+str(args.debug)]
-            self.detector.parameter_testing(variables, self.axes)
+            for status, draw in self.detector.parameter_testing_steps(variables, axes):
+                wx.PostEvent(self, TestStepEvent(status = status, draw = draw, done = False))
+                if cancel.is_set():
+                    outcome = 'cancelled'
+                    break
+        except (Exception, SystemExit) as e:
+            outcome, status = 'failed', 'Parameter testing failed: %s' % (str(e) or type(e).__name__)
+            if args.debug: raise
         finally:
-            wx.EndBusyCursor()
+            wx.PostEvent(self, TestStepEvent(status = status, draw = None, done = outcome))
+        return
 
-        ## Renders plots in the GUI
-        self.figure.tight_layout()
-        self.figure.canvas.draw()
-        
-        # Enable buttons and print statements once parameter testing is complete
+    def on_test_step(self, event):
+        '''Draws the plots of a finished parameter testing step, and resets the buttons
+        once testing is complete, cancelled, or failed'''
+        if args.debug: print('main_gui.on_test_step')
+        if event.draw != None:
+            event.draw()
+            self.figure.tight_layout()
+            self.canvas.draw_idle()
+        if event.status != None and not event.done:
+            self.status_bar.SetStatusText(event.status,0)
+        if not event.done: return
+
+        ## Enable buttons and print statements once parameter testing is over
+        self.button_test_parameters.SetLabel('Test parameters')
+        self.button_test_parameters.Enable(True)
+        self.button_browse_video.Enable(True)
         self.button_reload_video.Enable(True)
-        self.button_store_parameters.Enable(True)
-        if args.debug: print('Parameter testing complete')
-        self.status_bar.SetStatusText("Refine detector parameters by reloading the video, or finish optimization by pressing 'Save configuration'",0)
+        if event.done == 'complete':
+            self.button_store_parameters.Enable(True)
+            self.enable_filter_sliders(True)
+            if args.debug: print('Parameter testing complete')
+            self.status_bar.SetStatusText("Refine detector parameters by reloading the video, or finish optimization by pressing 'Save configuration'",0)
+        elif event.done == 'cancelled':
+            self.status_bar.SetStatusText("Parameter testing cancelled, refine detector parameters and test again",0)
+        else:
+            self.status_bar.SetStatusText(event.status,0)
+        return
+
+    def enable_filter_sliders(self, enable):
+        '''Enables the threshold and eccentricity sliders once parameter testing is complete,
+        setting them to the tested values, or disables them
+        ----
+        Inputs:
+          enable (bool): True enables the sliders, False disables them
+        ----
+        Returns:
+          None'''
+        if args.debug: print('main_gui.enable_filter_sliders')
+        sliders = [self.slider_threshold, self.slider_ecc_low, self.slider_ecc_high]
+        if not enable:
+            for slider in sliders: slider.Enable(False)
+            self.filter_backgrounds = None
+            return
+
+        ## Threshold slider spans the signal of the detected spots
+        signal = self.detector.df_detected.signal
+        self.slider_threshold.SetRange(int(np.floor(signal.min())), int(np.ceil(signal.max())))
+        self.slider_threshold.SetValue(int(self.detector.threshold))
+        self.slider_ecc_low.SetValue(int(round(self.detector.ecc_low * 100)))
+        self.slider_ecc_high.SetValue(int(round(self.detector.ecc_high * 100)))
+        for slider in sliders: slider.Enable(True)
+
+        ## Frame slider over the tested frames, already in memory (clean_stack)
+        d = self.detector
+        self.slider_frame.SetRange(0, max(d.clean_stack.shape[0] - 1, 1))
+        self.slider_frame.SetValue(d.check_frame)
+        self.slider_frame.Enable(True)
+
+        ## Filter artists are drawn separately (blitted) from the rest of the figure
+        for artist in self.detector.filter_artists.values():
+            artist.set_animated(True)
+        self.filter_axes = [self.axes[1], self.axes[4]]
+        self.filter_backgrounds = dict()
+        self.canvas.draw()
+        return
+
+    def on_draw(self, event):
+        '''Caches the background of the blitted subplots after a full redraw (e.g. after
+        resizing), then draws the ROI rectangle or filter artists on top'''
+        if self.roi_drawing:
+            self.roi_background = self.canvas.copy_from_bbox(self.axes[0].bbox)
+            self.blit_rect(restore = False)
+        if self.filter_backgrounds == None: return
+        for ax in self.filter_axes:
+            bbox = Bbox.union([ax.bbox, ax.title.get_window_extent(self.canvas.get_renderer())]).padded(2)
+            self.filter_backgrounds[ax] = bbox, self.canvas.copy_from_bbox(bbox)
+        self.blit_filter_artists(restore = False)
+        return
+
+    def blit_filter_artists(self, restore = True):
+        '''Redraws only the filter artists (and shown frame) and their subplots
+        ----
+        Inputs:
+          restore (bool): Restores the cached subplot backgrounds first
+        ----
+        Returns:
+          None'''
+        for ax in self.filter_axes:
+            bbox, background = self.filter_backgrounds[ax]
+            if restore: self.canvas.restore_region(background)
+            for artist in self.detector.filter_artists.values():
+                if artist.axes == ax: ax.draw_artist(artist)
+            for spine in ax.spines.values(): ax.draw_artist(spine) # Over the shown frame
+            self.canvas.blit(bbox)
+        return
+
+    def OnSlider_frame(self, event):
+        '''Shows the frame selected with the frame slider. Tested frames are in memory, other
+        frames not yet decoded are shown once the slider rests, so dragging does not queue
+        up decoding.'''
+        if self.frame_timer != None: self.frame_timer.Stop()
+        frame = self.slider_frame.GetValue()
+        if self.filter_backgrounds != None or self.frame_reader.cached(frame):
+            self.show_frame(frame)
+        else:
+            self.status_bar.SetStatusText("Decoding frame %i..." % frame,0)
+            self.frame_timer = wx.CallLater(100, self.show_frame, frame)
+        return
+
+    def show_frame(self, frame):
+        '''Shows a frame: the whole frame while drawing the region of interest, or the
+        region of interest with its spots once parameters are tested
+        ----
+        Inputs:
+          frame (int): Frame of the video, or of the tested frames (from crop_0)
+        ----
+        Returns:
+          None'''
+        if args.debug: print('main_gui.show_frame')
+        if self.filter_backgrounds != None:
+            self.detector.scrub_frame(frame)
+            self.blit_filter_artists()
+            spots = self.detector.df_big[self.detector.df_big.frame == frame]
+            self.status_bar.SetStatusText("Frame %i: %i spots, %i passing the filters" % 
+                                          (frame, spots.shape[0], spots.True_particle.sum()),0)
+        elif self.roi_drawing:
+            image = self.frame_reader[frame]
+            if image is None: return
+            self.frame_image.set_data(image)
+            self.canvas.draw_idle()
+            self.status_bar.SetStatusText("Frame %i" % frame,0)
+        return
+
+    def OnSlider_filter(self, event):
+        '''Filters the spots of the last parameter test again as the threshold or eccentricity
+        sliders move, without detecting spots again'''
+        if args.debug: print('main_gui.OnSlider_filter')
+        ecc_low, ecc_high = self.slider_ecc_low.GetValue(), self.slider_ecc_high.GetValue()
+        if ecc_low > ecc_high:
+            if event.GetEventObject() == self.slider_ecc_low: self.slider_ecc_high.SetValue(ecc_low)
+            else: self.slider_ecc_low.SetValue(ecc_high)
+            ecc_low, ecc_high = self.slider_ecc_low.GetValue(), self.slider_ecc_high.GetValue()
+        threshold = self.slider_threshold.GetValue()
+
+        ## Keeping the entered parameters in sync, for the configuration file
+        self.input_threshold.SetValue(str(threshold))
+        self.input_ecc_low.SetValue(str(ecc_low / 100))
+        self.input_ecc_high.SetValue(str(ecc_high / 100))
+
+        try:
+            self.detector.refilter(threshold, ecc_low / 100, ecc_high / 100)
+        except SystemExit:
+            self.status_bar.SetStatusText("No spots pass these filters",0)
+            return
+        self.blit_filter_artists()
+        self.status_bar.SetStatusText("%i of %i spots pass the filters; press 'Test parameters' to update the vial plots" % 
+                                      (self.detector.df_big.True_particle.sum(), self.detector.df_big.shape[0]),0)
         return
 
     def OnButton_strParButton(self, event):
@@ -737,7 +972,7 @@ class main_gui(wx.Frame):
         ## Bottom panels
         self.text_video_path = wx.StaticText(id=wxID_video_path,
               label='Video Path', name='text_video_path', parent=self.panel1,
-              pos=wx.Point(10, 205), size=wx.Size(930, 22), style=0)
+              pos=wx.Point(10, 205), size=wx.Size(540, 22), style=0)
         self.text_video_path.SetBackgroundColour(wx.Colour(241, 241, 241))
 
         self.button_test_parameters = wx.Button(id=wxID_test_parameters,
@@ -760,6 +995,36 @@ class main_gui(wx.Frame):
         self.button_store_parameters.Bind(wx.EVT_BUTTON, self.OnButton_strParButton,
               id=wxID_store_parameters)
 
+        ## Sliders re-filtering the spots of the last parameter test
+        self.text_slider_threshold = wx.StaticText(id=wxID_text_slider_threshold,
+              label=u'Threshold:', name='text_slider_threshold', parent=self.panel1,
+              pos=wx.Point(col1 + 160*3, 182), size=wx.Size(medium_box_dimensions), style=0)
+        self.slider_threshold = wx.Slider(id=wxID_slider_threshold,
+              name=u'slider_threshold', parent=self.panel1, pos=wx.Point(col1 + 160*3 + 65, 180),
+              size=wx.Size(130, 22), value=0, minValue=0, maxValue=255)
+        self.text_slider_ecc = wx.StaticText(id=wxID_text_slider_ecc,
+              label=u'Ecc:', name='text_slider_ecc', parent=self.panel1,
+              pos=wx.Point(col5 - 50, 182), size=wx.Size(small_box_dimensions), style=0)
+        self.slider_ecc_low = wx.Slider(id=wxID_slider_ecc_low,
+              name=u'slider_ecc_low', parent=self.panel1, pos=wx.Point(col5 - 15, 180),
+              size=wx.Size(95, 22), value=0, minValue=0, maxValue=100)
+        self.slider_ecc_high = wx.Slider(id=wxID_slider_ecc_high,
+              name=u'slider_ecc_high', parent=self.panel1, pos=wx.Point(col5 + 85, 180),
+              size=wx.Size(95, 22), value=100, minValue=0, maxValue=100)
+        for slider in [self.slider_threshold, self.slider_ecc_low, self.slider_ecc_high]:
+            slider.Bind(wx.EVT_SLIDER, self.OnSlider_filter)
+            slider.Enable(False)
+
+        ## Frame slider, showing frames decoded on demand
+        self.text_slider_frame = wx.StaticText(id=wxID_text_slider_frame,
+              label=u'Frame:', name='text_slider_frame', parent=self.panel1,
+              pos=wx.Point(col1 + 560, 207), size=wx.Size(small_box_dimensions), style=0)
+        self.slider_frame = wx.Slider(id=wxID_slider_frame,
+              name=u'slider_frame', parent=self.panel1, pos=wx.Point(col1 + 605, 205),
+              size=wx.Size(325, 22), value=0, minValue=0, maxValue=1)
+        self.slider_frame.Bind(wx.EVT_SLIDER, self.OnSlider_frame)
+        self.slider_frame.Enable(False)
+
         ## Text box at the bottom
         self.status_bar = wx.StatusBar(id=wxID_status_bar,
               name='status_bar', parent=self, style=0)
@@ -899,7 +1164,10 @@ wxID_check_box_outlier,wxID_outlier_TB,wxID_outlier_LR,
 wxID_text_naming_convention,wxID_input_naming_convention,
 wxID_text_vial_id_vars,wxID_input_vial_id_vars,
 wxID_text_path_project,wxID_input_path_project,
-wxID_input_convert_to_cm_sec,wxID_check_box_ROI] = [wx.ID_ANY for item in range(60)] 
+wxID_input_convert_to_cm_sec,wxID_check_box_ROI,
+wxID_text_slider_threshold,wxID_slider_threshold,
+wxID_text_slider_ecc,wxID_slider_ecc_low,wxID_slider_ecc_high,
+wxID_text_slider_frame,wxID_slider_frame] = [wx.ID_ANY for item in range(67)] 
 
 
 ## Basic GUI sizes and spacers
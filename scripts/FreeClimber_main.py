@@ -15,12 +15,9 @@ doi =  'https://doi.org/10.1242/jeb.229377' ## Link to published paper
 import os
 import sys
 import argparse
+import contextlib
 from time import time,ctime
 from datetime import datetime
-from pandas import read_csv, concat
-from numpy import sort, repeat, unique
-import matplotlib.pyplot as plt
-from matplotlib.cm import Greys_r
 
 ## Importing local module(s)
 import detector as detector
@@ -34,12 +31,40 @@ class FreeClimber(object):
         
         ## Load main parameters and get the list of files to process
         self.load_parameters()
+        self.queue = None
+        if self.args.distributed != None:
+            import work_queue
+            self.queue = work_queue.work_queue(self.path_project,
+                                               batch = self.args.distributed,
+                                               stale_after = self.args.stale_after,
+                                               heartbeat = self.args.heartbeat,
+                                               debug = self.args.debug)
+        self.index = None
+        if self.args.index:
+            import project_index
+            path_index = None
+            ## SQLite should not be shared between hosts, each keeps its own index
+            if self.queue != None:
+                path_index = os.path.join(self.path_project, 'log', 'index.%s.sqlite' % self.queue.host)
+            self.index = project_index.project_index(self.path_project, path_index = path_index, debug = self.args.debug)
         self.get_filelist()
         ## Insert 1 -- variable check
 
         ## Basic variables
         self.count = 0
         self.first_run = True
+
+        ## Plots rendered by a separate pool of processes (see plots.py), and plot inputs
+        ##    files each video waits on before its duplicates are linked (see link_rendered)
+        self.renderer, self.pending_links = None, dict()
+        if self.args.render_workers > 0:
+            import plots
+            self.renderer = plots.render_pool(workers = self.args.render_workers)
+
+        ## Group copies of the same recording, only the first of each group is processed
+        self.duplicates = dict()
+        if self.args.deduplicate:
+            self.group_duplicates()
         return
             
     def load_parameters(self):
@@ -120,7 +145,7 @@ class FreeClimber(object):
         print("## Processing %s videos\n##\n##" % (str(len(self.file_list))))
         return
 
-    def file_walker(self,folder = None, endswith = None, undone = False):
+    def file_walker(self,folder = None, endswith = None, undone = False, quiet = False):
         '''From a specified parent folder, find all child files with the specified suffix
         ----
         Inputs:
@@ -128,12 +153,24 @@ class FreeClimber(object):
           endswith (str): Suffix of a common file type
           undone (bool): False finds all files with the 'endswith' suffix. 
                          True does the same, but excludes '.slopes.csv' files (processed)
+          quiet (bool): True does not print a message when all files were processed
         ----
         Returns:
           _list (list): sorted list of all file paths with a common suffix in a parent folder
         '''
         if self.args.debug: print('FreeClimber.file_walker')
+
+        ## Query the project index instead of walking the folder
+        if self.index != None and folder == self.path_project:
+            _list = self.index.file_walker(endswith = endswith, undone = undone)
+            if undone and len(_list) == 0 and not quiet:
+                print('All files previously processed, re-evaluate your inputs if this message is a surprise.')
+            return _list
         
+        ## Multiple suffixes can be specified as a tuple, e.g. file_suffix=('h264','mp4')
+        if isinstance(endswith, str): suffixes = [endswith]
+        else: suffixes = list(endswith)
+
         _list1,_list2 = [],[]
         for root, dirs, files in os.walk(folder):
             for name in files:
@@ -141,11 +178,11 @@ class FreeClimber(object):
                     _list1.append((os.path.join(root, name)))
                 if undone:
                     if name.endswith('.slopes.csv'):
-                        _list2.append(os.path.join(root, name[:-11])+'.'+endswith)
+                        _list2 += [os.path.join(root, name[:-11])+'.'+item for item in suffixes]
 
         ## Return a sorted list of all files with the file suffix
         if undone == False:
-            _list = sorted(unique(_list1))
+            _list = sorted(set(_list1))
             return _list
 
         ## Return a sorted list of all undone files            
@@ -153,10 +190,38 @@ class FreeClimber(object):
             _list1,_list2 = set(_list1),set(_list2)
             _list = list(_list1.difference(_list2))
             _list = sorted(	_list)
-            if len(_list) == 0:
+            if len(_list) == 0 and not quiet:
                 print('All files previously processed, re-evaluate your inputs if this message is a surprise.')
             return 	_list
 
+    def group_duplicates(self):
+        '''Groups videos holding the same recording in different containers (see
+        fingerprint.py) and keeps only the first video of each group in the file list.'''
+        if self.args.debug: print('FreeClimber.group_duplicates')
+        import fingerprint
+
+        print('Fingerprinting %s videos for duplicate recordings' % len(self.file_list))
+        groups = fingerprint.group_recordings(self.file_list, prefer = self.file_suffix, debug = self.args.debug)
+
+        self.file_list = sorted([group[0] for group in groups])
+        self.duplicates = dict([(group[0],group[1:]) for group in groups if len(group) > 1])
+        for item in self.duplicates.keys():
+            print('----> %s duplicate(s) of %s will reuse its results' % (len(self.duplicates[item]),item))
+        return
+
+    def link_duplicates(self, video_file):
+        '''Reuses the results of a processed video for its duplicate recordings'''
+        if self.args.debug: print('FreeClimber.link_duplicates')
+        import fingerprint
+
+        for item in self.duplicates.get(video_file,[]):
+            print('Linking results of %s to duplicate: %s' % (os.path.split(video_file)[-1],item))
+            fingerprint.link_results(video_file, item,
+                                     naming_convention = self.naming_convention,
+                                     vial_id_vars = self.vial_id_vars)
+            self.log_video(completed=True, file_name = item)
+        return
+
     def timer(self, time_begin):
         '''Timer for measuring each video's processing time'''
         if self.args.debug: print('FreeClimber.timer')
@@ -188,22 +253,126 @@ class FreeClimber(object):
             print('Requires a valid configuration file')
         else:
             self.print_new_video(video_file)
-            d = detector.detector(video_file = video_file, config_file = config_file, debug = self.args.debug)
-            d.step_1(gui = self.args.optimization_plots) # Crops and formats the video
-            d.step_2() # DataFrame creation and manipulation (df_big and df_filtered)
+            details = run_detector(video_file = video_file, config_file = config_file,
+                                   optimization_plots = self.args.optimization_plots,
+                                   debug = self.args.debug,
+                                   path_stages = self.path_stages(),
+                                   profile = self.args.profile,
+                                   path_profiles = self.path_profiles(),
+                                   defer_plots = self.renderer != None,
+                                   outputs = self.args.outputs)
+            self.render_plots(details, video_file = video_file) # Then reuses results for duplicate recordings
+            if self.index != None:
+                self.index.set_video(video_file, **details)
+            self.first_run = False
+        return
 
-            d.step_3(gui = self.args.optimization_plots) # Visualizes spot metrics
-            d.step_4()# Filters and processes data detected points
+    def watch(self):
+        '''Watches path_project for new videos and processes them with a pool of worker
+        processes as they arrive. Videos are submitted once they have finished writing: the
+        same size on two consecutive polls and not modified for --settle_time seconds.
+        results.csv is updated after each poll where videos finished. Runs until
+        interrupted (Ctrl+C).'''
+        if self.args.debug: print('FreeClimber.watch')
+        from concurrent.futures import ProcessPoolExecutor
+        from time import sleep
+
+        print("##\n## Watching for new videos in: %s \n##" % self.path_project)
+        print("## Polling every %s seconds with %s worker(s), press Ctrl+C to stop\n##" % (self.args.poll_interval, self.args.workers))
+        pool = ProcessPoolExecutor(max_workers = self.args.workers, initializer = ignore_interrupt)
+        sizes, running, finished, elsewhere = dict(), dict(), [], dict()
+
+        def collect():
+            '''Logs videos whose workers are done, returns how many finished'''
+            done = [video for video in running.keys() if running[video].done()]
+            for video in done:
+                future = running.pop(video)
+                finished.append(video)
+                if future.exception() == None:
+                    details = future.result()
+                    self.render_plots(details)
+                    if self.index != None: self.index.set_video(video, **details)
+                    self.log_video(completed=True, file_name = video)
+                else:
+                    print('!! Could not process %s: %s' % (video, future.exception()))
+                    self.log_video(completed=False, file_name = video)
+            return len(done)
 
-            d.step_5() # Calculates local linear regressions
-            d.step_6(gui = self.args.optimization_plots) # Creating diagnostic/other plots 
-            d.step_7() # Writing the video's slope file
-            self.first_run = False
+        try:
+            while True:
+                ## Submitting unprocessed videos once their size is stable
+                for video in self.file_walker(self.path_project, endswith=self.file_suffix, undone = True, quiet = True):
+                    if video in running or video in finished: continue
+                    ## Claims of other hosts are checked again once they could have gone stale (e.g. a crashed host)
+                    if time() - elsewhere.get(video, -float('inf')) <= self.args.stale_after: continue
+                    try: stat = os.stat(video)
+                    except OSError: continue
+                    stable = sizes.get(video) == stat.st_size and time() - stat.st_mtime >= self.args.settle_time
+                    sizes[video] = stat.st_size
+                    if stable and stat.st_size > 0:
+                        if self.queue != None and not self.queue.claim(video):
+                            elsewhere[video] = time() # Claimed or finished by another host
+                            continue
+                        self.count += 1
+                        print('== [%s] Submitting: %s' % (self.count, video))
+                        running[video] = pool.submit(run_detector, video, self.config_file,
+                                                     self.args.optimization_plots, self.args.debug,
+                                                     self.path_stages(), self.args.profile,
+                                                     self.path_profiles(), self.renderer != None,
+                                                     self.args.outputs)
+
+                ## Keeping results.csv current
+                if collect() > 0 and self.args.no_concat == False:
+                    self.concat_slopes()
+                sleep(self.args.poll_interval)
+
+        except KeyboardInterrupt:
+            print('\nStopping, waiting for %s running video(s) to finish' % len(running))
+        finally:
+            pool.shutdown(wait = True)
+            if collect() > 0 and self.args.no_concat == False:
+                self.concat_slopes()
+        self.file_list = finished
+        return
+
+    def render_plots(self, details, video_file = None):
+        '''Queues a processed video's deferred plots (details['plots']) with the render pool.
+        With a video_file, its duplicates are linked once its plots are rendered.'''
+        paths_plots = details.pop('plots', [])
+        for path_plots in paths_plots:
+            self.renderer.submit(path_plots)
+        if video_file != None: self.pending_links[video_file] = paths_plots
+        if self.renderer != None: self.renderer.collect()
+        self.link_rendered()
+        return
+
+    def link_rendered(self):
+        '''Links the results of processed videos to their duplicates (see link_duplicates)
+        once none of their plots are still rendering, so the plots are linked too'''
+        for video_file in list(self.pending_links.keys()):
+            if self.renderer != None and any([item in self.renderer.running for item in self.pending_links[video_file]]):
+                continue
+            self.pending_links.pop(video_file)
+            self.link_duplicates(video_file)
         return
 
+    def path_stages(self):
+        '''Path to the stage records (log/stages.jsonl) with --instrument, otherwise None'''
+        if not self.args.instrument: return None
+        import instrument
+        return os.path.join(self.path_project, instrument.records_name)
+
+    def path_profiles(self):
+        '''Folder for profiles (log/profiles/) with --profile, otherwise None'''
+        if self.args.profile == None: return None
+        import profiling
+        return os.path.join(self.path_project, profiling.profiles_name)
+
     def concat_slopes(self):
-        '''Concatenate the .slopes.csv files into a single results.csv file in path_project folder'''
+        '''Concatenate the .slopes.csv files into a single results.csv file in path_project
+        folder. Only new or reprocessed videos are read, see results.update_results'''
         if self.args.debug: print('FreeClimber.concat_slopes')        
+        import results
 
         ## Finds all files with the .slopes.csv suffix
         print("\nFinal step: Concatenating slope files")
@@ -211,14 +380,18 @@ class FreeClimber(object):
         to_concat = [slope_file for slope_file in slope_files]
         if self.args.debug: print(to_concat)
         
-        ## Concatenates contents of files into a single DataFrame
-        print("    - Concatenating",len(to_concat),"files")
-        self.slopes = concat([read_csv(item) for item in to_concat])
-        
-        ## Saves results.csv file to the path_project folder (specified in the configuration file)
+        ## Upserts the rows of changed videos into the results.csv file in the path_project 
+        ## folder (specified in the configuration file), rebuilding it if --full_concat
         self.path_result = self.path_project+'results.csv'
-        print("    - Saving:", self.path_result)
-        self.slopes.to_csv(self.path_result,index=False)
+        if self.queue != None and not self.queue.acquire('results'): # Only one host writes at a time
+            print('!! Did not update %s, another host is still writing it' % self.path_result)
+            return
+        try:
+            if self.args.full_concat: results.rebuild_results(self.path_result, to_concat, debug = self.args.debug)
+            else: results.update_results(self.path_result, to_concat, debug = self.args.debug)
+        finally:
+            if self.queue != None: self.queue.unlock('results')
+        print("    - Saved:", self.path_result)
         return
 
     def create_log_header(self):
@@ -231,6 +404,11 @@ class FreeClimber(object):
             pass
         self.path_completed = self.path_project + 'log/completed.log'
         self.path_skipped = self.path_project + 'log/skipped.log'
+        
+        ## Instances sharing a project in a distributed batch each keep their own log files
+        if self.queue != None:
+            self.path_completed = self.path_project + 'log/completed.%s.log' % self.queue.tag
+            self.path_skipped = self.path_project + 'log/skipped.%s.log' % self.queue.tag
         path_list,text_list = [self.path_completed,self.path_skipped],['completed','skipped']
         time_stamp = str(ctime())
                 
@@ -269,8 +447,8 @@ class FreeClimber(object):
         if self.args.debug: print('FreeClimber.log_video :: completed =',completed)
     
         ## Naming a variable
-        if completed: path = 'log/completed.log'
-        else:  path = 'log/skipped.log'
+        if completed: path = self.path_completed
+        else:  path = self.path_skipped
 
 ## For future release
 #         elif review != None: path = '/review_at_R_%s/review.log' % self.review_R
@@ -278,9 +456,18 @@ class FreeClimber(object):
         ## Appends the video_file path to the log file
         if ~completed:
             print('Appending to',path + ': ',file_name)
-        with open(self.path_project + '/' + path,'a') as f:
+        with open(path,'a') as f:
             print(file_name,file = f)
         f.close()
+
+        ## Recording the status in the project index
+        if self.index != None:
+            if completed: self.index.set_video(file_name, status = 'completed')
+            else: self.index.set_video(file_name, status = 'skipped')
+
+        ## Releasing the claim so other hosts in a distributed batch move on
+        if self.queue != None:
+            self.queue.release(file_name, completed = completed)
         return
         
     def print_closing(self):
@@ -308,12 +495,51 @@ def define_argument_parser():
     gather_files.py script can help generate one, or the log/skipped.log file will
     contain all paths that were passed over due to technical difficulties.
     
+    The '--watch' flag keeps the program running and processes unprocessed videos in 
+    path_project as they finish writing (see --poll_interval, --settle_time, and 
+    --workers), keeping results.csv current.
+    
     The '--no_concat' flag will prevent the final concatenation step, which is useful if
-    users want to analyze individual videos but not overwrite the results.csv file.
+    users want to analyze individual videos but not overwrite the results.csv file. By 
+    default, only the rows of new or reprocessed videos are updated in results.csv (see
+    results.py); the '--full_concat' flag rebuilds it from every .slopes.csv file.
+    
+    The '--index' flag keeps a SQLite index of path_project (log/index.sqlite) with the
+    videos, their metadata and processing status, and output files. Only folders that
+    changed since the last run are listed again.
+    
+    The '--distributed' flag lets several hosts that mount the same path_project share a
+    batch (see work_queue.py). Each video is claimed with a lock file in log/claims/ and
+    processed by a single host; claims not refreshed for --stale_after seconds (e.g. a
+    crashed host) are taken over. Videos finished in a batch are not processed again
+    under the same batch name, pass a new name to start over.
+    
+    The '--deduplicate' flag fingerprints the videos to process and groups copies of the
+    same recording saved in different containers. Only one video per group is processed,
+    and its results are linked to the others.
+    
+    The '--instrument' flag records the wall time, CPU time, peak memory, frames, and
+    spots of each detector step and sub-stage (decoding, background subtraction, spot
+    detection, regressions, plots, and file writes) as JSON lines in log/stages.jsonl.
+    Summarize them with instrument.py.
+    
+    The '--profile' flag saves a profile of each detector step and of each video in 
+    log/profiles/, with cProfile (default) or, with '--profile sample', by sampling the call
+    stack (lower overhead, wall-clock times). Merge them across a batch with profiling.py.
     
     The '--optimization_plots' flag will create the optimization plots generated by the 
     GUI. These include files with suffixes: ROI.png, spot_check.png, and processed.png.
     
+    The '--render_workers' flag renders plots in that many separate processes, so videos
+    are analyzed without waiting on matplotlib. Each video's plot inputs are saved in
+    <video>.plots.pkl.gz, from which plots.py can also render the plots again later.
+    
+    The '--outputs' flag chooses which files each video writes. 'full' (default) writes
+    the .raw.csv, .filtered.csv, .diagnostic.png, and .slopes.csv files and prints the
+    slopes; 'standard' leaves out the .raw.csv file; 'lean' only writes the .slopes.csv
+    file that results.csv is built from, skipping the regression on all vials that is
+    only drawn in the diagnostic plot.
+    
     ## For future release
     The '--review_R' flag and argument will create a list of files with vials that have
     a regression coefficient (R) value that is less than a predefined threshold 
@@ -354,6 +580,46 @@ def define_argument_parser():
                         default=False, 
                         type=str,
                         help="Process custom list of files, must include file path as argument")
+    group_method.add_argument('--watch', 
+                        default=False,
+                        action='store_true', 
+                        help="Keep running and process new videos as they are added to path_project")
+
+    ## Watch mode: polling and worker settings
+    parser.add_argument('--poll_interval', 
+                        required=False, 
+                        default=10, 
+                        type=float,
+                        help="Seconds between checks of path_project with --watch (default = 10)")
+    parser.add_argument('--settle_time', 
+                        required=False, 
+                        default=5, 
+                        type=float,
+                        help="Seconds a video must go unmodified before it is processed with --watch (default = 5)")
+    parser.add_argument('--workers', 
+                        required=False, 
+                        default=1, 
+                        type=int,
+                        help="Number of videos processed at the same time with --watch (default = 1)")
+
+    ## Distributed batches: sharing path_project between hosts
+    parser.add_argument('--distributed', 
+                        required=False, 
+                        default=None, 
+                        nargs='?',
+                        const='default',
+                        type=str,
+                        help="Share the batch with other hosts through lock files in path_project, optionally naming the batch")
+    parser.add_argument('--stale_after', 
+                        required=False, 
+                        default=300, 
+                        type=float,
+                        help="Seconds without a heartbeat before another host takes over a claimed video (default = 300)")
+    parser.add_argument('--heartbeat', 
+                        required=False, 
+                        default=30, 
+                        type=float,
+                        help="Seconds between heartbeats on claimed videos with --distributed (default = 30)")
 
     ## Batch processing: additional arguments
     parser.add_argument('--no_concat', 
@@ -362,6 +628,42 @@ def define_argument_parser():
                         action='store_true',
                         help="Use this flag to prevent results files from concatenating")
 
+    parser.add_argument('--full_concat', 
+                        required=False, 
+                        default=False, 
+                        action='store_true',
+                        help="Rebuilds results.csv from every .slopes.csv file instead of only updating changed videos")
+
+    ## Use the persistent project index instead of walking path_project
+    parser.add_argument('--index', 
+                        required=False, 
+                        default=False, 
+                        action='store_true',
+                        help="Finds videos and slope files with a persistent index (log/index.sqlite), only re-listing changed folders")
+
+    ## Process each recording once, even if it is saved in several containers
+    parser.add_argument('--deduplicate', 
+                        required=False, 
+                        default=False, 
+                        action='store_true',
+                        help="Fingerprints videos and processes copies of the same recording (e.g. .h264 and .mp4) only once")
+
+    ## Record time and memory used by each step
+    parser.add_argument('--instrument', 
+                        required=False, 
+                        default=False, 
+                        action='store_true',
+                        help="Records time and memory used by each detector step in log/stages.jsonl")
+
+    ## Profile each detector step
+    parser.add_argument('--profile', 
+                        required=False, 
+                        default=None, 
+                        nargs='?',
+                        const='cprofile',
+                        choices=['cprofile','sample'],
+                        help="Saves a profile of each step and video in log/profiles/, with cProfile or stack sampling ('sample')")
+
     ## Generate all possible plots
     parser.add_argument('--optimization_plots', 
                         required=False, 
@@ -369,6 +671,20 @@ def define_argument_parser():
                         action='store_true',
                         help="Creates the detector optimization plots with spot metrics for each video")
 
+    ## Render plots in separate processes
+    parser.add_argument('--render_workers', 
+                        required=False, 
+                        default=0, 
+                        type=int,
+                        help="Renders plots in this many separate processes, saving their inputs in <video>.plots.pkl.gz (default = 0, rendered inline)")
+
+    ## Files written for each video
+    parser.add_argument('--outputs', 
+                        required=False, 
+                        default='full', 
+                        choices=['full','standard','lean'],
+                        help="Files written for each video: 'full' (default), 'standard' without .raw.csv, or 'lean' with only .slopes.csv")
+
     ## For future release
     ## Specify regression coefficient for secondary review
 #     parser.add_argument('--review_R', 
@@ -393,6 +709,67 @@ def define_argument_parser():
     return args
 
 
+def run_detector(video_file, config_file, optimization_plots = False, debug = False, path_stages = None,
+                 profile = None, path_profiles = None, defer_plots = False, outputs = 'full'):
+    '''Executes the steps in the detector object for a single video. Kept outside the
+    FreeClimber object so it can run in a worker process.
+    ----
+    Inputs:
+      video_file (str): Path to video file
+      config_file (str): Path to configuration (.cfg) file
+      optimization_plots (bool): True creates the detector optimization plots
+      debug (bool): Prints each function as it runs
+      path_stages (str): Path to append stage timing and memory records to, None does not record
+      profile (str): Profiles each step with 'cprofile' or 'sample', None does not profile
+      path_profiles (str): Folder to save profiles in
+      defer_plots (bool): Saves the plots' inputs for plots.py to render instead of rendering them
+      outputs (str): Output profile, 'full', 'standard', or 'lean' (see detector.output_profiles)
+    ----
+    Returns:
+      details (dict): Video metadata read while decoding, and with defer_plots, 'plots'
+                      listing the plot inputs files'''
+    import instrument
+    import profiling
+    recorder = instrument.recorder(path = path_stages, video = video_file)
+    profiler = profiling.profiler(path_folder = path_profiles if profile != None else None, mode = profile)
+    with recorder.stage('video') as record:
+        d = detector.detector(video_file = video_file, config_file = config_file, debug = debug,
+                              recorder = recorder, profiler = profiler, outputs = outputs)
+        d.defer_plots = defer_plots
+
+        ## Each region of interest is processed from the same decoded video
+        detectors = d.split_rois()
+        spots = 0
+        for item in detectors:
+            if item.roi == None: stage = contextlib.nullcontext()
+            else: stage = recorder.stage('roi_' + item.roi['label'])
+            with stage:
+                item.step_1(gui = optimization_plots) # Crops and formats the video
+                item.step_2() # DataFrame creation and manipulation (df_big and df_filtered)
+
+                item.step_3(gui = optimization_plots) # Visualizes spot metrics
+                item.step_4()# Filters and processes data detected points
+
+                item.step_5() # Calculates local linear regressions
+                item.step_6(gui = optimization_plots) # Creating diagnostic/other plots 
+                item.step_7() # Writing the video's slope file
+            spots += int(item.df_filtered.shape[0])
+            item.profiler.merge()
+            item.clean_stack, item.spot_stack = None, None # Frees the region's image stacks
+        if d.rois != None:
+            d.merge_roi_slopes(detectors)
+            d.profiler.merge() # Decoding, shared by the regions
+        record.update({'frames':d.n_frames, 'spots':spots})
+    details = {'width':d.width, 'height':d.height, 'n_frames':d.n_frames, 'frame_rate':d.frame_rate}
+    if defer_plots: details['plots'] = [item.path_plots for item in detectors if item.path_plots != None]
+    return details
+
+def ignore_interrupt():
+    '''Worker processes ignore Ctrl+C so running videos finish when the main process stops'''
+    import signal
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    return
+
 ## Checking argparse arguments
 def check_config(args):
     '''Checks arguments passed to parser and kills program if invalid path.
@@ -454,7 +831,20 @@ def main():
     fc = FreeClimber(config_file = config_file)
     fc.create_log_header()
 
+    ## Watch mode processes videos as they are added, until interrupted
+    if args.watch:
+        fc.watch()
+        if fc.renderer != None: fc.renderer.close() # Waiting for queued plots
+        fc.print_closing()
+        if fc.queue != None: fc.queue.close()
+        return
+
     for File in fc.file_list:
+        ## Skip videos claimed or finished by another host
+        if fc.queue != None and not fc.queue.claim(File):
+            print('----> Claimed by another host, skipping: %s' % File)
+            continue
+
         if args.debug:
             print(File)
             if 1==1:
@@ -478,11 +868,17 @@ def main():
             except:
                 fc.log_video(completed=False, file_name = File)    
 
+    ## Waiting for queued plots, duplicates of the last videos are linked once they are rendered
+    if fc.renderer != None:
+        fc.renderer.close()
+        fc.link_rendered()
+
     ## Concatenate slopes of all .slopes.csv files into a single, results.csv file
     if args.no_concat == False:
         fc.concat_slopes()
         
     fc.print_closing()
+    if fc.queue != None: fc.queue.close()
     return
         
 if __name__ == '__main__':
@@ -0,0 +1,185 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+## File name : api.py
+## Created by: Adam N. Spierer
+## Date      : October 2026
+## Purpose   : Runs the FreeClimber pipeline on frames already in memory (e.g. from
+##              acquisition software or a parameter sweep), without reading or writing files
+
+import io
+import contextlib
+
+import detector
+
+## Variables a configuration file needs for the detector, beyond those set in the GUI
+required = ['x','y','w','h','check_frame','blank_0','blank_n','crop_0','crop_n','threshold',
+            'diameter','minmass','maxsize','ecc_low','ecc_high','vials','window','pixel_to_cm',
+            'frame_rate','vial_id_vars','outlier_TB','outlier_LR','naming_convention',
+            'trim_outliers','convert_to_cm_sec']
+
+def read_config(config_file):
+    '''Reads a configuration file into a dictionary of parameters, the same way the
+    detector does
+    ----
+    Inputs:
+      config_file (str): Path to configuration (.cfg) file
+    ----
+    Returns:
+      parameters (dict): Variable names and values'''
+    with open(config_file,'r') as f:
+        variables = f.readlines()
+    f.close()
+    variables = [item.rstrip() for item in variables if not item.startswith(('#','\s','\t','\n'))]
+
+    parameters = dict()
+    for item in variables:
+        try: exec(item, dict(), parameters)
+        except: print('api.read_config: !! Could not import ( %s )' % item)
+    return parameters
+
+class array_detector(detector.detector):
+    '''Detector working on a stack of frames in memory. Parameters are passed as a
+    dictionary (e.g. from read_config) instead of a configuration file, and nothing is
+    written to disk: the steps keep their results on the object (df_big, df_filtered,
+    df_slopes) and the diagnostic plot is skipped.
+    '''
+    def __init__(self, frames, parameters, name = 'video', debug = False, recorder = None, profiler = None):
+        '''Initializing detector object
+        ----
+        Inputs:
+          frames (nd-array or iterable): Frames as (frames, height, width, 3) RGB or
+                                         (frames, height, width) grayscale, or an iterable of frames
+          parameters (dict): Detector variables, as in a configuration file
+          name (str): Name of the video, parsed with naming_convention for vial IDs and
+                      experimental details
+          debug (bool): Prints out each function as it runs.
+          recorder (instrument.recorder): Records time and memory used by each step, None does not record
+          profiler (profiling.profiler): Saves a profile of each step, None does not profile
+        ----
+        Returns:
+          None -- variables are saved to the detector object'''
+        self.debug = debug
+        if self.debug: print('array_detector.__init__')
+        if recorder == None: recorder = detector.instrument.recorder()
+        if profiler == None: profiler = detector.profiling.profiler()
+        self.recorder, self.profiler = recorder, profiler
+
+        ## Load variables
+        missing = [item for item in required if item not in parameters]
+        if len(missing) > 0:
+            raise ValueError('Missing parameters: %s' % ', '.join(missing))
+        self.config_file, self.video_file, self.path_project = None, None, None
+        self.__dict__.update(parameters)
+        self.check_variable_formats()
+
+        ## Setting a color map
+        self.vial_color_map = detector.cm.jet
+
+        ## Results are all kept in memory, with every column (as for the 'full' profile), and
+        ##    returned rather than printed as a slopes table
+        self.outputs = [item for item in detector.output_profiles['full'] if item != 'table']
+
+        ## Create a conversion factor
+        if self.convert_to_cm_sec: self.conversion_factor = self.pixel_to_cm / self.frame_rate
+        else: self.conversion_factor = 1
+
+        self.name = name
+        self.specify_paths_details(name)
+        self.proxy, self.roi_stack = False, None # Every frame is already in memory
+        if self.profiler.name == None: self.profiler.name = name
+        with self.recorder.stage('decode') as record, self.profiler.profile('decode'):
+            if isinstance(frames, detector.np.ndarray): self.image_stack = frames
+            else: self.image_stack = detector.np.stack(list(frames))
+            record['frames'] = len(self.image_stack)
+        self.n_frames, self.height, self.width = self.image_stack.shape[:3]
+        return
+
+    def specify_paths_details(self, name):
+        '''Parses experimental details from the name, without any output paths
+        ----
+        Inputs:
+          name (str): Name of the video
+        ----
+        Returns:
+          None -- Passes parsed variables back to detector object'''
+        if self.debug: print('array_detector.specify_paths_details')
+        self.name_nosuffix = None
+        self.path_data, self.path_filtered, self.path_diagnostic, self.path_slope = None, None, None, None
+
+        ## Extracting file details and naming individual vials
+        self.file_details = dict(zip(self.naming_convention.split('_'),self.name.split('_')))
+        self.experiment_details = self.name.split('_')
+        self.vial_ID = self.experiment_details[:self.vial_id_vars]
+
+        ## Creating a list of colors for plotting
+        self.color_list = [self.vial_color_map(i) for i in detector.np.linspace(0,1,self.vials)]
+        return
+
+    def crop_and_grayscale(self, video_array, x = 0, x_max = None, y = 0, y_max = None,
+                           first_frame = None, last_frame = None, grayscale = True):
+        '''Crops the frames to the region of interest, converting RGB frames to grayscale
+        (see detector.crop_and_grayscale). Grayscale frames are only cropped.'''
+        if video_array.ndim == 4:
+            return detector.detector.crop_and_grayscale(self, video_array, x = x, x_max = x_max, y = y, y_max = y_max,
+                                                        first_frame = first_frame, last_frame = last_frame, grayscale = grayscale)
+        if self.debug: print('array_detector.crop_and_grayscale')
+        if first_frame == None: first_frame = self.crop_0
+        if last_frame == None: last_frame = self.crop_n
+        return video_array[first_frame:last_frame, y : y_max, x : x_max].astype(float)
+
+    def run_steps(self, steps):
+        '''Runs detector steps in order. The detector exits the program when a video has no
+        spots, which would also stop software embedding it, so that is raised as a RuntimeError.
+        ----
+        Inputs:
+          steps (list): Bound step methods, e.g. [self.step_1, self.step_2]
+        ----
+        Returns:
+          None'''
+        for step in steps:
+            try: step()
+            except SystemExit:
+                raise RuntimeError('FreeClimber stopped at %s of %s: no spots detected, or none left after filtering. '
+                                   'Check the detection and filter parameters' % (step.__name__, self.name)) from None
+        return
+
+    def run(self):
+        '''Runs the detector steps, without plots or files
+        ----
+        Inputs:
+          None
+        ----
+        Returns:
+          results (dict): See api.run()'''
+        self.run_steps([self.step_1, self.step_2, self.step_4, self.step_5, self.step_6, self.step_7])
+        return {'spots':self.df_big, 'filtered':self.df_filtered, 'regressions':self.result,
+                'slopes':self.df_slopes, 'background':self.background}
+
+def run(frames, parameters, name = 'video', quiet = True, **kwargs):
+    '''Runs FreeClimber on frames in memory
+    ----
+    Inputs:
+      frames (nd-array or iterable): Frames as (frames, height, width, 3) RGB or
+                                     (frames, height, width) grayscale, or an iterable of frames
+      parameters (dict or str): Detector variables, or the path to a configuration file
+      name (str): Name of the video, parsed with naming_convention for vial IDs and
+                  experimental details
+      quiet (bool): True silences the progress messages of each step
+      **kwargs: Passed to array_detector (debug, recorder, profiler)
+    ----
+    Returns:
+      results (dict): 'spots' (DataFrame, every spot with its filter and vial),
+                      'filtered' (DataFrame, spots used for the regressions),
+                      'regressions' (dict, best local linear regression by vial, the last key is all vials),
+                      'slopes' (DataFrame, as in the slopes file),
+                      'background' (nd-array, null background image)
+    Raises RuntimeError if no spots are found.'''
+    if isinstance(parameters, str): parameters = read_config(parameters)
+    if quiet: return quietly(lambda: array_detector(frames, parameters, name = name, **kwargs).run())
+    return array_detector(frames, parameters, name = name, **kwargs).run()
+
+def quietly(function, *args, **kwargs):
+    '''Calls a function without printing its output'''
+    with contextlib.redirect_stdout(io.StringIO()):
+        return function(*args, **kwargs)
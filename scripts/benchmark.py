@@ -0,0 +1,361 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+## File name : benchmark.py
+## Created by: Adam N. Spierer
+## Date      : October 2026
+## Purpose   : Reproducible performance benchmark of the detector on synthetic climbing
+##              videos with a known velocity, across frames, pixels, flies, and vials
+
+import io
+import os
+import sys
+import hashlib
+import argparse
+import contextlib
+import subprocess
+from time import perf_counter
+
+import numpy as np
+
+## Default synthetic video
+defaults = {'vials':3,          # Number of vials, evenly spaced across the frame
+            'flies':10,         # Flies per vial
+            'width':640,        # Frame width (pixels), must be even
+            'height':480,       # Frame height (pixels), must be even
+            'frames':150,       # Video length (frames)
+            'frame_rate':30,    # Frames per second
+            'diameter':7,       # Fly diameter (pixels)
+            'velocity':2.,      # Climbing velocity of the fastest vial (pixels/frame, upward)
+            'spread':0.5,       # Slowest vial climbs at velocity * (1 - spread)
+            'noise':4.,         # Standard deviation of pixel noise
+            'gradient':40.,     # Brightness difference across the background (left to right)
+            'seed':0}           # Random seed
+
+## Values tested for each scaling axis
+axes = {'frames':[75,150,300],
+        'pixels':['320x240','640x480','1280x960'],
+        'flies':[5,10,20],
+        'vials':[1,3,6]}
+
+## Steps timed for each video, decoding happens when the detector is created
+steps = ['decode','step_1','step_2','step_3','step_4','step_5','step_6','step_7']
+
+## Seconds allowed for short invocations (help, version, nothing left to process)
+startup_budget = 0.5
+
+## Dependencies that should not be imported before they are needed
+heavy_modules = ['numpy','pandas','trackpy','scipy','matplotlib','ffmpeg']
+
+def vial_velocities(vials, velocity, spread):
+    '''Ground-truth climbing velocity of each vial (pixels/frame), slowest to fastest'''
+    if vials == 1: return [velocity]
+    return [float(item) for item in np.linspace(velocity * (1 - spread), velocity, vials)]
+
+def synthetic_video(path, vials = 3, flies = 10, width = 640, height = 480, frames = 150,
+                    frame_rate = 30, diameter = 7, velocity = 2., spread = 0.5, noise = 4.,
+                    gradient = 40., seed = 0, crf = 17):
+    '''Renders a climbing assay: dark flies on a light background with a brightness
+    gradient and pixel noise. Flies start near the bottom of their vial and climb at their
+    vial's velocity until they reach the top, so the mean height of each vial rises
+    linearly at a known slope.
+    ----
+    Inputs:
+      path (str): Path to save the video (.mp4 or .h264)
+      vials, flies, width, ... (see 'defaults')
+      crf (int): libx264 quality, lower is closer to lossless
+    ----
+    Returns:
+      truth (list): Ground-truth velocity of each vial (pixels/frame, upward)'''
+    import ffmpeg
+    rng = np.random.RandomState(seed)
+    truth = vial_velocities(vials, velocity, spread)
+
+    ## Flies are spread over the middle of each vial's column, starting near the bottom
+    column = width / vials
+    x0 = np.concatenate([(v + rng.uniform(0.25, 0.75, flies)) * column for v in range(vials)])
+    y0 = rng.uniform(0.8, 0.95, vials * flies) * height
+    v0 = np.repeat(truth, flies)
+    top = 0.05 * height
+
+    ## Background with a left-to-right gradient
+    background = 200 + gradient * (np.arange(width) / width - 0.5)
+    background = np.tile(background, (height, 1))
+
+    ## Fly template, a dark Gaussian spot
+    radius = diameter
+    grid = np.arange(-radius, radius + 1)
+    spot = 120 * np.exp(-(grid[:,None] ** 2 + grid[None,:] ** 2) / (2 * (diameter / 4.) ** 2))
+
+    process = (ffmpeg
+               .input('pipe:', format='rawvideo', pix_fmt='gray', s='%sx%s' % (width, height), framerate=frame_rate)
+               .output(path, vcodec='libx264', pix_fmt='yuv420p', crf=crf, loglevel='error')
+               .overwrite_output()
+               .run_async(pipe_stdin=True))
+    for frame in range(frames):
+        image = background + rng.normal(0, noise, (height, width))
+        y = np.maximum(y0 - v0 * frame, top)
+        for xi,yi in zip(np.round(x0).astype(int), np.round(y).astype(int)):
+            y_lo, y_hi = max(yi - radius, 0), min(yi + radius + 1, height)
+            x_lo, x_hi = max(xi - radius, 0), min(xi + radius + 1, width)
+            image[y_lo:y_hi, x_lo:x_hi] -= spot[y_lo - yi + radius:y_hi - yi + radius,
+                                                x_lo - xi + radius:x_hi - xi + radius]
+        process.stdin.write(np.clip(image, 0, 255).astype(np.uint8).tobytes())
+    process.stdin.close()
+    process.wait()
+    return truth
+
+def write_config(path, video_file, params):
+    '''Writes a configuration file for a synthetic video
+    ----
+    Inputs:
+      path (str): Path to save the configuration (.cfg) file
+      video_file (str): Path to the synthetic video
+      params (dict): Synthetic video parameters (see 'defaults')
+    ----
+    Returns:
+      None'''
+    frames = params['frames']
+    lines = ['x=0', 'y=0', 'w=%s' % params['width'], 'h=%s' % params['height'],
+             'check_frame=0', 'blank_0=0', 'blank_n=%s' % frames,
+             'crop_0=0', 'crop_n=%s' % frames,
+             'threshold="auto"', 'diameter=%s' % params['diameter'],
+             'minmass=100', 'maxsize=%s' % (params['diameter'] + 4),
+             'ecc_low=0', 'ecc_high=.6', 'vials=%s' % params['vials'],
+             'window=%s' % int(min(50, 0.4 * frames)),
+             'pixel_to_cm=1', 'frame_rate=%s' % params['frame_rate'],
+             'vial_id_vars=2', 'outlier_TB=1', 'outlier_LR=3',
+             'naming_convention="source_scenario_seed"',
+             'path_project="%s"' % (os.path.dirname(video_file) + os.sep),
+             'file_suffix="%s"' % video_file.split('.')[-1],
+             'convert_to_cm_sec=False', 'trim_outliers=False']
+    with open(path,'w') as f:
+        print('## FreeClimber ##\n## Synthetic benchmark video\n##', file = f)
+        for line in lines: print(line, file = f)
+    f.close()
+    return
+
+def generate(work_dir, **params):
+    '''Creates (or reuses) a synthetic video and its configuration file
+    ----
+    Inputs:
+      work_dir (str): Folder for synthetic videos
+      **params: Synthetic video parameters, missing ones are taken from 'defaults'
+    ----
+    Returns:
+      video_file (str): Path to the video
+      config_file (str): Path to the configuration file
+      truth (list): Ground-truth velocity of each vial (pixels/frame)'''
+    _params = dict(defaults)
+    _params.update(params)
+    key = hashlib.sha1(repr(sorted(_params.items())).encode()).hexdigest()[:10]
+    if not os.path.isdir(work_dir): os.makedirs(work_dir)
+    video_file = os.path.join(work_dir, 'synthetic_%s_%s.mp4' % (key, _params['seed']))
+    config_file = video_file[:-4] + '.cfg'
+    if os.path.isfile(video_file) and os.path.isfile(config_file):
+        truth = vial_velocities(_params['vials'], _params['velocity'], _params['spread'])
+    else:
+        truth = synthetic_video(video_file, **_params)
+        write_config(config_file, video_file, _params)
+    return video_file, config_file, truth
+
+def run_scenario(video_file, config_file, truth, repeat = 1, verbose = False):
+    '''Times each step of the detector on one video and compares slopes to ground truth
+    ----
+    Inputs:
+      video_file (str): Path to the video
+      config_file (str): Path to the configuration file
+      truth (list): Ground-truth velocity of each vial
+      repeat (int): Number of runs, the fastest time of each step is kept
+      verbose (bool): True prints the detector's output
+    ----
+    Returns:
+      timings (dict): Seconds by step, plus 'pipeline'
+      slopes (list): Measured slope of each vial'''
+    import detector
+    timings = dict()
+    for i in range(repeat):
+        output = sys.stdout if verbose else io.StringIO()
+        with contextlib.redirect_stdout(output):
+            t0 = perf_counter()
+            d = detector.detector(video_file = video_file, config_file = config_file)
+            _timings = {'decode':perf_counter() - t0}
+            for step in steps[1:]:
+                t = perf_counter()
+                getattr(d, step)()
+                _timings[step] = perf_counter() - t
+            _timings['pipeline'] = perf_counter() - t0
+        for step in _timings.keys():
+            timings[step] = min(timings.get(step, np.inf), _timings[step])
+
+    ## Slopes by vial, dropping the 'all' row
+    df = d.df_slopes[~d.df_slopes.vial_ID.str.endswith('_all')]
+    slopes = df.slope.tolist()
+    return timings, slopes
+
+def startup_times(work_dir, runs = 5):
+    '''Times short invocations of the command line scripts in fresh interpreters
+    ----
+    Inputs:
+      work_dir (str): Folder for a small project where every video is already processed
+      runs (int): Runs per command, the fastest is kept
+    ----
+    Returns:
+      times (list): (command, seconds) for each command'''
+    scripts = os.path.dirname(os.path.abspath(__file__))
+    main, gather = os.path.join(scripts, 'FreeClimber_main.py'), os.path.join(scripts, 'gather_files.py')
+
+    ## A project with nothing left to process
+    video_file, config_file, truth = generate(os.path.join(work_dir, 'startup'), frames = 10, width = 64, height = 48, vials = 1, flies = 1)
+    open(video_file[:-4] + '.slopes.csv','a').close()
+
+    commands = [('import detector', ['-c', 'import sys; sys.path.insert(0, %r); import detector' % scripts]),
+                ('FreeClimber_main.py --version', [main, '--version']),
+                ('FreeClimber_main.py --help', [main, '--help']),
+                ('FreeClimber_main.py --process_undone (all done)', [main, '--config_file', config_file, '--process_undone', '--no_concat']),
+                ('gather_files.py --help', [gather, '--help'])]
+    times = []
+    for name, command in commands:
+        fastest = np.inf
+        for i in range(runs):
+            t = perf_counter()
+            subprocess.run([sys.executable] + command, stdout = subprocess.DEVNULL, stderr = subprocess.DEVNULL)
+            fastest = min(fastest, perf_counter() - t)
+        times.append((name, fastest))
+    return times
+
+def loaded_heavy_modules():
+    '''Heavy dependencies loaded by importing the detector and command line modules'''
+    scripts = os.path.dirname(os.path.abspath(__file__))
+    code = ('import sys; sys.path.insert(0, %r); import detector, FreeClimber_main, gather_files; '
+            'print(" ".join([item for item in %r if item in sys.modules]))' % (scripts, heavy_modules))
+    output = subprocess.run([sys.executable, '-c', code], stdout = subprocess.PIPE, universal_newlines = True).stdout
+    return output.split()
+
+def scenarios(axis = None, values = None, **base):
+    '''Parameters for each scenario along scaling axes
+    ----
+    Inputs:
+      axis (str): 'frames', 'pixels', 'flies', 'vials', or None for all axes
+      values (list): Values to test along the axis, default from 'axes'
+      **base: Parameters of the base scenario
+    ----
+    Returns:
+      _list (list): (axis, value, parameters) for each scenario'''
+    _list = []
+    for _axis in ([axis] if axis != None else list(axes.keys())):
+        for value in (values if values != None else axes[_axis]):
+            params = dict(base)
+            if _axis == 'pixels':
+                params['width'], params['height'] = [int(item) for item in str(value).split('x')]
+            else:
+                params[_axis] = int(value)
+            _list.append((_axis, value, params))
+    return _list
+
+def define_argument_parser():
+    '''Defines arguments to be parsed, via argparse module.
+    ----
+    Inputs:
+      None
+    ----
+    Returns:
+      args (object): Namespace object containing the flags and arguments passed to program
+    '''
+    parser = argparse.ArgumentParser(prog='FreeClimber',
+                                    description='benchmark.py - Times the detector on synthetic climbing videos with a known velocity',
+                                    epilog='For documentation and a tutorial, see https://github.com/adamspierer/FreeClimber',
+                                    allow_abbrev=False)
+    parser.add_argument('--axis',
+                        type=str,
+                        default=None,
+                        choices=list(axes.keys()),
+                        help="Scaling axis to test (default = all)")
+    parser.add_argument('--values',
+                        nargs='+',
+                        default=None,
+                        help="Values along the axis, e.g. '--axis pixels --values 320x240 640x480'")
+    for key in defaults.keys():
+        parser.add_argument('--' + key,
+                            type=type(defaults[key]),
+                            default=defaults[key],
+                            help="Base scenario %s (default = %s)" % (key, defaults[key]))
+    parser.add_argument('--repeat',
+                        type=int,
+                        default=1,
+                        help="Runs per scenario, the fastest time of each step is kept (default = 1)")
+    parser.add_argument('--work_dir',
+                        type=str,
+                        default='./benchmark',
+                        help="Folder for synthetic videos and outputs (default = ./benchmark)")
+    parser.add_argument('--save_file',
+                        type=str,
+                        default=None,
+                        help="Saves the timings as a .csv file")
+    parser.add_argument('--startup',
+                        default=False,
+                        action='store_true',
+                        help="Times short invocations (--help, --version, nothing to process) against the startup budget (%s s)" % startup_budget)
+    parser.add_argument('--generate_only',
+                        default=False,
+                        action='store_true',
+                        help="Only creates the synthetic video and configuration file of the base scenario")
+    parser.add_argument('--verbose',
+                        default=False,
+                        action='store_true',
+                        help="Prints the detector's output")
+    args = parser.parse_args()
+    return args
+
+def main():
+    '''Runs the benchmark and prints time per step, throughput, and slope error'''
+    args = define_argument_parser()
+    base = dict([(key, getattr(args, key)) for key in defaults.keys()])
+
+    if args.startup:
+        times = startup_times(args.work_dir, runs = max(args.repeat, 3))
+        for name, seconds in times:
+            print('%-50s %6.3f s  %s' % (name, seconds, 'ok' if seconds <= startup_budget else 'OVER BUDGET'))
+        loaded = loaded_heavy_modules()
+        print('Heavy modules loaded at import: %s' % (' '.join(loaded) if loaded else 'none'))
+        if any([seconds > startup_budget for name, seconds in times]) or loaded: raise SystemExit(1)
+        return
+
+    if args.generate_only:
+        video_file, config_file, truth = generate(args.work_dir, **base)
+        print('Video :', video_file)
+        print('Config:', config_file)
+        print('Truth :', [round(item,4) for item in truth])
+        return
+
+    rows = []
+    print('%-8s %-10s %9s %9s %9s %9s %9s %9s %10s %10s' % ('axis','value','decode','step_1','step_2','step_6',
+                                                              'pipeline','frames/s','slope_err','max_rel'))
+    for axis, value, params in scenarios(args.axis, args.values, **base):
+        video_file, config_file, truth = generate(args.work_dir, **params)
+        timings, slopes = run_scenario(video_file, config_file, truth, repeat = args.repeat, verbose = args.verbose)
+
+        ## Comparing slopes to ground truth
+        if len(slopes) == len(truth):
+            errors = np.abs(np.array(slopes) - np.array(truth))
+            slope_err, max_rel = errors.mean(), (errors / np.array(truth)).max()
+        else:
+            print('!! %s of %s vials were detected' % (len(slopes), len(truth)))
+            slope_err, max_rel = np.nan, np.nan
+
+        print('%-8s %-10s %9.2f %9.2f %9.2f %9.2f %9.2f %9.1f %10.4f %10.3f' % (
+              axis, value, timings['decode'], timings['step_1'], timings['step_2'], timings['step_6'],
+              timings['pipeline'], params['frames'] / timings['pipeline'], slope_err, max_rel))
+        for step in steps + ['pipeline']:
+            rows.append(dict(axis = axis, value = value, step = step, seconds = round(timings[step],4),
+                             frames_per_s = round(params['frames'] / timings[step],1) if timings[step] > 0 else np.nan,
+                             slope_err = round(slope_err,5), max_rel_err = round(max_rel,5), **params))
+
+    if args.save_file != None:
+        import pandas as pd
+        pd.DataFrame(rows).to_csv(args.save_file, index=False)
+        print('Saved:', args.save_file)
+    return
+
+if __name__ == '__main__':
+    main()
@@ -11,22 +11,249 @@ publication = False
 
 import os
 import sys
+import copy
 import time
-import ffmpeg
-
-import numpy as np
-import pandas as pd
-import trackpy as tp
+import gzip
+import pickle
+import collections
+import importlib
 import subprocess as sp
-from scipy.stats import linregress
-from scipy.signal import find_peaks,peak_prominences
 
-import matplotlib.pyplot as plt
-import matplotlib.cm as cm
-from matplotlib.lines import Line2D
+import instrument
+import profiling
+
+class lazy_import(object):
+    '''Stands in for a module and imports it the first time one of its attributes is used.
+    Importing detector is then fast (e.g. for --help, --version, an all-done batch, or a new
+    worker process), and each dependency is only loaded by the step that needs it.
+    '''
+    def __init__(self, name, setup = None):
+        '''Inputs:
+          name (str): Module name, e.g. 'matplotlib.pyplot'
+          setup (function): Called with the module once it is imported'''
+        self.__dict__.update(_name = name, _setup = setup, _module = None)
+
+    def _load(self):
+        if self._module is None:
+            module = importlib.import_module(self._name)
+            if self._setup is not None: self._setup(module)
+            self.__dict__['_module'] = module
+        return self._module
+
+    def __getattr__(self, attribute):
+        return getattr(self._load(), attribute)
+
+    def __setattr__(self, attribute, value):
+        setattr(self._load(), attribute, value)
+
+def pandas_options(module):
+    '''Issue with 'SettingWithCopyWarning' in step_3'''
+    module.options.mode.chained_assignment = None  # default='warn'
+
+## Heavy dependencies, imported at the point of use
+ffmpeg = lazy_import('ffmpeg')
+np = lazy_import('numpy')
+pd = lazy_import('pandas', setup = pandas_options)
+tp = lazy_import('trackpy')
+scipy_stats = lazy_import('scipy.stats')
+scipy_signal = lazy_import('scipy.signal')
+plt = lazy_import('matplotlib.pyplot')
+cm = lazy_import('matplotlib.cm')
+mlines = lazy_import('matplotlib.lines')
+mimage = lazy_import('matplotlib.image')
+
+## Artifacts written by each output profile: 'data' (.raw.csv), 'filtered' (.filtered.csv),
+##   'diagnostic' (.diagnostic.png), 'slope' (.slopes.csv), and 'table' (slopes printed)
+output_profiles = {'full':['data','filtered','diagnostic','slope','table'],
+                   'standard':['filtered','diagnostic','slope','table'],
+                   'lean':['slope']}
+
+class frame_reader(object):
+    '''Decodes single frames of a video on demand (e.g. for the GUI frame slider), without
+    loading the whole video. Frames are decoded in small blocks, the most recently used of
+    which are cached. A seek index of the keyframes, read from the packets without decoding,
+    lets raw video streams (e.g. .h264) start decoding at the keyframe before a block, by
+    byte offset. Other containers are decoded from the start, only keeping the block.
+    '''
+    def __init__(self, file, width, height, crop = None, block = 8, blocks = 4):
+        '''Inputs:
+          file (str): Path to video file
+          width, height (int): Frame dimensions of the video
+          crop (tuple): (x, x_max, y, y_max) region to decode, None decodes whole frames
+          block (int): Frames decoded at a time
+          blocks (int): Blocks kept in the cache'''
+        self.file, self.block, self.blocks = file, block, blocks
+        if crop == None: crop = (0, width, 0, height)
+        x, x_max, y, y_max = crop
+        self.crop = max(int(x), 0), min(int(x_max), width), max(int(y), 0), min(int(y_max), height)
+        self.cache = collections.OrderedDict()
+        self.keyframes, self.offsets = None, None
+
+    def index(self):
+        '''Reads the keyframes of the video, and their byte offsets if it is a raw stream
+        (packets covering the whole file), from a demuxing pass (ffmpeg framecrc)'''
+        out,err = (ffmpeg
+                   .input(self.file)
+                   .output('pipe:', format='framecrc', map='0:v', c='copy', loglevel='panic')
+                   .run(capture_stdout=True))
+        packets = [line.split(',') for line in out.decode().splitlines() if not line.startswith('#')]
+        sizes = np.array([int(item[4]) for item in packets])
+        flags = [[field.strip()[2:] for field in item[6:] if field.strip().startswith('F=')] for item in packets]
+        key = np.array([len(item) == 0 or int(item[0],16) & 1 for item in flags], dtype=bool) # Flags are only listed if not just a keyframe
+        offsets = np.concatenate([[0], np.cumsum(sizes)[:-1]])
+        self.keyframes = np.nonzero(key)[0]
+        if sizes.sum() == os.path.getsize(self.file): self.offsets = offsets[self.keyframes]
+        else: self.keyframes, self.offsets = np.array([0]), None
+        return
 
-## Issue with 'SettingWithCopyWarning' in step_3
-pd.options.mode.chained_assignment = None  # default='warn'
+    def cached(self, frame):
+        '''True if the frame is already decoded'''
+        return frame // self.block in self.cache
+
+    def decode(self, first, last):
+        '''Decodes frames first to last (not included) of the region as RGB
+        ----
+        Inputs:
+          first (int): First frame
+          last (int): First frame to leave out
+        ----
+        Returns:
+          frames (nd-array): Decoded frames, fewer at the end of the video'''
+        if self.keyframes is None: self.index()
+        start, kwargs = 0, dict()
+        if self.offsets is not None:
+            i = np.searchsorted(self.keyframes, first, side='right') - 1
+            start, kwargs = int(self.keyframes[i]), {'skip_initial_bytes':int(self.offsets[i])}
+        x, x_max, y, y_max = self.crop
+        out,err = (ffmpeg
+                   .input(self.file, **kwargs)
+                   .filter('select','between(n,%i,%i)' % (first - start, last - start - 1))
+                   .filter('format','rgb24')
+                   .filter('crop', x_max - x, y_max - y, x, y)
+                   .output('pipe:', format='rawvideo', pix_fmt='rgb24', vsync=0, vframes=last - first, loglevel='panic')
+                   .run(capture_stdout=True))
+        return np.frombuffer(out, np.uint8).reshape([-1, y_max - y, x_max - x, 3])
+
+    def __getitem__(self, frame):
+        '''Returns a frame (nd-array), None past the end of the video'''
+        block = frame // self.block
+        if block in self.cache:
+            self.cache.move_to_end(block)
+        else:
+            self.cache[block] = self.decode(block * self.block, (block + 1) * self.block)
+            if len(self.cache) > self.blocks: self.cache.popitem(last = False)
+        frames = self.cache[block]
+        if frame % self.block >= len(frames): return None
+        return frames[frame % self.block]
+
+def scaled_image(ax, render, placeholder):
+    '''Adds an image to axes that is rendered when the axes are drawn, once the size of a
+    point in pixels of the image is known (i.e. after tight_layout), e.g. for markers sized
+    in points
+    ----
+    Inputs:
+      ax (object): matplotlib axes, with data coordinates in pixels of the image
+      render (function): RGB(A) image for a scale, in pixels of the image per point
+      placeholder (array): Image shown until the axes are drawn, with the image's shape
+    ----
+    Returns:
+      image (object): matplotlib image'''
+    class image_at_scale(mimage.AxesImage):
+        def draw(self, renderer, *args, **kwargs):
+            (x0, _), (x1, _) = self.axes.transData.transform([(0, 0), (1, 0)])
+            scale = round(renderer.points_to_pixels(1) / abs(x1 - x0), 3)
+            self.set_data(render(scale))
+            return super().draw(renderer, *args, **kwargs)
+
+    h, w = placeholder.shape[:2]
+    image = image_at_scale(ax, origin = 'upper', extent = (-.5, w - .5, h - .5, -.5))
+    image.set_data(placeholder)
+    ax.add_image(image)
+    return image
+
+class density_raster(object):
+    '''Stands in for a scatter plot of many semi-transparent markers of one size (e.g. every
+    spot in a video) drawn over an image, as a single image the size of the frame. Markers are
+    counted per pixel, spread over the area of a marker, and blended the way Agg blends
+    overlapping markers, so drawing takes about the same time however many markers there are.
+    '''
+    def __init__(self, x, y, c, image, cmap, size = 30, alpha = 1, linewidth = None):
+        '''Inputs:
+          x, y (array): Marker positions, in pixels of the image
+          c (array): Marker values, colored by cmap and drawn in ascending order as for a
+            scatter plot sorted by c
+          image (array): RGB(A) image in bytes (0-255), which the markers are drawn over
+          cmap (Colormap): Colors for c
+          size (float): Marker size in points^2, as for scatter
+          alpha (float): Marker opacity
+          linewidth (float): Marker edge width in points, default from rcParams as for scatter'''
+        self.image = image
+        values, layer = np.unique(np.asarray(c), return_inverse = True)
+        self.colors = np.round(cmap(plt.Normalize(values.min(), values.max())(values))[:,:3] * 255).astype(int)
+        h, w = image.shape[:2]
+        xi = np.clip(np.round(np.asarray(x)).astype(int), 0, w - 1)
+        yi = np.clip(np.round(np.asarray(y)).astype(int), 0, h - 1)
+        self.counts = np.bincount((layer.ravel() * h + yi) * w + xi, minlength = len(values) * h * w).reshape(len(values), h, w)
+
+        ## Markers are filled and outlined in the same color, in points
+        if linewidth == None: linewidth = plt.rcParams['patch.linewidth']
+        self.radius, self.linewidth = np.sqrt(size) / 2, linewidth
+
+        ## Opacity as drawn by Agg, in 8 bits (e.g. 0.01 is drawn as 3/255)
+        self.alpha, self.rendered = int(round(alpha * 255)), (None, None)
+
+    def blend_table(self, color, n):
+        '''Values of a color channel after 1 to n markers of a color are blended over each
+        value (0-255). Each marker moves the value by floor((color - value) * alpha / 255),
+        as Agg does, which saturates sooner than exact blending. Rows stop once the values
+        no longer change.
+        ----
+        Inputs:
+          color (int): Marker color channel (0-255)
+          n (int): Most markers over a pixel
+        ----
+        Returns:
+          table (array): table[k, value] is the value after k markers'''
+        table = [np.arange(256)]
+        while len(table) <= n:
+            values = table[-1] + (color - table[-1]) * self.alpha // 255
+            if (values == table[-1]).all(): break
+            table.append(values)
+        return np.array(table)
+
+    def render(self, scale):
+        '''RGBA image with the markers drawn at a given scale, in pixels of the image per point'''
+        if self.rendered[0] == scale: return self.rendered[1]
+
+        ## Layers of one marker over each pixel: antialiased fill, plus its outline (half
+        ##    inside the fill, half outside)
+        radius, edge = self.radius * scale, self.linewidth * scale / 2
+        r = int(np.ceil(radius + edge))
+        yy, xx = np.mgrid[-r:r + 1, -r:r + 1]
+        disc = lambda radius: np.clip(radius + .5 - np.hypot(xx, yy), 0, 1)
+        kernel = disc(radius) + disc(radius + edge) - disc(radius - edge)
+
+        ## Blending each color's markers, in order, over the image
+        image = self.image.astype(int)
+        for color, counts in zip(self.colors, self.counts):
+            layers = np.rint(scipy_signal.fftconvolve(counts, kernel, mode = 'same')).astype(int).clip(0)
+            for channel in range(3):
+                table = self.blend_table(color[channel], layers.max())
+                image[..., channel] = table[np.minimum(layers, len(table) - 1), image[..., channel]]
+        image = image.astype(np.uint8)
+        self.rendered = (scale, image)
+        return image
+
+    def draw(self, ax):
+        '''Adds the image to axes. It is rendered when the axes are drawn, once the size
+        of a point in pixels of the image is known (i.e. after tight_layout).
+        ----
+        Inputs:
+          ax (object): matplotlib axes, with data coordinates in pixels of the image
+        ----
+        Returns:
+          image (object): matplotlib image'''
+        return scaled_image(ax, self.render, self.image)
 
 class detector(object):
     '''Particle detection platform for identifying the group climbing velocity of a 
@@ -37,7 +264,7 @@ class detector(object):
     subset of frames by vial (vertical divisions of evenly spaced bins from the min/max
     X-range.
     '''
-    def __init__(self, video_file, config_file = None, gui = False, variables = None, debug = False, **kwargs):
+    def __init__(self, video_file, config_file = None, gui = False, variables = None, debug = False, recorder = None, profiler = None, proxy = False, outputs = 'full', **kwargs):
         '''Initializing detector object
         ----
         Inputs:
@@ -46,6 +273,11 @@ class detector(object):
           gui (bool): GUI-specific functions
           variables: None if importing from a file, or list if doing so manually
           debug (bool): Prints out each function as it runs.
+          recorder (instrument.recorder): Records time and memory used by each step, None does not record
+          profiler (profiling.profiler): Saves a profile of each step, None does not profile
+          proxy (bool): Decodes only the first frame, for drawing the region of interest in the
+                        GUI; step_1 then decodes only the region of interest and frame range
+          outputs (str): Output profile, 'full', 'standard', or 'lean' (see output_profiles)
           **kwargs: Keyword arguments that are unspecified but can be passed to various plot functions
         ----
         Returns:
@@ -53,9 +285,19 @@ class detector(object):
         '''
         self.debug = debug
         if self.debug: print('detector.__init__')
+        if recorder == None: recorder = instrument.recorder()
+        if profiler == None: profiler = profiling.profiler()
+        self.recorder, self.profiler = recorder, profiler
         
         self.config_file = config_file
         self.video_file = self.check_video(video_file)
+
+        ## Regions of interest, if the configuration file lists several (see split_rois)
+        self.rois, self.roi = None, None
+
+        ## Spot overlays with more spots than this are drawn binned, None draws every spot.
+        ##    Set before loading variables so the configuration file can change it (max_points=...)
+        self.max_points = 20000
         
         ## Load variables
         if gui:
@@ -66,6 +308,12 @@ class detector(object):
 
         ## Setting a color map
         self.vial_color_map = cm.jet
+
+        ## Plots are rendered inline, or their inputs saved for plots.py to render (see defer_plot)
+        self.defer_plots, self.deferred_plots, self.path_plots = False, [], None
+
+        ## Artifacts to write, outputs left out of the profile get no path
+        self.outputs = output_profiles[outputs]
         
         ## Create a conversion factor
         if self.convert_to_cm_sec: self.conversion_factor = self.pixel_to_cm / self.frame_rate
@@ -73,7 +321,15 @@ class detector(object):
 
         print('')
         self.specify_paths_details(video_file)
-        self.image_stack = self.video_to_array(video_file,loglevel='panic')
+        if self.profiler.name == None: self.profiler.name = os.path.split(self.name_nosuffix)[1]
+        self.proxy, self.roi_stack = proxy, None
+        with self.recorder.stage('decode') as record, self.profiler.profile('decode'):
+            if proxy:
+                self.image_stack = self.video_to_array(video_file,loglevel='panic',vframes=1)
+                self.n_frames = self.count_frames(video_file)
+            else:
+                self.image_stack = self.video_to_array(video_file,loglevel='panic')
+            record['frames'] = len(self.image_stack)
         return
 
     ## Loading functions    
@@ -170,6 +426,11 @@ class detector(object):
         folder,name = os.path.split(video_file)
         self.name = name[:-5]
         self.name_nosuffix = '.'.join(video_file.split('.')[:-1])
+
+        ## Outputs of a region of interest are named after it, details can come from its own name
+        if self.roi != None:
+            self.name_nosuffix = self.name_nosuffix + '.' + self.roi['label']
+            if 'name' in self.roi: self.name = self.roi['name']
         
         ## Defining final file names and destinations
         file_names = ['data','filtered','diagnostic','slope']
@@ -180,6 +441,11 @@ class detector(object):
             if self.debug: print('detector.specify_paths_details: ' + var_name+"='"+file_path+"'")
             file_path = file_path.replace("\\", "\\\\")
             exec(var_name+"='"+file_path+"'")
+        for item in file_names:
+            if item not in self.outputs: setattr(self, 'path_' + item, None)
+
+        ## Slopes of all regions of interest are written to the video's slopes file
+        if self.roi != None: self.path_slope = None
 
         ## Project folder specific paths
         if self.path_project == None: self.path_project = os.path.join(folder,self.name + '.cfg')
@@ -192,11 +458,72 @@ class detector(object):
         self.experiment_details = self.name.split('_')
         self.experiment_details[-1] = '.'.join(self.experiment_details[-1].split('.')[:-1])
         self.vial_ID = self.experiment_details[:self.vial_id_vars]
+        if self.roi != None and 'name' not in self.roi: self.vial_ID = self.vial_ID + [self.roi['label']]
         
         ## Creating a list of colors for plotting
         self.color_list = [self.vial_color_map(i) for i in np.linspace(0,1,self.vials)]
         return
 
+    def split_rois(self):
+        '''Creates a detector for each region of interest in 'rois', sharing the decoded
+        video. Each region is a dictionary of variables that replace those of the
+        configuration file (e.g. x, y, w, h, vials, threshold), plus a 'label' naming its
+        outputs (<video>.<label>.raw.csv, etc.) and an optional 'name' to parse
+        experimental details from instead of the video's name. Without a 'name', the label
+        is added to the vial IDs so regions do not share them.
+        ----
+        Inputs:
+          None
+        ----
+        Returns:
+          detectors (list): Detectors for each region, or [self] if there is only one'''
+        if self.debug: print('detector.split_rois')
+        if self.rois == None: return [self]
+
+        detectors = []
+        for i,roi in enumerate(self.rois):
+            roi = dict(roi)
+            if 'label' not in roi: roi['label'] = 'roi%s' % (i + 1)
+            d = copy.copy(self)
+            d.rois, d.roi = None, roi
+            d.deferred_plots, d.path_plots = [], None
+            for key,value in roi.items():
+                if key not in ['label','name']: setattr(d, key, value)
+            d.check_variable_formats()
+            if d.convert_to_cm_sec: d.conversion_factor = d.pixel_to_cm / d.frame_rate
+            else: d.conversion_factor = 1
+            d.specify_paths_details(d.video_file)
+            d.profiler = profiling.profiler(path_folder = self.profiler.path_folder, mode = self.profiler.mode,
+                                            name = '%s.%s' % (self.profiler.name, roi['label']),
+                                            interval = self.profiler.interval)
+            detectors.append(d)
+        return detectors
+
+    def merge_roi_slopes(self, detectors):
+        '''Writes the slopes of every region of interest to the video's slopes file, with
+        a 'roi' column for the region's label
+        ----
+        Inputs:
+          detectors (list): Processed detectors from split_rois
+        ----
+        Returns:
+          None'''
+        if self.debug: print('detector.merge_roi_slopes')
+        _list = []
+        for d in detectors:
+            df = d.df_slopes.copy()
+            df.insert(0, 'roi', d.roi['label'])
+            _list.append(df)
+        self.df_slopes = pd.concat(_list, ignore_index = True)
+
+        with self.recorder.stage('write_csv'):
+            self.df_slopes.to_csv(self.path_slope,index=False)
+        print('                --> Saved: %s \n' % self.path_slope.split('/')[-1])
+        if 'table' in self.outputs:
+            print(self.df_slopes[['roi','vial_ID','slope','r_value']])
+            print('\n')
+        return
+
     ## Checking to make sure variables are entered properly...still more to include
     def check_variable_formats(self):
         '''Checks to make sure at least some of the variables input formatted properly'''
@@ -285,6 +612,54 @@ class detector(object):
 
         return image_stack
 
+    def count_frames(self, file):
+        '''Counts the frames of a video from its packets, without decoding it. Falls back to
+        decoding the video at a single pixel per frame if the packets cannot be counted.
+        ----
+        Inputs:
+          file (str): Path to video file
+        ----
+        Returns:
+          n_frames (int): Number of frames in the video'''
+        if self.debug: print('detector.count_frames')
+        try:
+            probe = ffmpeg.probe(file, select_streams='v:0', count_packets=None)
+            return int(probe['streams'][0]['nb_read_packets'])
+        except:
+            out,err = (ffmpeg
+                       .input(file)
+                       .filter('scale',1,1)
+                       .output('pipe:', format='rawvideo', pix_fmt='gray', loglevel='panic')
+                       .run(capture_stdout=True))
+            return len(out)
+
+    def decode_roi(self, file, x, x_max, y, y_max, first_frame, last_frame):
+        '''Decodes only the region of interest and frame range of a video, as RGB like
+        video_to_array. Frames are converted to RGB before cropping, so pixels match those
+        of the full video.
+        ----
+        Inputs:
+          file (str): Path to video file
+          x, x_max (int): Left- and right-most x-positions
+          y, y_max (int): Lowest and highest y-positions
+          first_frame (int): First frame to include
+          last_frame (int): First frame to leave out
+        ----
+        Returns:
+          roi_stack (nd-array): nd-array of the region of interest'''
+        if self.debug: print('detector.decode_roi')
+        x, y = max(int(x), 0), max(int(y), 0)
+        x_max, y_max = min(int(x_max), self.width), min(int(y_max), self.height)
+        out,err = (ffmpeg
+                   .input(file)
+                   .filter('trim', start_frame=int(first_frame), end_frame=int(last_frame))
+                   .filter('format','rgb24')
+                   .filter('crop', x_max - x, y_max - y, x, y)
+                   .output('pipe:', format='rawvideo', pix_fmt='rgb24', vsync=0, loglevel='panic')
+                   .run(capture_stdout=True))
+        return np.frombuffer(out, np.uint8).reshape([-1, y_max - y, x_max - x, 3])
+
+    @instrument.timed('crop_grayscale')
     def crop_and_grayscale(self,video_array,
                          x = 0 ,x_max = None,
                          y = 0 ,y_max = None,
@@ -332,6 +707,7 @@ class detector(object):
         return clean_stack
     
     ## Subtract background
+    @instrument.timed('background')
     def subtract_background(self,video_array=None):
         '''Generate a null background image and subtract that from each frame
         ----
@@ -462,7 +838,7 @@ class detector(object):
         plt.tight_layout()
         return
 
-    def image_metrics(self, spots, image, metric, colorbar=False, **kwargs):
+    def image_metrics(self, spots, image, metric, colorbar=False, max_points=None, **kwargs):
         '''Creates a plot with spot metrics placed over the video image
         ----
         Inputs:
@@ -470,6 +846,9 @@ class detector(object):
           image (array): Image background for scatter point plot
           metric (str): Spot metric to filter for
           colorbar (bool): Include a color bar legend
+          max_points (int): Above this many spots, spots are binned by pixel and spread over
+            the size of a marker, colored by their mean metric, rather than drawn one at a
+            time. None draws every spot
           **kwargs: Keyword arguments to use with plt.scatter
         ----
         Returns:
@@ -479,10 +858,33 @@ class detector(object):
         ## Create plot
         plt.title(metric)
         plt.imshow(image, cmap = cm.Greys_r)
-        plt.scatter(spots.x,spots.y, c = spots[metric], cmap = cm.coolwarm, **kwargs)
-        
+        norm = plt.Normalize(spots[metric].min(), spots[metric].max())
+        if max_points == None or spots.shape[0] <= max_points:
+            plt.scatter(spots.x,spots.y, c = spots[metric], cmap = cm.coolwarm, norm = norm, **kwargs)
+        else:
+            ## Spots and their metric summed by pixel
+            h, w = image.shape[:2]
+            edges = [np.arange(h + 1) - .5, np.arange(w + 1) - .5]
+            counts = np.histogram2d(spots.y, spots.x, bins = edges)[0]
+            sums = np.histogram2d(spots.y, spots.x, bins = edges, weights = spots[metric])[0]
+            size, alpha = kwargs.get('s', plt.rcParams['lines.markersize'] ** 2), kwargs.get('alpha', 1)
+
+            def render(scale):
+                '''Mean metric of the spots over each pixel, spread over a marker at this scale
+                (known once the figure is laid out), as opaque as that many spots would be'''
+                radius = np.sqrt(size) / 2 * scale
+                r = int(np.ceil(radius))
+                yy, xx = np.mgrid[-r:r + 1, -r:r + 1]
+                disc = np.clip(radius + .5 - np.hypot(xx, yy), 0, 1)
+                spread = scipy_signal.fftconvolve(counts, disc, mode = 'same').clip(0)
+                mean = np.where(spread > .01, scipy_signal.fftconvolve(sums, disc, mode = 'same'), 0) / np.maximum(spread, .01)
+                overlay = cm.coolwarm(norm(mean))
+                overlay[..., 3] = np.where(spread > .01, 1 - (1 - alpha) ** spread, 0)
+                return overlay
+            scaled_image(plt.gca(), render, np.zeros((h, w, 4)))
+
         ## Add in colorbar
-        if colorbar: plt.colorbar()
+        if colorbar: plt.colorbar(cm.ScalarMappable(norm = norm, cmap = cm.coolwarm), ax = plt.gca())
         
         ## Format plot
         plt.ylim(self.h,0)
@@ -491,7 +893,8 @@ class detector(object):
         return
 
     def colored_hist(self, spots, metric, bins=40, predict_threshold=False, threshold=None):
-        '''Creates a colored histogram to go with image_metrics.
+        '''Creates a colored histogram to go with image_metrics, drawn from the bin counts
+          rather than from each spot.
         ----
         Inputs:
           spots (DataFrame): DataFrame with spot metrics (df_big)
@@ -509,18 +912,17 @@ class detector(object):
         except: pass
     
         ## Assembling histogram parameters
-        set_cm = plt.cm.get_cmap('coolwarm')
-        n, bin_assignments, patches = plt.hist(spots[metric],bins = bins)
+        n, bin_assignments = np.histogram(spots[metric],bins = bins)
         bin_centers = 0.5 * (bin_assignments[:-1] + bin_assignments[1:])
         col = bin_centers - min(bin_centers)
         col /= max(col)
 
         ## Plotting by color
-        for c, p in zip(col, patches):
-            plt.setp(p, 'facecolor', set_cm(c))
+        plt.bar(bin_assignments[:-1], n, width = np.diff(bin_assignments), align = 'edge',
+                color = cm.coolwarm(col))
     
         ## Getting height of vertical line
-        y_max = np.histogram(spots[metric],bins=bins)[0].max()    
+        y_max = n.max()
 
         ## Plotting vertical line for eccentricity and mass
         if metric == 'ecc': x_pos = [self.ecc_low,self.ecc_high]
@@ -542,7 +944,7 @@ class detector(object):
         plt.ylabel("Counts")
         return
 
-    def spot_checker(self, spots, metrics=['signal'], image=None, **kwargs):
+    def spot_checker(self, spots, metrics=['signal'], image=None, max_points=None, **kwargs):
         '''Generates figure containing subplots for image_metrics and colored_hist for
           different spot metrics
         ----
@@ -550,6 +952,7 @@ class detector(object):
           spots (DataFrame): DataFrame with spot metrics (df_big)
           metrics (list): List of the metrics to include when generating the plots
           image(array): Background image for plots, default = clean_stack[0]
+          max_points (int): Above this many spots, overlays are binned (see image_metrics)
           **kwargs: Keyword arguments to use with plt.imshow in image_metrics function
         ----
         Returns:
@@ -580,7 +983,7 @@ class detector(object):
             count += 1
             plt.subplot(len(metrics),2,count)
             plt.title('Spot overlay: %s' % col)
-            self.image_metrics(spots,image, metric=col,**kwargs)
+            self.image_metrics(spots,image, metric=col,max_points=max_points,**kwargs)
             plt.ylabel('Pixels')
             if col=='signal':
                 plt.xlabel('Pixels')
@@ -609,7 +1012,9 @@ class detector(object):
         if quiet: tp.quiet()
     
         ## Detect spots
-        spots = tp.batch(stack,diameter = diameter, **kwargs)
+        with self.recorder.stage('tp.batch', frames = len(stack)) as record:
+            spots = tp.batch(stack,diameter = diameter, **kwargs)
+            record['spots'] = int(spots.shape[0])
         
         ## Sorting DataFrame
         spots = spots[spots.raw_mass > 0].sort_values(by='frame')
@@ -668,9 +1073,9 @@ class detector(object):
         x_array = np.histogram(x_array,bins = bins)[0]
         
         ## Peak finding with SciPy.signal module
-        peaks = find_peaks(x_array)[0]
-        prominences = peak_prominences(x_array,peaks)
-        threshold = find_peaks(x_array, prominence=np.max(prominences))[0][0]
+        peaks = scipy_signal.find_peaks(x_array)[0]
+        prominences = scipy_signal.peak_prominences(x_array,peaks)
+        threshold = scipy_signal.find_peaks(x_array, prominence=np.max(prominences))[0][0]
         if self.debug: print('                   Threshold =',threshold)
         return threshold
 
@@ -867,7 +1272,7 @@ class detector(object):
                 _count_llr = np.median(df_window.groupby('frame').frame.count())
 
                 ## Performing linear regression on subset and formatting output to list
-                _result = linregress(_frame,_pos)
+                _result = scipy_stats.linregress(_frame,_pos)
                 _result = [start,stop] + np.hstack(_result).tolist() #+ [_count_llr,_count_all]
 
                 ## If slope is not significantly different from 0, then set slope = 0
@@ -890,6 +1295,8 @@ class detector(object):
         return result
         
         
+    @instrument.timed('step_1')
+    @profiling.profiled('step_1')
     def step_1(self, gui = False, grayscale = True):
         '''Crops and formats the video, previously loaded during detector initialization.
         ----
@@ -903,13 +1310,25 @@ class detector(object):
         x,y = self.x,self.y
         x_max, y_max = int(x + self.w),int(y + self.h)
         stack = self.image_stack
+        first_frame, last_frame = self.crop_0, self.crop_n
+
+        ## Decoding only the region of interest and frame range, if only a proxy frame was decoded
+        if self.proxy:
+            key = (x, x_max, y, y_max, first_frame, last_frame)
+            if self.roi_stack == None or self.roi_stack[0] != key:
+                with self.recorder.stage('decode_roi') as record, self.profiler.profile('decode_roi'):
+                    self.roi_stack = key, self.decode_roi(self.video_file, *key)
+                    record['frames'] = len(self.roi_stack[1])
+            stack = self.roi_stack[1]
+            x, x_max, y, y_max = 0, stack.shape[2], 0, stack.shape[1]
+            first_frame, last_frame = 0, stack.shape[0]
         
         if self.debug: print('detector.step_1 cropped and grayscale: grayscale image:', grayscale)
         self.clean_stack = self.crop_and_grayscale(stack,
                      y=y, y_max=y_max,
                      x=x, x_max=x_max,
-                     first_frame=self.crop_0, 
-                     last_frame=self.crop_n,
+                     first_frame=first_frame, 
+                     last_frame=last_frame,
                      grayscale=grayscale)
 
         ## Confirm frame ranges
@@ -924,13 +1343,13 @@ class detector(object):
             self.clean_stack = self.crop_and_grayscale(stack,
                          y=y, y_max=y_max,
                          x=x, x_max=x_max,
-                         first_frame=self.crop_0, last_frame=self.crop_n)
+                         first_frame=first_frame, last_frame=last_frame)
         else:
             if self.debug: print('detector.step_1 cropped and grayscale: no color image')
             self.clean_stack = self.crop_and_grayscale(stack,
                          y=y, y_max=y_max,
                          x=x, x_max=x_max,
-                         first_frame=self.crop_0, last_frame=self.crop_n, grayscale=False)                        
+                         first_frame=first_frame, last_frame=last_frame, grayscale=False)                        
 
         if self.debug: print('detector.step_1 cropped and grayscale dimensions: ', self.clean_stack.shape)
 
@@ -940,6 +1359,8 @@ class detector(object):
         return
 
 
+    @instrument.timed('step_2', spots = lambda d: d.df_big.shape[0])
+    @profiling.profiled('step_2')
     def step_2(self):
         '''Performs spot detection and manipulates the resulting DataFrames'''
         print('-- [ Step 2  ] Identifying spots')
@@ -951,6 +1372,8 @@ class detector(object):
         return
 
 
+    @instrument.timed('step_3')
+    @profiling.profiled('step_3')
     def step_3(self, gui = False):
         '''Visualizes spot metrics
         ----
@@ -961,16 +1384,29 @@ class detector(object):
           None
         '''
         print('-- [ Step 3  ] Visualize spot metrics ::',gui)
-        if gui:        
-            ## Visualizes spot metrics on plot with accompanying color-coded histogram
-            self.spot_checker(self.df_big,metrics=['ecc','mass','signal'], alpha=.1)
-            
+        if gui:
+            if self.defer_plots:
+                self.defer_plot('spot_check')
+                self.defer_plot('processed')
+            else:
+                self.plot_spot_check()
+                self.plot_processed()
+        return
+
+    def plot_spot_check(self):
+        '''Saves spot metrics on plots with accompanying color-coded histograms (.spot_check.png)'''
+        with self.recorder.stage('plot_spot_check'):
+            self.spot_checker(self.df_big,metrics=['ecc','mass','signal'], max_points=self.max_points, alpha=.1)
+        
             plot_spot_check = self.name_nosuffix + '.spot_check.png'
             plt.savefig(plot_spot_check,dpi=200)
             print('                --> Saved:',plot_spot_check.split('/')[-1])
             plt.close()
-        
-            ## Creating image plot with rectangle superimposed over first frame
+        return
+
+    def plot_processed(self):
+        '''Saves a frame before and after background subtraction, and the background (.processed.png)'''
+        with self.recorder.stage('plot_processed'):
             plt.figure()
             self.display_images(self.clean_stack,self.background,self.spot_stack,frame=20)
             plt.tight_layout()
@@ -980,35 +1416,30 @@ class detector(object):
             print('                --> Saved:',plot_name.split('/')[-1])
         return
 
-    def step_4(self):
-        '''Filters and processes data detected points'''
-
-        ## Assigning spots a True/False status based on ecc/eccentricity (circularity)
-        def ecc_filter(x,low=0,high=1):
-            '''Simple function for making a vector True/False depending on an upper and lower bound
-            ----
-            Inputs:
-              x (numeric): value to perform operation on
-              low (numeric): Lower bound
-              high (numeric): Upper bound
-            Returns:
-              (bool): True/False'''
-            if x >= low and x <= high: return True
-            else: return False
-
-        print('-- [ Step 4a ]   - Setting spot threshold')        
+    def filter_spots(self, verbose = True):
+        '''Filters detected spots (df_big) by signal threshold and eccentricity, trims outliers
+        and assigns the remaining spots to vials
+        ----
+        Inputs:
+          verbose (bool): Prints each filtering step
+        ----
+        Returns:
+          None -- df_big gets 'True_particle' and 'vial' columns, and bin_lines are set'''
+        if verbose: print('-- [ Step 4a ]   - Setting spot threshold')        
         ## Auto-detecting threshold
-        if self.threshold == 'auto': self.threshold = self.find_threshold(self.df_big.signal)
+        if self.threshold == 'auto':
+            with self.recorder.stage('threshold'): self.threshold = self.find_threshold(self.df_big.signal)
 
-        print('-- [ Step 4b ]   - Filtering by signal threshold') 
+        if verbose: print('-- [ Step 4b ]   - Filtering by signal threshold') 
         ## Assigning spots a True/False status based on signal threshold
-        self.df_big['True_particle'] = [x >= self.threshold for x in self.df_big.signal]
+        self.df_big['True_particle'] = self.df_big.signal >= self.threshold
 
         t_or_f = np.unique(self.df_big.True_particle, return_counts=True)
         if self.debug: print('                   True (%s) and False (%s) spots' % (t_or_f[0],t_or_f[1]))
         
-        print('-- [ Step 4c ]   - Filtering by eccentricity/circularity') 
-        self.df_big.loc[self.df_big.True_particle == True,'True_particle'] = self.df_big[self.df_big.True_particle==True].ecc.map(lambda x: ecc_filter(x,low=self.ecc_low,high=self.ecc_high))
+        ## Assigning spots a True/False status based on ecc/eccentricity (circularity)
+        if verbose: print('-- [ Step 4c ]   - Filtering by eccentricity/circularity') 
+        self.df_big['True_particle'] = self.df_big.True_particle & (self.df_big.ecc >= self.ecc_low) & (self.df_big.ecc <= self.ecc_high)
         t_or_f = np.unique(self.df_big.True_particle, return_counts=True)
         if self.debug: print('                   True (%s) and False (%s) spots'%(t_or_f[0],t_or_f[1]))
         
@@ -1018,7 +1449,7 @@ class detector(object):
             raise SystemExit
 
         ## Pruning errant points on periphery if outliers
-        print('-- [ Step 4d ]   - Trimming outliers (if indicated)')
+        if verbose: print('-- [ Step 4d ]   - Trimming outliers (if indicated)')
         if self.trim_outliers:
             self.left_crop = self.get_trim_lines(self.df_big,edge='left',sensitivity = self.outlier_LR)
             self.right_crop = self.get_trim_lines(self.df_big,edge='right',sensitivity = self.outlier_LR)
@@ -1029,7 +1460,7 @@ class detector(object):
                                         (self.df_big.y <= self.top_crop) & (self.df_big.y >= self.bottom_crop)]
         
         ## Assigning spots to vials, 0 if False AND outside of the True point range
-        print('-- [ Step 4e ]   - Assigning spots to vials')
+        if verbose: print('-- [ Step 4e ]   - Assigning spots to vials')
         self.bin_lines, self.df_big.loc[self.df_big['True_particle'],'vial'] = self.bin_vials(self.df_big[self.df_big.True_particle],vials = self.vials)
         
         ########################################
@@ -1045,14 +1476,25 @@ class detector(object):
         ########################################
         
         self.df_big.loc[self.df_big['True_particle']==False,'vial'] = 0
+        return
+
+    @instrument.timed('step_4', spots = lambda d: d.df_big.True_particle.sum())
+    @profiling.profiled('step_4')
+    def step_4(self):
+        '''Filters and processes data detected points'''
+        self.filter_spots()
 
-        print('-- [ Step 4f ]   - Saving raw data file')
-        ## Saving the TrackPy results, plus filter and vial notations        
-        self.df_big.to_csv(self.path_data, index=None)
-        print('                --> Saved:',self.path_data.split('/')[-1])
+        ## Saving the TrackPy results, plus filter and vial notations (no path when run in memory)
+        if self.path_data != None:
+            print('-- [ Step 4f ]   - Saving raw data file')
+            with self.recorder.stage('write_csv', spots = int(self.df_big.shape[0])):
+                self.df_big.to_csv(self.path_data, index=None)
+            print('                --> Saved:',self.path_data.split('/')[-1])
 
         return
 
+    @instrument.timed('step_5', spots = lambda d: d.df_filtered.shape[0])
+    @profiling.profiled('step_5')
     def step_5(self):
         '''Calculates local linear regressions'''
         print('-- [ step 5  ] Setting up DataFrames for local linear regression')
@@ -1066,9 +1508,10 @@ class detector(object):
         ## Adding experimental details to DataFrame
         self.specify_paths_details(self.video_file)
        
-       ## Filling in experimental details to DataFrame
-        for item in self.file_details.keys():
-            self.df_filtered[item] = np.repeat(self.file_details[item],self.df_filtered.shape[0])        
+       ## Filling in experimental details to DataFrame, only read by the filtered data file
+        if 'filtered' in self.outputs:
+            for item in self.file_details.keys():
+                self.df_filtered[item] = np.repeat(self.file_details[item],self.df_filtered.shape[0])        
         
         ## Invert y-axis -- images indexed upper left to lower right but converting because plots got left left to upper right
         self.df_filtered['y'] = self.invert_y(self.df_filtered)
@@ -1078,11 +1521,14 @@ class detector(object):
         self.df_filtered['vial'] = self.df_filtered['vial'].astype('int')
 
         ## Save the filtered DataFrame
-        path_filtered = self.name_nosuffix+'.filtered.csv'
-        self.df_filtered.to_csv(self.path_filtered, index=False)
-        print('                --> Saved:',self.path_filtered.split('/')[-1])
+        if self.path_filtered != None:
+            with self.recorder.stage('write_csv', spots = int(self.df_filtered.shape[0])):
+                self.df_filtered.to_csv(self.path_filtered, index=False)
+            print('                --> Saved:',self.path_filtered.split('/')[-1])
         return
         
+    @instrument.timed('step_6', spots = lambda d: d.df_filtered.shape[0])
+    @profiling.profiled('step_6')
     def step_6(self,gui=False):
         '''Creating diagnostic plots to visualize spots at beginning & end of most linear 
           section, throughout the video, and a vertical velocity plot for each vial.
@@ -1100,58 +1546,90 @@ class detector(object):
             print('!! Issue with window size > video length: was %s, now %s' % (self.window, video_length-1))
             self.window = video_length - 1
             
-        if gui:        
+        if gui:
+            if self.defer_plots: self.defer_plot('roi')
+            else: self.plot_roi()
+
+        ## Only the regression is needed without a diagnostic plot (e.g. when run in memory or
+        ##    with the 'lean' output profile), not the regression on all vials it is drawn from
+        if self.path_diagnostic == None:
+            print('-- [ step 6b ] Performing local linear regression')
+            with self.recorder.stage('regression', spots = int(self.df_filtered.shape[0])):
+                self.get_slopes()
+            return
+
+        print('-- [ step 6b ] Creating diagnostic plot file')
+        ## Finding the frames that flank the most linear portion 
+        ##    of the y vs. t curve for all points, not just by vials
+        if self.debug: print('-- [ step 6b ] Plotting data: Re-running local linear regression on all')
+        with self.recorder.stage('regression_all', spots = int(self.df_filtered.shape[0])):
+            _result = self.local_linear_regression(self.df_filtered)
+        begin = _result.iloc[0].first_frame.astype(int)
+        end = _result.iloc[0].last_frame.astype(int)
+        
+        ## For future release
+#         min_R = _result.iloc[0].r_value ##
+
+        print('-- [ step 6b1] Performing local linear regression')
+        with self.recorder.stage('regression', spots = int(self.df_filtered.shape[0])):
+            self.get_slopes()
+
+        if self.defer_plots: self.defer_plot('diagnostic', begin = begin, end = end)
+        else: self.plot_diagnostic(begin, end)
+        return
 
-            ## Visualizes the region of interest
+    def plot_roi(self):
+        '''Saves the first frame with the region of interest and vial boundaries (.ROI.png)'''
+        with self.recorder.stage('plot_roi'):
             plt.figure()
             self.view_ROI(border = True,
                             x0 = self.x, x1 = self.x + self.w,
                             y0 = self.y, y1 = self.y + self.h,
                             bin_lines = True)
-        
+    
             plot_roi = self.name_nosuffix + '.ROI.png'
             plt.savefig(plot_roi,dpi=100)
             print('                --> Saved:',plot_roi.split('/')[-1])
             plt.close()
-            
-        print('-- [ step 6b ] Creating diagnostic plot file')
+        return
+
+    def plot_diagnostic(self, begin, end):
+        '''Saves the diagnostic plot (.diagnostic.png): spots in the first and last frames of
+          the most linear section, spots throughout the video, and each vial's mean y-position
+        ----
+        Inputs:
+          begin (int): First frame of the most linear section, for all vials
+          end (int): Last frame of the most linear section, for all vials
+        ----
+        Returns:
+          None'''
         ## Set up plots
         plt.figure(figsize=(10,8))
         fig, ((ax1, ax2), (ax3, ax4)) = plt.subplots(nrows=2, ncols=2)
 
-        ## Finding the frames that flank the most linear portion 
-        ##    of the y vs. t curve for all points, not just by vials
-        if self.debug: print('-- [ step 6b ] Plotting data: Re-running local linear regression on all')
-        _result = self.local_linear_regression(self.df_filtered)
-        begin = _result.iloc[0].first_frame.astype(int)
-        end = _result.iloc[0].last_frame.astype(int)
-        
-        ## For future release
-#         min_R = _result.iloc[0].r_value ##
-
         ## Need only True spots, but not inverted -- df_big
         spots = self.df_big[self.df_big.True_particle]
 
         ## Creating the diagnostic plot
-        print('-- [ step 6b1] Plotting image plots with overlaying points')        
-        if self.debug: print("-- [ step 6b1] Plotting data: Plot 1 - Frame %s" % begin)
-        self.image_plot(df = spots,frame = begin, ax=ax1)
+        print('-- [ step 6b2] Plotting image plots with overlaying points')        
+        with self.recorder.stage('image_plots', spots = int(spots.shape[0])):
+            if self.debug: print("-- [ step 6b2] Plotting data: Plot 1 - Frame %s" % begin)
+            self.image_plot(df = spots,frame = begin, ax=ax1)
 
-        if self.debug: print("-- [ step 6b1] Plotting data: Plot 2 - Frame %s" % end)
-        self.image_plot(df = spots, ax=ax2, frame = int(str(end)))
+            if self.debug: print("-- [ step 6b2] Plotting data: Plot 2 - Frame %s" % end)
+            self.image_plot(df = spots, ax=ax2, frame = int(str(end)))
 
-        if self.debug: print("-- [ step 6b1] Plotting data: Plot 3 - Frame ALL")
-        self.image_plot(df = spots,ax=ax4, frame = None)
+            if self.debug: print("-- [ step 6b2] Plotting data: Plot 3 - Frame ALL")
+            self.image_plot(df = spots,ax=ax4, frame = None)
 
-        print('-- [ step 6b2] Performing local linear regression')
-        self.get_slopes()
-        
         print('-- [ step 6b3] Plotting local linear regression results')
-        self.loclin_plot(ax=ax3)
+        with self.recorder.stage('loclin_plot'):
+            self.loclin_plot(ax=ax3)
 
         ## Saving diagnostic plot
-        fig.tight_layout()
-        plt.savefig(self.path_diagnostic,dpi=300, transparent = True)
+        with self.recorder.stage('save_diagnostic'):
+            fig.tight_layout()
+            plt.savefig(self.path_diagnostic,dpi=300, transparent = True)
 #         plt.savefig(self.path_project + '/diagnostic_plots/' + self.name + '.diagnostic.png',dpi=100, transparent = True)        
 
         ## Future release
@@ -1162,7 +1640,62 @@ class detector(object):
         plt.close()
         print('                --> Saved:',self.path_diagnostic.split('/')[-1])
         return
-        
+
+    def defer_plot(self, kind, **arguments):
+        '''Saves the inputs of a plot instead of rendering it, so that another process (see
+          plots.py) can render it. Inputs are the attributes the plot_<kind> method reads,
+          with image stacks cut down to the frames drawn and vials to their mean y-position
+          in each frame. A video's deferred plots are kept together in <video>.plots.pkl.gz,
+          from which they can be rendered again later.
+        ----
+        Inputs:
+          kind (str): 'roi', 'spot_check', 'processed', or 'diagnostic'
+          **arguments: Arguments for the plot_<kind> method
+        ----
+        Returns:
+          path_plots (str): Path to the plot inputs file'''
+        if self.debug: print('detector.defer_plot')
+        ## Frames are only drawn through 8-bit color maps, so float32 is plenty
+        frame = lambda image: image.astype(np.float32) if image.dtype.kind == 'f' else image
+        frames = lambda stack, *frames: {i:frame(stack[i]) for i in set(frames) if 0 <= i < len(stack)}
+        inputs = {item:getattr(self, item, None) for item in ['debug','name_nosuffix','path_diagnostic',
+                                                                'x','y','w','h','n_frames','vials',
+                                                                'bin_lines','max_points']}
+        if kind == 'roi':
+            inputs.update(image_stack = self.image_stack[:1], trim_outliers = self.trim_outliers)
+            if self.trim_outliers:
+                inputs.update({item:getattr(self, item) for item in ['left_crop','right_crop','top_crop','bottom_crop']})
+        elif kind == 'spot_check':
+            inputs.update(clean_stack = frames(self.clean_stack, 0), ecc_low = self.ecc_low,
+                          ecc_high = self.ecc_high, minmass = self.minmass,
+                          df_big = self.df_big[['x','y','ecc','mass','signal']])
+        elif kind == 'processed':
+            inputs.update(clean_stack = frames(self.clean_stack, 20), spot_stack = frames(self.spot_stack, 20),
+                          background = self.background)
+        elif kind == 'diagnostic':
+            begin, end = int(arguments['begin']), int(arguments['end'])
+            arguments = dict(begin = begin, end = end)
+            spots = self.df_big[self.df_big.True_particle]
+            drawn = lambda i: i - 1 if i == self.n_frames else i # As in image_plot
+            inputs.update(clean_stack = frames(self.clean_stack, 0, drawn(begin), drawn(end)),
+                          df_big = spots[['x','y','frame','vial','True_particle']],
+                          vial_color_map = self.vial_color_map, color_list = self.color_list,
+                          result = self.result, convert_to_cm_sec = self.convert_to_cm_sec,
+                          frame_rate = self.frame_rate, pixel_to_cm = self.pixel_to_cm,
+                          vial = {V:self.vial[V].groupby('frame', as_index = False).y.mean() for V in range(1, self.vials + 1) if V in self.vial})
+
+        ## Saving every deferred plot of the video so far
+        self.deferred_plots.append({'kind':kind, 'inputs':inputs, 'arguments':arguments})
+        self.path_plots = self.name_nosuffix + '.plots.pkl.gz'
+        with gzip.open(self.path_plots + '.tmp', 'wb', compresslevel = 1) as f:
+            pickle.dump({'version':version, 'video_file':self.video_file, 'plots':self.deferred_plots},
+                        f, protocol = pickle.HIGHEST_PROTOCOL)
+        os.replace(self.path_plots + '.tmp', self.path_plots)
+        print('                --> Saved %s plot inputs:' % kind, self.path_plots.split('/')[-1])
+        return self.path_plots
+        
+    @instrument.timed('step_7', spots = lambda d: d.df_slopes.shape[0])
+    @profiling.profiled('step_7')
     def step_7(self):
         '''Writing the video's slope file'''
         print('-- [ step 7  ] Setting up slopes file')
@@ -1183,12 +1716,15 @@ class detector(object):
         self.df_slopes = self.df_slopes[slope_columns]
     
         ## Saving slope file
-        self.df_slopes.to_csv(self.path_slope,index=False)
-        print('                --> Saved: %s \n' % self.path_slope.split('/')[-1])
-        plt.close('all')
-        
-        print(self.df_slopes[['vial_ID','slope','r_value']])
-        print('\n')
+        if self.path_slope != None:
+            with self.recorder.stage('write_csv'):
+                self.df_slopes.to_csv(self.path_slope,index=False)
+            print('                --> Saved: %s \n' % self.path_slope.split('/')[-1])
+            plt.close('all')
+        
+        if 'table' in self.outputs:
+            print(self.df_slopes[['vial_ID','slope','r_value']])
+            print('\n')
         return
         
     def image_plot(self,df,frame=None,ax=None,ylim=[0,1000]):
@@ -1209,13 +1745,14 @@ class detector(object):
         except: frame = None
 
         ## Assign plotting parameters depending on which frame(s)
+        all_frames = False
         if type(frame) == int and frame in df.frame.unique():
             df = df[(df.frame == frame)]
             alpha = .25
             title  = "Frame: %s" % frame
             ax.set_title(title)
         elif frame == None:
-            frame = 0
+            frame, all_frames = 0, True
             alpha = 0.01
             title = 'All x,y-points throughout video'
             ax.set_title(title)
@@ -1236,10 +1773,14 @@ class detector(object):
         ## Plotting vertical bin lines
         ax.vlines(self.bin_lines,0,image.shape[0],alpha = .3)  
         
-        ## Coloring spots by vial
+        ## Coloring spots by vial, all spots as a density raster rather than one marker each
         df = df.sort_values(by='vial')
         df = df[df.vial != 0]
-        if self.vials >= 1:
+        if self.vials >= 1 and all_frames and df.shape[0] > 0:
+            background = cm.Greys_r(plt.Normalize(image.min(), image.max())(image), bytes = True)
+            density_raster(df.x, df.y, df.vial, background, self.vial_color_map,
+                           size = 30, alpha = alpha).draw(ax)
+        elif self.vials >= 1:
             ax.scatter(df.x, df.y, 
                         s = 30, 
                         alpha = alpha,
@@ -1322,9 +1863,110 @@ class detector(object):
         else: return ax
 
     ## Parameter testing is only used in the GUI
+    def check_frame_spots(self, frame = None):
+        '''Slices the spots of the check frame into false and true spots, binning the true
+        spots into vials for coloring
+        ----
+        Inputs:
+          frame (int): Frame to slice, None for the check frame
+        ----
+        Returns:
+          spots_false (DataFrame): Spots removed by the filters
+          spots_true (DataFrame): Spots passing the filters, with 'vial' and 'color' columns'''
+        if self.debug: print('detector.parameter_testing: Slicing DataFrames')
+        spots_false = self.df_big[~self.df_big['True_particle']]
+        spots_true = self.df_big[self.df_big['True_particle']]
+        
+        ## Binning and coloring spots
+#         bin_lines,spots_true['vial'] = self.bin_vials(spots_true,vials = self.vials)
+#         spots_true = spots_true[(spots_true.x >= self.bin_lines.min()) & (spots_true.x <= self.bin_lines.max())]
+
+        spots_true['vial'] = np.repeat(0,spots_true.shape[0])
+        vial_assignments = self.bin_vials(spots_true, vials = self.vials, bin_lines = self.bin_lines)[1]
+        spots_true.loc[(spots_true.x >= self.bin_lines[0]) & (spots_true.x <= self.bin_lines[-1]),'vial'] = vial_assignments
+
+        spots_true.loc[:,'color'] = spots_true.vial.map(dict(zip(range(1,self.vials+1), self.color_list)))
+        if frame == None: frame = self.check_frame
+        return spots_false[spots_false.frame==frame], spots_true[spots_true.frame==frame]
+
+    def refilter(self, threshold = None, ecc_low = None, ecc_high = None):
+        '''Filters the spots of the last parameter test again with a new threshold and/or
+        eccentricity range, without detecting spots again, and updates the filter-dependent
+        plot artists (check frame spots, vial bins, and the threshold line)
+        ----
+        Inputs:
+          threshold (numeric): Signal threshold, None keeps the current one
+          ecc_low (float): Lower eccentricity bound, None keeps the current one
+          ecc_high (float): Upper eccentricity bound, None keeps the current one
+        ----
+        Returns:
+          artists (list): Updated plot artists, to be redrawn
+        Raises SystemExit, as step_4 does, if no spots pass the filters.'''
+        if self.debug: print('detector.refilter')
+        if threshold != None: self.threshold = threshold
+        if ecc_low != None: self.ecc_low = ecc_low
+        if ecc_high != None: self.ecc_high = ecc_high
+        self.df_big = self.df_detected.copy()
+        self.filter_spots(verbose = False)
+        return self.update_filter_artists()
+
+    def scrub_frame(self, frame):
+        '''Shows another frame in the check frame plot of the last parameter test, with its
+        spots. Frames come from clean_stack, already in memory, so nothing is decoded.
+        ----
+        Inputs:
+          frame (int): Frame, counted from crop_0 like the 'frame' column of df_big
+        ----
+        Returns:
+          artists (list): Updated plot artists, to be redrawn'''
+        if self.debug: print('detector.scrub_frame')
+        self.shown_frame = frame
+        artists = self.filter_artists
+        artists['frame'].set_data(self.clean_stack[frame])
+        artists['title'].set_text('Frame: '+str(frame))
+        return [artists['frame'], artists['title']] + self.update_filter_artists()
+
+    def update_filter_artists(self):
+        '''Updates the spots, vial bins and threshold line of the last parameter test, for the
+        shown frame
+        ----
+        Inputs:
+          None
+        ----
+        Returns:
+          artists (list): Updated plot artists, to be redrawn'''
+        spots_false, spots_true = self.check_frame_spots(self.shown_frame)
+        artists = self.filter_artists
+        artists['false_spots'].set_offsets(spots_false[['x','y']].values)
+        artists['true_spots'].set_offsets(spots_true[['x','y']].values)
+        artists['true_spots'].set_array(spots_true.vial.values)
+        if spots_true.shape[0] > 0: artists['true_spots'].autoscale()
+        y_0, y_1 = artists['bin_lines'].get_segments()[0][:,1]
+        artists['bin_lines'].set_segments([[[x,y_0],[x,y_1]] for x in self.bin_lines])
+        y_0, y_1 = artists['threshold'].get_segments()[0][:,1]
+        artists['threshold'].set_segments([[[self.threshold,y_0],[self.threshold,y_1]]])
+        return [artists[item] for item in ['false_spots','true_spots','bin_lines','threshold']]
+
     def parameter_testing(self, variables, axes):
         '''Parameter testing in the GUI and done separately to account for plots with wx'''
         if self.debug: print('detector.parameter_testing')
+        for status, draw in self.parameter_testing_steps(variables, axes):
+            draw()
+        return
+
+    def parameter_testing_steps(self, variables, axes):
+        '''Runs parameter testing one step at a time, so the GUI can run it on a worker thread
+        and stop between steps. Each step yields a function filling its subplots, to be
+        called on the GUI thread; the data it plots is taken when the step finishes, so
+        later steps do not change it.
+        ----
+        Inputs:
+          variables (list): List of variables, as in load_for_gui
+          axes (list): Six subplots (2 rows x 3 columns)
+        ----
+        Returns:
+          steps (generator): (status (str), draw (function)) for each finished step'''
+        if self.debug: print('detector.parameter_testing_steps')
         
         ## Running through the first few steps
         self.load_for_gui(variables)
@@ -1332,178 +1974,149 @@ class detector(object):
         ## Load in video
         self.step_1(gui=True) # Crop and convert video
 
+        #### Working through the GUI plots        
+        ## Setting plot (upper left) for background image
+        background, w, h = self.background, self.w, self.h
+        def draw_background():
+            if self.debug: print('detector.parameter_testing: Subplot 0: Background image')
+            axes[0].set_title("Background Image")
+            axes[0].imshow(background,cmap=cm.Greys_r)
+            axes[0].set_xlim(0,w)
+            axes[0].set_ylim(h,0)
+            axes[0].scatter([0,w],[0,h],alpha=0,marker='.')
+            return
+        yield 'Detecting spots...', draw_background
+
         ## Detect spots
         self.step_2()
         
         ## First optimization plot
         self.step_3(gui=True)
         
-        ## Filters DataFrame of detected spots
+        ## Filters DataFrame of detected spots, keeping the detected spots for refilter()
+        self.df_detected = self.df_big.copy()
         self.step_4() 
-
-        ## Executing final steps
-        self.step_5()
-        self.step_6(gui=True)
-        self.step_7()
-        
-        #### Working through the GUI plots        
-        ## Setting plot (upper left) for background image
-        if self.debug: print('detector.parameter_testing: Subplot 0: Background image')
-        axes[0].set_title("Background Image")
-        axes[0].imshow(self.background,cmap=cm.Greys_r)
-        axes[0].set_xlim(0,self.w)
-        axes[0].set_ylim(self.h,0)
-        axes[0].scatter([0,self.w],[0,self.h],alpha=0,marker='.')
+        bins=40
+        self.filter_artists, self.shown_frame = dict(), self.check_frame
+
+        ## Mass and signal histograms
+        mass, minmass = self.df_big.mass.values.copy(), self.minmass
+        signal, threshold = self.df_big.signal.values.copy(), self.threshold
+        def draw_histograms():
+            axes[3].set_title('Mass Distribution')
+            axes[3].hist(mass,bins = bins)
+            y_max = np.histogram(mass,bins=bins)[0].max()
+            axes[3].vlines(minmass,0,y_max)
+
+            axes[4].set_title('Signal Distribution')
+            axes[4].hist(signal,bins = bins)
+            y_max = np.histogram(signal,bins=bins)[0].max()
+            self.filter_artists['threshold'] = axes[4].vlines(threshold,0,y_max)
+            return
+        yield 'Binning spots into vials...', draw_histograms
         
         ## Slice df_big into true vs. false spots
-        if self.debug: print('detector.parameter_testing: Slicing DataFrames')
-        spots_false = self.df_big[~self.df_big['True_particle']]
-        spots_true = self.df_big[self.df_big['True_particle']]
-        
-        ## Binning and coloring spots
-#         bin_lines,spots_true['vial'] = self.bin_vials(spots_true,vials = self.vials)
-#         spots_true = spots_true[(spots_true.x >= self.bin_lines.min()) & (spots_true.x <= self.bin_lines.max())]
-
-        spots_true['vial'] = np.repeat(0,spots_true.shape[0])
-        vial_assignments = self.bin_vials(spots_true, vials = self.vials, bin_lines = self.bin_lines)[1]
-        spots_true.loc[(spots_true.x >= self.bin_lines[0]) & (spots_true.x <= self.bin_lines[-1]),'vial'] = vial_assignments
-
-        spots_true.loc[:,'color'] = spots_true.vial.map(dict(zip(range(1,self.vials+1), self.color_list)))
-        bins=40
+        spots_false, spots_true = self.check_frame_spots()
 
         ## Setting plots for scatterplot overlay on a selected frame
-        if self.debug: print('detector.parameter_testing: Subplot 1: Test frame')
-        axes[1].set_title('Frame: '+str(self.check_frame))
-        axes[1].imshow(self.clean_stack[self.check_frame], cmap = cm.Greys_r)
-        axes[1].scatter(spots_false[(spots_false.frame==self.check_frame)].x,
-                        spots_false[(spots_false.frame==self.check_frame)].y, 
-                        color = 'b',marker ='+',alpha = .5)
-        a = axes[1].scatter(spots_true[spots_true.frame==self.check_frame].x,
-                            spots_true[spots_true.frame==self.check_frame].y, 
-                            c = spots_true[spots_true.frame==self.check_frame].vial,
-                            cmap = self.vial_color_map,
-                            marker ='o',alpha = .8)
-        a.set_facecolor('none')
-        axes[1].vlines(self.bin_lines,0,self.df_big.y.max(),color='w')
-        axes[1].set_xlim(0,self.w)
-        axes[1].set_ylim(self.h,0)
-        
-        ##########
-        ## Fly counts
-#         axes[5].plot(spots_true.groupby('frame').frame.mean(),
-#                      spots_true.groupby('frame').frame.count(), 
-#                      label = 'Fly count', color = 'g',alpha = .5)
-#                      
-#         axes[5].hlines(np.median(spots_true.groupby('frame').frame.count()),
-#                        self.df_big.frame.min(),self.df_big.frame.max(),
-#                        linestyle = '--',alpha = .5, 
-#                        color = 'gray', label = 'Median no. flies')
-#         axes[5].set(title = 'Flies per frame',
-#                         ylabel='Flies detected',
-#                         xlabel='Frame') 
-#         axes[5].legend(frameon=False, fontsize = 'small')
-
-        ##########
-        df = self.df_filtered.sort_values(by='frame')
-        for V in range(1,self.vials + 1):
-            color = self.color_list[V-1]
-            _df = df[df.vial == V]
-
-            ## Local linear regression
-            begin = self.local_linear_regression(_df).iloc[0].first_frame.astype(int)
-            end = begin + self.window        
-                        
-            ## Plotting all points
-            axes[5].plot(_df.groupby('frame').frame.unique(),
-                _df.groupby('frame').y.count(),alpha = .3, color = color,label='') 
-            
-            ## Plotting most linear points
-            _df = _df[(_df.frame >= begin) & (_df.frame <= end)]
-            axes[5].plot(_df.groupby('frame').frame.unique(),
-                _df.groupby('frame').frame.count() ,color = color, alpha = .5)
-    
-            axes[5].hlines(np.median(_df.groupby('frame').frame.count()),
-                       df.frame.min(),df.frame.max(),
-                       linestyle = '--',alpha = .7, 
-                       color = color)
-
-
-        # Deciding number of columns for legend
-        if self.vials > 10: ncol = 3
-        elif self.vials > 5: ncol = 2
-        else: ncol=1
-        
-        ## Setting labels
-        label_y,label_x = '(pixels)','Frames'
-        if self.convert_to_cm_sec: 
-            label_x,label_y = 'Seconds','(cm)'
-        labels = ['Flies detected per frame','Flies detected','Frame']
-        axes[5].set(title = labels[0], ylabel=labels[1],xlabel=labels[2]) 
-        axes[5].set_ylim(ymin = 0,ymax = np.max(_df.groupby('frame').frame.count())*1.2)
-#         axes[5].legend(frameon=False, fontsize='x-small', ncol=ncol)
-
-        custom_lines = [Line2D([0], [0], color='k', linestyle = '--', alpha = .9),
-                        Line2D([0], [0], color='k', linestyle = '-', alpha = .5)]
-        custom_labels = ['Median', 'All frames']
-        axes[5].legend(custom_lines, custom_labels,frameon=False, fontsize='x-small', ncol=ncol)
-
-        #############
-
-
-
-        ## Mass histogram
-        axes[3].set_title('Mass Distribution')
-        axes[3].hist(self.df_big.mass,bins = bins)
-        y_max = np.histogram(self.df_big.mass,bins=bins)[0].max()
-        axes[3].vlines(self.minmass,0,y_max)
+        check_frame, image, bin_lines = self.check_frame, self.clean_stack[self.check_frame], self.bin_lines
+        y_max_spots = self.df_big.y.max()
+        def draw_spots():
+            if self.debug: print('detector.parameter_testing: Subplot 1: Test frame')
+            self.filter_artists['title'] = axes[1].set_title('Frame: '+str(check_frame))
+            self.filter_artists['frame'] = axes[1].imshow(image, cmap = cm.Greys_r)
+            self.filter_artists['false_spots'] = axes[1].scatter(spots_false.x, spots_false.y, 
+                                                                 color = 'b',marker ='+',alpha = .5)
+            a = axes[1].scatter(spots_true.x, spots_true.y, 
+                                c = spots_true.vial,
+                                cmap = self.vial_color_map,
+                                marker ='o',alpha = .8)
+            a.set_facecolor('none')
+            self.filter_artists['true_spots'] = a
+            self.filter_artists['bin_lines'] = axes[1].vlines(bin_lines,0,y_max_spots,color='w')
+            axes[1].set_xlim(0,w)
+            axes[1].set_ylim(h,0)
+            return
+        yield 'Calculating local linear regressions...', draw_spots
 
-        ## Signal histogram
-        axes[4].set_title('Signal Distribution')
-        axes[4].hist(self.df_big.signal,bins = bins)
-        y_max = np.histogram(self.df_big.signal,bins=bins)[0].max()
-        axes[4].vlines(self.threshold,0,y_max)
+        ## Executing final steps
+        self.step_5()
+        self.step_6(gui=True)
+        self.step_7()
 
-        ## Calculating local linear regression
-#         self.step_5()
-        
-        ## Setting plots for local linear regression
+        ## Most linear window of each vial, for the last two plots
         df = self.df_filtered.sort_values(by='frame')
-
-        ## Converting to cm per sec if specified
-        convert_x,convert_y = 1,1
-        if self.convert_to_cm_sec:
-            convert_x,convert_y = self.frame_rate,self.pixel_to_cm
-
-        ## LocLin plot for each vial
+        windows = []
         for V in range(1,self.vials + 1):
-            label = 'Vial '+str(V)
-            color = self.color_list[V-1]
             _df = df[df.vial == V]
 
             ## Local linear regression
             begin = self.local_linear_regression(_df).iloc[0].first_frame.astype(int)
             end = begin + self.window        
+            windows.append((V, _df, _df[(_df.frame >= begin) & (_df.frame <= end)]))
+        vials, window_count = self.vials, self.window
+        convert_to_cm_sec, frame_rate, pixel_to_cm = self.convert_to_cm_sec, self.frame_rate, self.pixel_to_cm
+
+        def draw_regressions():
+            ##########
+            ## Fly counts
+            for V, _df, _df_window in windows:
+                color = self.color_list[V-1]
+                
+                ## Plotting all points
+                axes[5].plot(_df.groupby('frame').frame.unique(),
+                    _df.groupby('frame').y.count(),alpha = .3, color = color,label='') 
+                
+                ## Plotting most linear points
+                axes[5].plot(_df_window.groupby('frame').frame.unique(),
+                    _df_window.groupby('frame').frame.count() ,color = color, alpha = .5)
+        
+                axes[5].hlines(np.median(_df_window.groupby('frame').frame.count()),
+                           df.frame.min(),df.frame.max(),
+                           linestyle = '--',alpha = .7, 
+                           color = color)
+
+            # Deciding number of columns for legend
+            if vials > 10: ncol = 3
+            elif vials > 5: ncol = 2
+            else: ncol=1
             
-            ## Plotting all points
-            axes[2].plot(_df.groupby('frame').frame.mean() / convert_x,
-               _df.groupby('frame').y.mean() / convert_y,alpha = .35, color = color,label='') 
+            ## Setting labels
+            labels = ['Flies detected per frame','Flies detected','Frame']
+            axes[5].set(title = labels[0], ylabel=labels[1],xlabel=labels[2]) 
+            axes[5].set_ylim(ymin = 0,ymax = np.max(windows[-1][2].groupby('frame').frame.count())*1.2)
+
+            custom_lines = [mlines.Line2D([0], [0], color='k', linestyle = '--', alpha = .9),
+                            mlines.Line2D([0], [0], color='k', linestyle = '-', alpha = .5)]
+            custom_labels = ['Median', 'All frames']
+            axes[5].legend(custom_lines, custom_labels,frameon=False, fontsize='x-small', ncol=ncol)
+
+            #############
+            ## Converting to cm per sec if specified
+            convert_x,convert_y = 1,1
+            if convert_to_cm_sec:
+                convert_x,convert_y = frame_rate,pixel_to_cm
+
+            ## LocLin plot for each vial
+            for V, _df, _df_window in windows:
+                label = 'Vial '+str(V)
+                color = self.color_list[V-1]
+                
+                ## Plotting all points
+                axes[2].plot(_df.groupby('frame').frame.mean() / convert_x,
+                   _df.groupby('frame').y.mean() / convert_y,alpha = .35, color = color,label='') 
+                
+                ## Plotting most linear points
+                axes[2].plot(_df_window.groupby('frame').frame.mean() / convert_x,
+               _df_window.groupby('frame').y.mean() / convert_y,color = color, label = label)
             
-            ## Plotting most linear points
-            _df = _df[(_df.frame >= begin) & (_df.frame <= end)]
-            axes[2].plot(_df.groupby('frame').frame.mean() / convert_x,
-           _df.groupby('frame').y.mean() / convert_y,color = color, label = label)
-
-        # Deciding number of columns for legend
-        if self.vials > 10: ncol = 3
-        elif self.vials > 5: ncol = 2
-        else: ncol=1
-        
-        ## Setting labels
-        label_y,label_x = '(pixels)','Frames'
-        if self.convert_to_cm_sec: 
-            label_x,label_y = 'Seconds','(cm)'
-        labels = ['Mean vertical position over time','Mean y-position %s' % label_y,label_x]
-        axes[2].set(title = labels[0], ylabel=labels[1],xlabel=labels[2]) 
-        axes[2].legend(frameon=False, fontsize='x-small', ncol=ncol)   
-
-        return
\ No newline at end of file
+            ## Setting labels
+            label_y,label_x = '(pixels)','Frames'
+            if convert_to_cm_sec: 
+                label_x,label_y = 'Seconds','(cm)'
+            labels = ['Mean vertical position over time','Mean y-position %s' % label_y,label_x]
+            axes[2].set(title = labels[0], ylabel=labels[1],xlabel=labels[2]) 
+            axes[2].legend(frameon=False, fontsize='x-small', ncol=ncol)   
+            return
+        yield 'Parameter testing complete', draw_regressions
+        return
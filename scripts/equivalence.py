@@ -0,0 +1,302 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+## File name : equivalence.py
+## Created by: Adam N. Spierer
+## Date      : October 2026
+## Purpose   : Checks that an alternative engine (faster decoding, background, detection,
+##              or regression code) gives the same spots and slopes as the reference detector
+
+import io
+import os
+import sys
+import glob
+import json
+import shutil
+import argparse
+import tempfile
+import importlib
+import contextlib
+
+import numpy as np
+
+## Largest allowed absolute difference for each spot column (from raw.csv)
+spot_tolerances = {'x':0.01, 'y':0.01, 'mass':1, 'size':0.001, 'ecc':0.001, 'signal':0.01,
+                   'raw_mass':1, 'ep':0.1, 'vial':0}
+
+## Largest allowed absolute difference for each slopes column, by vial
+slope_tolerances = {'slope':1e-4, 'r_value':1e-4, 'first_frame':0, 'last_frame':0}
+
+## Intermediate arrays compared if both engines keep them, with their tolerance
+array_tolerances = {'image_stack':0, 'clean_stack':1e-6, 'background':0, 'spot_stack':1e-6}
+
+## Spots in the same frame closer than this (pixels) are considered the same spot
+match_radius = 1.
+
+## Repository folder, holding example/ and example_other/
+repository = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def load_engine(spec):
+    '''Imports an engine class from 'module:Class' (e.g. 'detector:detector'). The module
+    can be a module name or a path to a .py file.'''
+    module, name = spec.rsplit(':',1)
+    if module.endswith('.py'):
+        sys.path.insert(0, os.path.dirname(os.path.abspath(module)))
+        module = os.path.splitext(os.path.basename(module))[0]
+    return getattr(importlib.import_module(module), name)
+
+def config_suffixes(config_file):
+    '''Video suffix(es) listed in a configuration file'''
+    suffixes = ('h264',)
+    with open(config_file) as f:
+        for line in f:
+            if line.startswith('file_suffix'):
+                suffixes = eval(line.split('=',1)[1])
+    f.close()
+    if isinstance(suffixes, str): suffixes = (suffixes,)
+    return suffixes
+
+def bundled_inputs(root = repository):
+    '''Video and configuration file pairs of the bundled examples (example/ and
+    example_other/ex_*), the first video with a configured suffix in each folder'''
+    inputs = []
+    folders = [os.path.join(root, 'example')] + sorted(glob.glob(os.path.join(root, 'example_other', 'ex_*')))
+    for folder in folders:
+        for config_file in sorted(glob.glob(os.path.join(folder, '*.cfg'))):
+            suffixes = config_suffixes(config_file)
+            for suffix in suffixes:
+                videos = sorted(glob.glob(os.path.join(folder, '*.' + suffix)))
+                if len(videos) > 0:
+                    inputs.append((videos[0], config_file))
+                    break
+            else:
+                print('!! Skipping %s, no video with suffix %s' % (config_file, suffixes))
+    return inputs
+
+def run_engine(engine, video_file, config_file, work_dir, verbose = False):
+    '''Runs steps 1-7 of an engine on a copy of the video, so outputs next to the original
+    are not overwritten
+    ----
+    Inputs:
+      engine (class): Detector class, created with (video_file, config_file)
+      video_file (str): Path to video file
+      config_file (str): Path to configuration file
+      work_dir (str): Folder for the copy and its outputs
+      verbose (bool): True prints the engine's output
+    ----
+    Returns:
+      d (object): Engine after step 7'''
+    if not os.path.isdir(work_dir): os.makedirs(work_dir)
+    copy = os.path.join(work_dir, os.path.basename(video_file))
+    shutil.copy(video_file, copy)
+    output = sys.stdout if verbose else io.StringIO()
+    with contextlib.redirect_stdout(output):
+        d = engine(video_file = copy, config_file = config_file)
+        for step in ['step_1','step_2','step_3','step_4','step_5','step_6','step_7']:
+            getattr(d, step)()
+    return d
+
+def compare_arrays(reference, candidate, tolerances = array_tolerances):
+    '''Largest absolute difference of intermediate arrays kept by both engines'''
+    report = dict()
+    for name in tolerances.keys():
+        a, b = getattr(reference, name, None), getattr(candidate, name, None)
+        if a is None or b is None: continue
+        if np.shape(a) != np.shape(b):
+            report[name] = {'shape':[list(np.shape(a)), list(np.shape(b))], 'pass':False}
+            continue
+        diff = float(np.max(np.abs(np.asarray(a, float) - np.asarray(b, float)))) if np.size(a) else 0.
+        report[name] = {'max_diff':diff, 'pass':diff <= tolerances[name]}
+    return report
+
+def compare_spots(reference, candidate, tolerances = spot_tolerances, radius = match_radius):
+    '''Matches spots frame by frame, one to one (closest total distance, pairs within
+    'radius' pixels), and reports unmatched spots and the largest difference of each column
+    between matched spots
+    ----
+    Inputs:
+      reference, candidate (DataFrame): df_big of each engine
+      tolerances (dict): Largest allowed absolute difference by column
+      radius (float): Matching distance (pixels)
+    ----
+    Returns:
+      report (dict): Spot counts, unmatched spots, and max difference by column'''
+    from scipy.spatial import distance_matrix
+    from scipy.optimize import linear_sum_assignment
+    columns = [item for item in tolerances.keys() if item in reference.columns and item in candidate.columns]
+    pairs = []
+    ref_frames, can_frames = reference.groupby('frame'), candidate.groupby('frame')
+    can_keys = set(can_frames.groups.keys())
+    for frame, ref in ref_frames:
+        if frame not in can_keys: continue
+        can = can_frames.get_group(frame)
+        distance = distance_matrix(ref[['x','y']].values, can[['x','y']].values)
+        ## Pairs farther apart than the radius cost more than any set of close pairs
+        rows, cols = linear_sum_assignment(np.where(distance <= radius, distance, radius * (distance.size + 1)))
+        found = distance[rows, cols] <= radius
+        rows, cols = rows[found], cols[found]
+        pairs.append((ref[columns].values[rows].astype(float), can[columns].values[cols].astype(float)))
+    matched = sum([len(a) for a,b in pairs])
+    unmatched = int(reference.shape[0] - matched)
+    unmatched_candidate = candidate.shape[0] - matched
+
+    report = {'reference':int(reference.shape[0]), 'candidate':int(candidate.shape[0]),
+              'unmatched_reference':unmatched, 'unmatched_candidate':int(unmatched_candidate), 'columns':dict()}
+    if len(pairs) > 0:
+        a, b = np.vstack([a for a,b in pairs]), np.vstack([b for a,b in pairs])
+        for i,column in enumerate(columns):
+            diff = np.nanmax(np.abs(a[:,i] - b[:,i])) if a.shape[0] else 0.
+            report['columns'][column] = {'max_diff':float(diff), 'pass':bool(diff <= tolerances[column])}
+    report['pass'] = unmatched == 0 and unmatched_candidate == 0 and all([item['pass'] for item in report['columns'].values()])
+    return report
+
+def compare_slopes(reference, candidate, tolerances = slope_tolerances):
+    '''Differences of the slopes file columns, by vial
+    ----
+    Inputs:
+      reference, candidate (DataFrame): df_slopes of each engine
+      tolerances (dict): Largest allowed absolute difference by column
+    ----
+    Returns:
+      report (dict): Differences by vial_ID and column'''
+    ref, can = reference.set_index('vial_ID'), candidate.set_index('vial_ID')
+    report = {'vials':dict(), 'missing':sorted(set(ref.index).symmetric_difference(can.index))}
+    for vial in ref.index:
+        if vial not in can.index: continue
+        report['vials'][vial] = dict()
+        for column in tolerances.keys():
+            diff = abs(float(ref.loc[vial, column]) - float(can.loc[vial, column]))
+            report['vials'][vial][column] = {'reference':float(ref.loc[vial, column]),
+                                             'candidate':float(can.loc[vial, column]),
+                                             'diff':diff, 'pass':bool(diff <= tolerances[column])}
+    report['pass'] = len(report['missing']) == 0 and all([item['pass'] for vial in report['vials'].values() for item in vial.values()])
+    return report
+
+def compare(reference, candidate, inputs, work_dir = None, verbose = False):
+    '''Runs the reference and candidate engines on each input and compares them
+    ----
+    Inputs:
+      reference, candidate (class): Engine classes
+      inputs (list): (video_file, config_file) pairs
+      work_dir (str): Folder for copies and outputs, default is a temporary folder
+      verbose (bool): True prints each engine's output
+    ----
+    Returns:
+      reports (list): Report for each input'''
+    cleanup = work_dir == None
+    if cleanup: work_dir = tempfile.mkdtemp(prefix='freeclimber_equivalence_')
+    reports = []
+    try:
+        for i,(video_file, config_file) in enumerate(inputs):
+            print('== [%s || %s] %s' % (i + 1, len(inputs), video_file))
+            ref = run_engine(reference, video_file, config_file, os.path.join(work_dir, str(i), 'reference'), verbose)
+            can = run_engine(candidate, video_file, config_file, os.path.join(work_dir, str(i), 'candidate'), verbose)
+            report = {'video':video_file, 'config':config_file,
+                      'arrays':compare_arrays(ref, can),
+                      'spots':compare_spots(ref.df_big, can.df_big),
+                      'slopes':compare_slopes(ref.df_slopes, can.df_slopes)}
+            report['pass'] = report['spots']['pass'] and report['slopes']['pass'] and \
+                             all([item['pass'] for item in report['arrays'].values()])
+            print_report(report)
+            reports.append(report)
+    finally:
+        if cleanup: shutil.rmtree(work_dir, ignore_errors = True)
+    return reports
+
+def print_report(report):
+    '''Prints the comparison of one input'''
+    status = lambda x: 'ok' if x else 'FAIL'
+    for name, item in report['arrays'].items():
+        print('    array %-12s max diff %-12s %s' % (name, item.get('max_diff', item.get('shape')), status(item['pass'])))
+    spots = report['spots']
+    print('    spots: %s reference, %s candidate, %s/%s unmatched' % (spots['reference'], spots['candidate'],
+                                                                     spots['unmatched_reference'], spots['unmatched_candidate']))
+    for column, item in spots['columns'].items():
+        print('    spot  %-12s max diff %-12.6g %s' % (column, item['max_diff'], status(item['pass'])))
+    if len(report['slopes']['missing']) > 0: print('    vials missing in one engine:', report['slopes']['missing'])
+    for vial, columns in report['slopes']['vials'].items():
+        print('    vial  %-16s ' % vial + '  '.join(['%s %+.4g %s' % (column, item['candidate'] - item['reference'], status(item['pass']))
+                                                     for column, item in columns.items()]))
+    print('    ----> %s' % ('EQUIVALENT' if report['pass'] else 'DIFFERENT'))
+    return
+
+def define_argument_parser():
+    '''Defines arguments to be parsed, via argparse module.
+    ----
+    Inputs:
+      None
+    ----
+    Returns:
+      args (object): Namespace object containing the flags and arguments passed to program
+    '''
+    parser = argparse.ArgumentParser(prog='FreeClimber',
+                                    description='equivalence.py - Compares the spots and slopes of an alternative engine with the reference detector',
+                                    epilog='For documentation and a tutorial, see https://github.com/adamspierer/FreeClimber',
+                                    allow_abbrev=False)
+    parser.add_argument('--engine',
+                        type=str,
+                        required=True,
+                        help="Engine to test as 'module:Class' (module name or path to a .py file)")
+    parser.add_argument('--reference',
+                        type=str,
+                        default='detector:detector',
+                        help="Reference engine (default = detector:detector)")
+    parser.add_argument('--inputs',
+                        nargs='+',
+                        default=None,
+                        help="'video:config' pairs to compare (default = bundled example videos)")
+    parser.add_argument('--synthetic',
+                        default=False,
+                        action='store_true',
+                        help="Also compares the default synthetic video from benchmark.py")
+    parser.add_argument('--tolerance',
+                        nargs='+',
+                        default=[],
+                        help="Overrides tolerances as column=value, e.g. 'slope=1e-3 x=0.05'")
+    parser.add_argument('--work_dir',
+                        type=str,
+                        default=None,
+                        help="Keeps the outputs of each engine in this folder (default = temporary folder)")
+    parser.add_argument('--save_file',
+                        type=str,
+                        default=None,
+                        help="Saves the report as a .json file")
+    parser.add_argument('--verbose',
+                        default=False,
+                        action='store_true',
+                        help="Prints each engine's output")
+    args = parser.parse_args()
+    return args
+
+def main():
+    '''Compares two engines, exits with status 1 if they differ'''
+    args = define_argument_parser()
+
+    ## Applying tolerance overrides
+    for item in args.tolerance:
+        column, value = item.split('=')
+        for tolerances in [spot_tolerances, slope_tolerances, array_tolerances]:
+            if column in tolerances: tolerances[column] = float(value)
+
+    if args.inputs == None: inputs = bundled_inputs()
+    else: inputs = [tuple(item.rsplit(':',1)) for item in args.inputs]
+    if args.synthetic:
+        import benchmark
+        work_dir = args.work_dir if args.work_dir != None else tempfile.gettempdir()
+        inputs.append(benchmark.generate(os.path.join(work_dir, 'synthetic'))[:2])
+
+    reports = compare(load_engine(args.reference), load_engine(args.engine), inputs,
+                      work_dir = args.work_dir, verbose = args.verbose)
+    passed = sum([report['pass'] for report in reports])
+    print('\n%s of %s inputs equivalent' % (passed, len(reports)))
+
+    if args.save_file != None:
+        with open(args.save_file,'w') as f:
+            json.dump(reports, f, indent = 1)
+        f.close()
+        print('Saved:', args.save_file)
+    if passed < len(reports): raise SystemExit(1)
+    return
+
+if __name__ == '__main__':
+    main()
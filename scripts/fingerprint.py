@@ -0,0 +1,181 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+## File name : fingerprint.py
+## Created by: Adam N. Spierer
+## Date      : October 2026
+## Purpose   : Groups recordings that hold the same video in different containers (.h264,
+##              .mp4, .avi, .mov) so a batch only processes each recording once
+
+import os
+import shutil
+import argparse
+
+import ffmpeg
+import numpy as np
+
+## Default fingerprint settings
+samples = 8        # Number of frames sampled from each video
+step = 15          # Sample every n-th decoded frame
+hash_size = 16     # Width of the downscaled frame; height is 3/4 of the width
+tolerance = 0.1    # Maximum fraction of differing hash bits for two videos to match
+
+## Artifacts that are linked from a processed recording to its duplicates
+file_suffixes = ['.raw.csv','.filtered.csv','.diagnostic.png','.ROI.png',
+                 '.processed.png','.spot_check.png']
+
+def video_fingerprint(file, samples = samples, step = step, hash_size = hash_size):
+    '''Creates a perceptual fingerprint from a handful of decoded frames. Frames are
+    sampled by index, downscaled and grayscaled by FFmpeg, and each one is reduced to a
+    difference hash (is each pixel brighter than its right-hand neighbor), so the same
+    recording in a different container or encoding produces (nearly) the same bits.
+    ----
+    Inputs:
+      file (str): Path to video file
+      samples (int): Number of frames to sample
+      step (int): Sample every n-th frame, starting with the first
+      hash_size (int): Width of the downscaled frame
+    ----
+    Returns:
+      bits (nd-array): Boolean array of fingerprint bits, or None if unreadable
+    '''
+    width, height = hash_size + 1, int(hash_size * 3 / 4)
+    try:
+        out,err = (ffmpeg
+                   .input(file)
+                   .filter('select','not(mod(n,%s))' % step)
+                   .filter('scale',width,height)
+                   .output('pipe:', format='rawvideo', pix_fmt='gray',
+                           vsync=0, vframes=samples, loglevel='panic')
+                   .run(capture_stdout=True))
+    except:
+        print('!! Could not fingerprint %s' % file)
+        return None
+
+    frames = np.frombuffer(out, np.uint8).reshape([-1, height, width]).astype(int)
+    if frames.shape[0] == 0: return None
+    bits = frames[:,:,1:] > frames[:,:,:-1]
+    return bits.ravel()
+
+def hamming(bits_1, bits_2):
+    '''Fraction of differing bits between two fingerprints, 1 if they are not comparable'''
+    if bits_1 is None or bits_2 is None or bits_1.shape != bits_2.shape:
+        return 1.
+    return np.count_nonzero(bits_1 != bits_2) / bits_1.size
+
+def group_recordings(file_list, tolerance = tolerance, prefer = None, debug = False, **kwargs):
+    '''Groups videos whose fingerprints match within a tolerance. The first file of each
+    group is the one to process: files are ordered by their suffix in 'prefer', then by path.
+    ----
+    Inputs:
+      file_list (list): Video file paths
+      tolerance (float): Maximum fraction of differing bits to count as a duplicate
+      prefer (str or list): Suffix(es) of the container to process first, in order
+      debug (bool): Prints each fingerprint distance
+      **kwargs: Keyword arguments passed to video_fingerprint
+    ----
+    Returns:
+      groups (list): List of lists of file paths, each starting with the file to process
+    '''
+    ## Ranking files by the position of their suffix in 'prefer'
+    if prefer == None: prefer = []
+    elif isinstance(prefer, str): prefer = [prefer]
+    def rank(item):
+        for i,suffix in enumerate(prefer):
+            if item.endswith(suffix): return (i, item)
+        return (len(prefer), item)
+
+    groups, prints = [], []
+    for file in sorted(file_list, key = rank):
+        bits = video_fingerprint(file, **kwargs)
+        for group, reference in zip(groups, prints):
+            distance = hamming(bits, reference)
+            if debug: print('fingerprint.group_recordings:', file, group[0], round(distance,3))
+            if distance <= tolerance:
+                group.append(file)
+                break
+        else:
+            groups.append([file])
+            prints.append(bits)
+    return groups
+
+def link_results(source, target, naming_convention = None, vial_id_vars = None):
+    '''Reuses the outputs of a processed video for its duplicate. Artifacts are hard
+    linked (copied if linking fails) to the duplicate's name, and the .slopes.csv file is
+    rewritten so experimental details match the duplicate's file name.
+    ----
+    Inputs:
+      source (str): Path to the processed video
+      target (str): Path to the duplicate video
+      naming_convention (str): Naming convention from the configuration file
+      vial_id_vars (int): Number of naming convention fields in the vial_ID
+    ----
+    Returns:
+      None'''
+    source_noext = os.path.splitext(source)[0]
+    target_noext = os.path.splitext(target)[0]
+
+    ## Same stem in the same folder, the outputs are already shared
+    if source_noext == target_noext: return
+
+    for suffix in file_suffixes:
+        if not os.path.isfile(source_noext + suffix): continue
+        if os.path.isfile(target_noext + suffix): os.remove(target_noext + suffix)
+        try: os.link(source_noext + suffix, target_noext + suffix)
+        except: shutil.copy(source_noext + suffix, target_noext + suffix)
+
+    ## Rewriting the experimental details in the slopes file
+    from pandas import read_csv
+    df = read_csv(source_noext + '.slopes.csv')
+    if naming_convention != None:
+        name = os.path.split(target_noext)[1]
+        details = dict(zip(naming_convention.split('_'), name.split('_')))
+
+        ## Only rows named after the video, keeping the rest of the vial_ID (e.g. a region of
+        ##    interest's label); regions with their own 'name' are left as they are
+        prefix_source = '_'.join(os.path.split(source_noext)[1].split('_')[:vial_id_vars]) + '_'
+        prefix_target = '_'.join(name.split('_')[:vial_id_vars]) + '_'
+        from_video = df.vial_ID.astype(str).str.startswith(prefix_source)
+        for item in details.keys():
+            if item in df.columns:
+                df[item] = df[item].astype(object)
+                df.loc[from_video, item] = details[item]
+        df['vial_ID'] = [prefix_target + item[len(prefix_source):] if video else item
+                         for item, video in zip(df.vial_ID.astype(str), from_video)]
+    df.to_csv(target_noext + '.slopes.csv', index=False)
+    return
+
+def define_argument_parser():
+    '''Defines arguments to be parsed, via argparse module.
+    ----
+    Inputs:
+      None
+    ----
+    Returns:
+      args (object): Namespace object containing the flags and arguments passed to program
+    '''
+    parser = argparse.ArgumentParser(prog='FreeClimber',
+                                    description='fingerprint.py - Groups videos that contain the same recording in different containers',
+                                    epilog='For documentation and a tutorial, see https://github.com/adamspierer/FreeClimber',
+                                    allow_abbrev=False)
+    parser.add_argument('files',
+                        nargs='+',
+                        help="Video files to compare")
+    parser.add_argument('--tolerance',
+                        type=float,
+                        default=tolerance,
+                        help="Fraction of fingerprint bits allowed to differ (default = %s)" % tolerance)
+    args = parser.parse_args()
+    return args
+
+def main():
+    '''Prints the groups of duplicate recordings'''
+    args = define_argument_parser()
+    for group in group_recordings(args.files, tolerance = args.tolerance):
+        print(group[0])
+        for item in group[1:]:
+            print('    duplicate:', item)
+    return
+
+if __name__ == '__main__':
+    main()
@@ -7,7 +7,6 @@
 ##              parent folder and extract all files with a common suffix
 
 ## Import modules
-from numpy import unique
 from os import walk,path
 import argparse
 from datetime import datetime
@@ -21,7 +20,8 @@ def define_argument_parser():
     Takes in arguments for the file suffix (suffix) to look for in the parent folder 
       (parent_folder). Other arguments to search for files without a '.slopes.csv' 
       counterpart (undone) and two output methods: print to command line (print_files)
-      and save the processed file (save_files; as custom.prc).
+      and save the processed file (save_files; as custom.prc). The index flag queries the
+      persistent project index (see project_index.py) rather than walking the folder.
     ----
     Inputs:
       None
@@ -52,6 +52,11 @@ def define_argument_parser():
                         action='store_true', 
                         help="Gather all undone files")
 
+    parser.add_argument('--index', 
+                        default=False,
+                        action='store_true', 
+                        help="Uses the persistent project index (log/index.sqlite) instead of walking parent_folder")
+
     parser.add_argument('--save_files', 
                         default=False,
                         action='store_true', 
@@ -94,7 +99,7 @@ def file_walker(folder = None, endswith = None, undone = None):
 
     ## Return a sorted list of all files with the file suffix
     if undone == False:
-        _list = sorted(unique(_list1))
+        _list = sorted(set(_list1))
         return _list
 
     ## Return a sorted list of all undone files            
@@ -152,7 +157,12 @@ def main():
     args = define_argument_parser()
     
     ## Search through the parent folder, looking for files w/ suffix. Option for undone files
-    if path.isdir(args.parent_folder): 
+    if path.isdir(args.parent_folder) and args.index:
+        from project_index import project_index
+        file_list = project_index(args.parent_folder).file_walker(endswith = args.suffix,
+                                                                  undone = args.undone)
+        print('\n')
+    elif path.isdir(args.parent_folder): 
         file_list = file_walker(folder = args.parent_folder,
                                 endswith = args.suffix,
                                 undone = args.undone)
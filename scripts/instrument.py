@@ -0,0 +1,168 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+## File name : instrument.py
+## Created by: Adam N. Spierer
+## Date      : October 2026
+## Purpose   : Records wall time, CPU time, memory, frames, and spots for each detector
+##              step and sub-stage as JSON lines, and summarizes them across a batch
+
+import os
+import sys
+import json
+import socket
+import argparse
+import functools
+from time import time, process_time, strftime
+from contextlib import contextmanager
+
+## Peak resident memory is only available on Unix-like systems
+try: import resource
+except ImportError: resource = None
+
+## Default location of the records, relative to the project folder
+records_name = os.path.join('log','stages.jsonl')
+
+def peak_rss():
+    '''Peak resident memory of this process so far, in MB (None if unavailable)'''
+    if resource == None: return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin': return peak / 1024. ** 2 # Bytes on macOS
+    return peak / 1024. # Kilobytes on Linux
+
+class recorder(object):
+    '''Times nested stages of processing a video. Each stage is written as one JSON line
+    when it ends: its name (nested stages joined with '/'), wall and CPU seconds, the
+    process's peak resident memory and how much the stage raised it, and the frames and
+    spots it handled (if set on the record). A recorder without a path does nothing, so
+    the detector can always use one.
+    '''
+    def __init__(self, path = None, video = None):
+        '''Sets up the recorder
+        ----
+        Inputs:
+          path (str): Path to the JSON lines file records are appended to, None disables recording
+          video (str): Video file the records belong to
+        ----
+        Returns:
+          None'''
+        self.path = path
+        self.video = video
+        self.stack = []
+        if self.path != None and not os.path.isdir(os.path.dirname(os.path.abspath(self.path))):
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)))
+        return
+
+    @contextmanager
+    def stage(self, name, frames = None, spots = None):
+        '''Context manager timing one stage. The yielded record (dict) can be updated with
+        'frames' and 'spots' before the stage ends.
+        ----
+        Inputs:
+          name (str): Stage name
+          frames (int): Frames processed, if known at the start
+          spots (int): Spots produced, if known at the start
+        ----
+        Returns:
+          record (dict): Record of the stage'''
+        record = {'frames':frames, 'spots':spots}
+        if self.path == None:
+            yield record
+            return
+
+        self.stack.append(name)
+        record['stage'] = '/'.join(self.stack)
+        wall, cpu, peak = time(), process_time(), peak_rss()
+        try:
+            yield record
+        finally:
+            self.stack.pop()
+            record['wall_s'] = round(time() - wall, 4)
+            record['cpu_s'] = round(process_time() - cpu, 4)
+            record['peak_rss_mb'] = peak_rss()
+            if peak != None: record['rss_growth_mb'] = round(record['peak_rss_mb'] - peak, 1)
+            self.write(record)
+        return
+
+    def write(self, record):
+        '''Appends a record as a single JSON line (one write, so concurrent workers do not interleave)'''
+        record.update({'video':self.video, 'host':socket.gethostname(), 'pid':os.getpid(),
+                       'time':strftime('%Y-%m-%dT%H:%M:%S')})
+        with open(self.path,'a') as f:
+            f.write(json.dumps(record) + '\n')
+        f.close()
+        return
+
+def timed(name, spots = None):
+    '''Decorator timing a detector method as a stage with the detector's recorder. Frames
+    and spots are read from the detector once the method returns, spots with a function
+    counting those the method produced (e.g. lambda d: d.df_filtered.shape[0]), None leaves them out.'''
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(self, *args, **kwargs):
+            with self.recorder.stage(name) as record:
+                result = function(self, *args, **kwargs)
+                if hasattr(self, 'spot_stack'): record['frames'] = len(self.spot_stack)
+                if spots != None: record['spots'] = int(spots(self))
+            return result
+        return wrapper
+    return decorator
+
+def summarize(path, depth = None):
+    '''Totals the records in a stages file by stage
+    ----
+    Inputs:
+      path (str): Path to a stages (.jsonl) file
+      depth (int): Only include stages nested at most this deep (1 = whole videos/steps)
+    ----
+    Returns:
+      summary (list): (stage, count, total wall, mean wall, total cpu, max peak RSS) by
+                      descending total wall time'''
+    totals = dict()
+    with open(path) as f:
+        for line in f:
+            try: record = json.loads(line)
+            except ValueError: continue
+            stage = record['stage']
+            if depth != None and stage.count('/') >= depth: continue
+            count, wall, cpu, rss = totals.get(stage, (0, 0., 0., 0.))
+            totals[stage] = (count + 1, wall + record['wall_s'], cpu + record['cpu_s'],
+                             max(rss, record.get('peak_rss_mb') or 0))
+    f.close()
+    summary = [(stage, count, wall, wall / count, cpu, rss) for stage, (count, wall, cpu, rss) in totals.items()]
+    return sorted(summary, key = lambda x: -x[2])
+
+def define_argument_parser():
+    '''Defines arguments to be parsed, via argparse module.
+    ----
+    Inputs:
+      None
+    ----
+    Returns:
+      args (object): Namespace object containing the flags and arguments passed to program
+    '''
+    parser = argparse.ArgumentParser(prog='FreeClimber',
+                                    description='instrument.py - Summarizes the stage records written with --instrument',
+                                    epilog='For documentation and a tutorial, see https://github.com/adamspierer/FreeClimber',
+                                    allow_abbrev=False)
+    parser.add_argument('stages_file',
+                        help="Path to a stages file (e.g. <path_project>/log/stages.jsonl)")
+    parser.add_argument('--depth',
+                        type=int,
+                        default=None,
+                        help="Only include stages nested at most this deep (1 = videos, 2 = steps)")
+    args = parser.parse_args()
+    return args
+
+def main():
+    '''Prints the time spent in each stage'''
+    args = define_argument_parser()
+    summary = summarize(args.stages_file, depth = args.depth)
+    total = sum([item[2] for item in summary if '/' not in item[0]]) or 1
+    print('%-40s %6s %10s %9s %10s %8s %9s' % ('stage','count','wall (s)','mean (s)','cpu (s)','% wall','peak MB'))
+    for stage, count, wall, mean, cpu, rss in summary:
+        print('%-40s %6d %10.1f %9.2f %10.1f %8.1f %9.0f' % (stage, count, wall, mean, cpu, 100 * wall / total, rss))
+    return
+
+if __name__ == '__main__':
+    main()
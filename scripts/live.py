@@ -0,0 +1,417 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+## File name : live.py
+## Created by: Adam N. Spierer
+## Date      : October 2026
+## Purpose   : Reads raw frames from a camera process (stdin or a FIFO) and detects spots as
+##              the frames arrive, with running velocity estimates and the final slopes as
+##              soon as the last frame of the trial is in. Can stop early once every vial's
+##              most linear window has been found
+
+import os
+import sys
+import argparse
+from time import time
+
+import api
+from detector import ffmpeg, np, pd, tp
+
+## Bytes per pixel of the raw frame formats that can be read
+pixel_formats = {'gray':1, 'rgb24':3}
+
+## Running sums kept for each frame and vial: frames, x, y, x*x, x*y, y*y
+n_sums = 6
+
+def video_frames(video_file):
+    '''Decodes a video file with FFmpeg one frame at a time, so decoding stops when the
+    frames are no longer read
+    ----
+    Inputs:
+      video_file (str): Path to video file
+    ----
+    Returns:
+      frames (generator): Frames as (height, width, 3) uint8 arrays'''
+    probe = ffmpeg.probe(video_file)
+    video_info = next(x for x in probe['streams'] if x['codec_type'] == 'video')
+    width, height = int(video_info['width']), int(video_info['height'])
+    process = (ffmpeg
+               .input(video_file)
+               .output('pipe:', format='rawvideo', pix_fmt='rgb24', loglevel='panic')
+               .run_async(pipe_stdout=True))
+    try:
+        for frame in read_frames(process.stdout, width, height, 'rgb24'): yield frame
+    finally:
+        process.stdout.close()
+        process.terminate()
+        process.wait()
+    return
+
+def read_frames(file, width, height, pix_fmt = 'gray'):
+    '''Reads raw frames from a binary stream until it ends
+    ----
+    Inputs:
+      file (file): Binary stream, e.g. sys.stdin.buffer or an opened FIFO
+      width (int): Frame width in pixels
+      height (int): Frame height in pixels
+      pix_fmt (str): 'gray' (1 byte per pixel) or 'rgb24' (3 bytes per pixel)
+    ----
+    Returns:
+      frames (generator): Frames as (height, width) or (height, width, 3) uint8 arrays'''
+    shape = (height, width) if pix_fmt == 'gray' else (height, width, 3)
+    size = width * height * pixel_formats[pix_fmt]
+    while True:
+        frame = bytearray(size)
+        view, read = memoryview(frame), 0
+        while read < size:
+            n = file.readinto(view[read:])
+            if not n: break
+            read += n
+        if read < size:
+            if read > 0: print('!! Ignoring an incomplete last frame (%s of %s bytes)' % (read, size))
+            return
+        yield np.frombuffer(frame, np.uint8).reshape(shape)
+
+class live_detector(api.array_detector):
+    '''Detector processing one frame at a time. Frames are cropped and converted to
+    grayscale as they arrive and held until the background frames (blank_0 to blank_n)
+    are in, then spots are located frame by frame. The final slopes use the same steps
+    and spots as the file-based detector, so they are identical.
+
+    Running estimates use per-frame sums of the spots in each vial, with the vials binned
+    and the signal threshold set once from the spots of the first frames. The sliding
+    window ending at each new frame is regressed from cumulative sums, so updating the
+    best window costs the same for every frame.
+
+    With a margin, reading stops early once no vial has had a window within the margin
+    of its best r for a full window length (e.g. after the flies reached the top). This is
+    a heuristic, not a guarantee that no later window would have been better. The
+    final slopes then only consider windows up to that frame, and the threshold and vial
+    bins are set from the frames read, so they can differ slightly from a full run.
+    '''
+    def __init__(self, parameters, width, height, pix_fmt = 'gray', name = 'live', update = 1., margin = None, **kwargs):
+        '''Sets up the detector
+        ----
+        Inputs:
+          parameters (dict): Detector variables, as in a configuration file
+          width (int): Frame width in pixels
+          height (int): Frame height in pixels
+          pix_fmt (str): 'gray' or 'rgb24'
+          name (str): Name of the video, parsed with naming_convention
+          update (float): Seconds of video between running estimates
+          margin (float): Stops once no window is within this margin of each vial's best r,
+                          None reads until crop_n
+          **kwargs: Passed to api.array_detector (debug, recorder, profiler)
+        ----
+        Returns:
+          None'''
+        shape = (0, height, width) if pix_fmt == 'gray' else (0, height, width, 3)
+        api.array_detector.__init__(self, np.empty(shape, np.uint8), parameters, name = name, **kwargs)
+        tp.quiet()
+        self.n_frames = 0
+        self.buffer, self.features = [], []
+        self.spot_stack = self.features # Spots by frame, in place of the image stack
+        self.background = None
+
+        ## Running estimates
+        self.update_frames = max(1, int(round(update * self.frame_rate)))
+        self.live_bins, self.live_threshold = None, None
+        self.sums = []
+        self.best = dict()
+        self.margin, self.behind = margin, dict()
+        self.stopped_early = False
+        return
+
+    def clean(self, frame):
+        '''Crops a frame to the region of interest and converts it to grayscale, as
+        crop_and_grayscale'''
+        x, y = self.x, self.y
+        x_max, y_max = int(x + self.w), int(y + self.h)
+        if frame.ndim == 2: return frame[y : y_max, x : x_max].astype(float)
+        ch_1 = 0.2989 * frame[y : y_max, x : x_max, 0]
+        ch_2 = 0.5870 * frame[y : y_max, x : x_max, 1]
+        ch_3 = 0.1140 * frame[y : y_max, x : x_max, 2]
+        return ch_1.astype(float) + ch_2.astype(float) + ch_3.astype(float)
+
+    def add_frame(self, frame):
+        '''Adds the next frame of the video
+        ----
+        Inputs:
+          frame (array): Raw frame, (height, width) grayscale or (height, width, 3) RGB
+        ----
+        Returns:
+          more (bool): False once the last frame (crop_n) of the trial is in, or the
+                       windows are resolved (with a margin)'''
+        index = self.n_frames
+        self.n_frames += 1
+        if index < self.crop_0: return True
+        if index >= self.crop_n: return False
+
+        ## Frames are held until the background can be made, as in subtract_background
+        self.buffer.append(self.clean(frame))
+        if self.background is None and len(self.buffer) >= self.blank_n:
+            self.make_background()
+        if self.background is not None:
+            for image in self.buffer: self.detect(image)
+            self.buffer = []
+        if self.resolved():
+            self.stopped_early = self.n_frames < self.crop_n
+            return False
+        return self.n_frames < self.crop_n
+
+    def make_background(self):
+        '''Makes the null background image from the frames held so far'''
+        if self.debug: print('live_detector.make_background')
+        stack = np.array(self.buffer)
+        self.background = np.median(stack[self.blank_0:self.blank_n,:,:].astype(float), axis=0).astype(int)
+        return
+
+    def detect(self, image):
+        '''Locates the spots in the next frame, as trackpy.batch, and updates the estimates'''
+        frame = len(self.features)
+        spots = tp.locate(np.subtract(image, self.background), diameter = self.diameter, invert = True,
+                          minmass = self.minmass, maxsize = self.maxsize)
+        spots['frame'] = frame
+        self.features.append(spots)
+
+        ## Vials and threshold for the estimates are set once there are enough frames
+        if self.live_bins is None:
+            if frame + 1 == self.update_frames:
+                self.set_live_vials()
+                for i in range(frame + 1): self.aggregate(i)
+                self.print_estimates()
+            return
+        self.aggregate(frame)
+        if (frame + 1) % self.update_frames == 0: self.print_estimates()
+        return
+
+    def live_spots(self, spots):
+        '''Spots passing the signal and eccentricity filters of the running estimates'''
+        keep = (spots.raw_mass > 0) & (spots.ecc >= self.ecc_low) & (spots.ecc <= self.ecc_high)
+        if self.live_threshold != None: keep = keep & (spots.signal >= self.live_threshold)
+        return spots[keep]
+
+    def set_live_vials(self):
+        '''Sets the signal threshold and vial boundaries of the running estimates from the
+        spots found so far'''
+        spots = pd.concat(self.features)
+        if self.threshold == 'auto':
+            try: self.live_threshold = self.find_threshold(spots.signal)
+            except (ValueError, IndexError): self.live_threshold = None
+        else: self.live_threshold = self.threshold
+        spots = self.live_spots(spots)
+        if self.vials == 1 or spots.shape[0] == 0: self.live_bins = np.array([-np.inf, np.inf])
+        else: self.live_bins = pd.cut(spots.x, self.vials, include_lowest = True, retbins = True)[1]
+        self.sums = []
+        return
+
+    def aggregate(self, frame):
+        '''Adds one frame to the cumulative sums of each vial (the last column is all vials)'''
+        spots = self.live_spots(self.features[frame])
+        vials = np.digitize(spots.x, self.live_bins[1:-1]) if self.vials > 1 else np.zeros(len(spots), int)
+        y = self.h - spots.y.values # Plot indexing, as invert_y
+        total, count = np.zeros(self.vials + 1), np.zeros(self.vials + 1)
+        np.add.at(total, vials, y)
+        np.add.at(count, vials, 1)
+        total[-1], count[-1] = y.sum(), len(y)
+
+        sums = np.zeros((n_sums, self.vials + 1))
+        present = count > 0
+        mean = np.divide(total, count, out = np.zeros_like(total), where = present)
+        sums[0], sums[1], sums[2] = present, frame * present, mean
+        sums[3], sums[4], sums[5] = frame ** 2 * present, frame * mean, mean ** 2
+        if len(self.sums) > 0: sums = sums + self.sums[-1]
+        self.sums.append(sums)
+
+        ## Regressing the window ending at this frame
+        start = frame - int(self.window)
+        if start >= 0: self.update_best(start, frame)
+        return
+
+    def update_best(self, start, stop):
+        '''Keeps the window with the greatest r for each vial, and counts the windows
+        since one was within the margin of it (windows too sparse to regress count as behind)'''
+        window = self.sums[stop] - (self.sums[start - 1] if start > 0 else 0)
+        n, sx, sy, sxx, sxy, syy = window
+        with np.errstate(divide = 'ignore', invalid = 'ignore'):
+            slope = (n * sxy - sx * sy) / (n * sxx - sx ** 2)
+            r = (n * sxy - sx * sy) / np.sqrt((n * sxx - sx ** 2) * (n * syy - sy ** 2))
+        for vial in range(self.vials + 1):
+            ## Windows without a regression (e.g. an empty or badly lit vial) do not hold up stopping
+            if n[vial] < 3 or not np.isfinite(r[vial]):
+                self.behind[vial] = self.behind.get(vial, 0) + 1
+                continue
+            if vial not in self.best or r[vial] > self.best[vial][1]:
+                self.best[vial] = (slope[vial] * self.conversion_factor, r[vial], start, stop)
+            if self.margin != None and r[vial] < self.best[vial][1] - self.margin:
+                self.behind[vial] = self.behind.get(vial, 0) + 1
+            else: self.behind[vial] = 0
+        return
+
+    def resolved(self):
+        '''True once, for every vial, a full window length of consecutive windows has fallen
+        short of its best r by more than the margin, or had too few spots to regress. This is
+        a heuristic: a later window could still beat the best, it is only unlikely once the
+        flies have stopped climbing.'''
+        if self.margin == None or self.live_bins is None: return False
+        for vial in range(self.vials + 1):
+            if self.behind.get(vial, 0) < int(self.window): return False
+        return True
+
+    def estimates(self):
+        '''Running estimates of the best window for each vial
+        ----
+        Inputs:
+          None
+        ----
+        Returns:
+          estimates (dict): (slope, r, first_frame, last_frame) by vial, key 'all' for all vials'''
+        keys = list(range(1, self.vials + 1)) + ['all']
+        return {keys[vial]:item for vial, item in sorted(self.best.items())}
+
+    def print_estimates(self):
+        '''Prints the running estimates'''
+        estimates = self.estimates()
+        text = ['%s: %.3f (r = %.3f)' % (vial, slope, r) for vial, (slope, r, first, last) in estimates.items()]
+        print('%6.1f s | %s' % (len(self.features) / self.frame_rate, ' | '.join(text) if len(text) > 0 else 'waiting for a full window'))
+        sys.stdout.flush()
+        return
+
+    def find_spots(self, stack = None, **kwargs):
+        '''Returns the spots located so far, formatted as trackpy.batch and find_spots'''
+        if self.debug: print('live_detector.find_spots')
+        features = [item for item in self.features if len(item) > 0]
+        if len(features) == 0: return pd.DataFrame(columns = ['frame'])
+        spots = pd.concat(features).reset_index(drop = True)
+        spots = spots[spots.raw_mass > 0].sort_values(by='frame')
+        return spots
+
+    def finish(self):
+        '''Runs the remaining steps on the spots of all frames
+        ----
+        Inputs:
+          None
+        ----
+        Returns:
+          results (dict): See api.run(), without 'background' being a video median if the
+                          stream ended before blank_n'''
+        if self.background is None and len(self.buffer) > 0:
+            self.make_background()
+            for image in self.buffer: self.detect(image)
+            self.buffer = []
+
+        ## Only windows within the frames read are regressed
+        if self.stopped_early:
+            self.crop_n = self.crop_0 + len(self.features)
+        self.run_steps([self.step_2, self.step_4, self.step_5, self.step_6, self.step_7])
+        return {'spots':self.df_big, 'filtered':self.df_filtered, 'regressions':self.result,
+                'slopes':self.df_slopes, 'background':self.background}
+
+def define_argument_parser():
+    '''Defines arguments to be parsed, via argparse module.
+    ----
+    Inputs:
+      None
+    ----
+    Returns:
+      args (object): Namespace object containing the flags and arguments passed to program
+    '''
+    parser = argparse.ArgumentParser(prog='FreeClimber',
+                                    description='live.py - Detects spots in raw frames as they are streamed from a camera, with running velocity estimates',
+                                    epilog='For documentation and a tutorial, see https://github.com/adamspierer/FreeClimber',
+                                    allow_abbrev=False)
+    parser.add_argument('--config_file',
+                        type=str,
+                        required=True,
+                        help="Path to configuration file (ends with '.cfg')")
+    parser.add_argument('--width',
+                        type=int,
+                        default=None,
+                        help="Frame width in pixels, required unless reading a --video")
+    parser.add_argument('--height',
+                        type=int,
+                        default=None,
+                        help="Frame height in pixels, required unless reading a --video")
+    parser.add_argument('--pix_fmt',
+                        type=str,
+                        default='gray',
+                        choices=sorted(pixel_formats.keys()),
+                        help="Raw pixel format of the frames (default = gray)")
+    parser.add_argument('--input',
+                        type=str,
+                        default='-',
+                        help="FIFO or file to read frames from, '-' reads from stdin (default = -)")
+    parser.add_argument('--video',
+                        type=str,
+                        default=None,
+                        help="Decodes frames from a video file instead, one at a time (e.g. with --early_stop)")
+    parser.add_argument('--name',
+                        type=str,
+                        default='live',
+                        help="Name of the trial, parsed with naming_convention (default = live)")
+    parser.add_argument('--update',
+                        type=float,
+                        default=1.,
+                        help="Seconds of video between running estimates (default = 1)")
+    parser.add_argument('--early_stop',
+                        type=float,
+                        nargs='?',
+                        const=0.01,
+                        default=None,
+                        help="Stops reading once no window comes within this margin of each vial's best r for a full window length (default margin = 0.01)")
+    parser.add_argument('--save_file',
+                        type=str,
+                        default=None,
+                        help="Saves the final slopes to a .csv file")
+    args = parser.parse_args()
+    return args
+
+def main():
+    '''Reads frames until the end of the trial, then prints the final slopes'''
+    args = define_argument_parser()
+    file = None
+    if args.video != None:
+        frames = video_frames(args.video)
+        try: frame = next(frames, None)
+        except ffmpeg.Error: frame = None # Not a video FFmpeg can read
+        if frame is None:
+            print('!! No frames could be read from %s' % args.video)
+            raise SystemExit(1)
+        args.height, args.width, args.pix_fmt = frame.shape[0], frame.shape[1], 'rgb24'
+        if args.name == 'live': args.name = os.path.splitext(os.path.basename(args.video))[0]
+        source = args.video
+    elif args.width == None or args.height == None:
+        print('!! --width and --height are required to read raw frames')
+        raise SystemExit(1)
+    else:
+        file = sys.stdin.buffer if args.input == '-' else open(args.input, 'rb')
+        frames = read_frames(file, args.width, args.height, args.pix_fmt)
+        frame = next(frames, None)
+        source = 'stdin' if args.input == '-' else args.input
+        if frame is None:
+            print('!! No frames could be read from %s' % source)
+            raise SystemExit(1)
+
+    d = live_detector(api.read_config(args.config_file), args.width, args.height, pix_fmt = args.pix_fmt,
+                      name = args.name, update = args.update, margin = args.early_stop)
+    print('Reading %sx%s %s frames from %s' % (args.width, args.height, args.pix_fmt, source))
+    while frame is not None and d.add_frame(frame):
+        frame = next(frames, None)
+    t0 = time()
+    if d.stopped_early: print('Stopped early at frame %s of %s' % (d.n_frames, d.crop_n))
+    frames.close()
+    if file != None and file != sys.stdin.buffer: file.close()
+
+    try: results = api.quietly(d.finish)
+    except RuntimeError as e:
+        print('!! %s' % e)
+        raise SystemExit(1)
+    print('\nFinal slopes, %.2f seconds after the last frame:' % (time() - t0))
+    print(results['slopes'][['vial_ID','first_frame','last_frame','slope','r_value']])
+    if args.save_file != None:
+        results['slopes'].to_csv(args.save_file, index = False)
+        print('Saved:', args.save_file)
+    return
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,174 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+## File name : plots.py
+## Created by: Adam N. Spierer
+## Date      : October 2026
+## Purpose   : Renders plots from the inputs saved by detectors with deferred plots
+##              (<video>.plots.pkl.gz), in a separate process or again after a batch
+
+import os
+import gzip
+import pickle
+import argparse
+
+import detector
+import instrument
+
+plots_suffix = '.plots.pkl.gz'
+kinds = ['roi','spot_check','processed','diagnostic']
+
+def load(path_plots):
+    '''Reads a plot inputs file
+    ----
+    Inputs:
+      path_plots (str): Path to a <video>.plots.pkl.gz file
+    ----
+    Returns:
+      plots (dict): 'version', 'video_file', and 'plots', a list of each plot's 'kind',
+                    'inputs' (detector attributes), and 'arguments' '''
+    with gzip.open(path_plots, 'rb') as f:
+        plots = pickle.load(f)
+    return plots
+
+def restore(inputs):
+    '''Detector holding only a plot's inputs, without decoding the video
+    ----
+    Inputs:
+      inputs (dict): Detector attributes read by the plot
+    ----
+    Returns:
+      d (detector): Detector with the plot_<kind> methods'''
+    d = detector.detector.__new__(detector.detector)
+    d.__dict__.update(recorder = instrument.recorder())
+    d.__dict__.update(inputs)
+    return d
+
+def render(path_plots, kinds = None):
+    '''Renders the plots of a plot inputs file, saving them where the detector would have
+    ----
+    Inputs:
+      path_plots (str): Path to a <video>.plots.pkl.gz file
+      kinds (list): Kinds of plots to render, None renders all of them
+    ----
+    Returns:
+      rendered (list): Kinds of plots rendered'''
+    import matplotlib
+    matplotlib.use('Agg') # Only saving files, never showing them
+    plt = detector.plt
+
+    rendered = []
+    for plot in load(path_plots)['plots']:
+        if kinds != None and plot['kind'] not in kinds: continue
+        d = restore(plot['inputs'])
+        getattr(d, 'plot_' + plot['kind'])(**plot['arguments'])
+        plt.close('all')
+        rendered.append(plot['kind'])
+    return rendered
+
+class render_pool(object):
+    '''Pool of processes rendering deferred plots, so that videos are analyzed without
+    waiting on matplotlib. Plots are rendered in the order they are submitted.
+    '''
+    def __init__(self, workers = 1):
+        '''Inputs:
+          workers (int): Number of rendering processes'''
+        from concurrent.futures import ProcessPoolExecutor
+        import FreeClimber_main
+        self.pool = ProcessPoolExecutor(max_workers = workers, initializer = FreeClimber_main.ignore_interrupt)
+        self.running = dict()
+
+    def submit(self, path_plots, kinds = None):
+        '''Queues a plot inputs file for rendering'''
+        self.running[path_plots] = self.pool.submit(render, path_plots, kinds)
+        return
+
+    def collect(self, wait = False):
+        '''Reports rendered plot inputs files
+        ----
+        Inputs:
+          wait (bool): True waits for every queued file
+        ----
+        Returns:
+          failed (list): Files that could not be rendered'''
+        failed = []
+        for path_plots in list(self.running.keys()):
+            future = self.running[path_plots]
+            if not wait and not future.done(): continue
+            self.running.pop(path_plots)
+            if future.exception() != None:
+                print('!! Could not render plots from %s: %s' % (path_plots, future.exception()))
+                failed.append(path_plots)
+        return failed
+
+    def close(self):
+        '''Waits for queued plots and stops the pool, returns files that could not be rendered'''
+        if len(self.running) > 0: print('-- Waiting for %s video(s) to finish rendering plots' % len(self.running))
+        failed = self.collect(wait = True)
+        self.pool.shutdown(wait = True)
+        return failed
+
+def find_plots(paths):
+    '''Plot inputs files given, or within the folders given'''
+    found = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, dirs, files in os.walk(path):
+                found += sorted([os.path.join(root, item) for item in files if item.endswith(plots_suffix)])
+        else:
+            found.append(path)
+    return found
+
+def define_argument_parser():
+    '''Defines arguments to be parsed, via argparse module.
+    ----
+    Inputs:
+      None
+    ----
+    Returns:
+      args (object): Namespace object containing the flags and arguments passed to program
+    '''
+    parser = argparse.ArgumentParser(prog='FreeClimber',
+                                    description='plots.py - Renders plots from the plot inputs (.plots.pkl.gz) saved with --render_workers, without processing the videos again',
+                                    epilog='For documentation and a tutorial, see https://github.com/adamspierer/FreeClimber',
+                                    allow_abbrev=False)
+    parser.add_argument('paths',
+                        nargs='+',
+                        help="Plot inputs files (ending with '%s'), or folders to search for them (e.g. path_project)" % plots_suffix)
+    parser.add_argument('--kinds',
+                        nargs='+',
+                        choices=kinds,
+                        default=None,
+                        help="Plots to render (default = all those saved)")
+    parser.add_argument('--workers',
+                        type=int,
+                        default=1,
+                        help="Number of rendering processes (default = 1)")
+    args = parser.parse_args()
+    return args
+
+def main():
+    '''Renders every plot inputs file given'''
+    args = define_argument_parser()
+    paths = find_plots(args.paths)
+    if len(paths) == 0:
+        print('!! No plot inputs files found')
+        raise SystemExit(1)
+
+    print('## Rendering plots of %s video(s) with %s worker(s)' % (len(paths), args.workers))
+    if args.workers <= 1:
+        failed = []
+        for path_plots in paths:
+            try: render(path_plots, args.kinds)
+            except Exception as e:
+                print('!! Could not render plots from %s: %s' % (path_plots, e))
+                failed.append(path_plots)
+    else:
+        pool = render_pool(args.workers)
+        for path_plots in paths: pool.submit(path_plots, args.kinds)
+        failed = pool.close()
+    print('## Rendered plots of %s video(s), %s failed' % (len(paths) - len(failed), len(failed)))
+    return
+
+if __name__ == '__main__':
+    main()
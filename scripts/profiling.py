@@ -0,0 +1,260 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+## File name : profiling.py
+## Created by: Adam N. Spierer
+## Date      : October 2026
+## Purpose   : Profiles each detector step (cProfile or a low-overhead stack sampler),
+##              saving pstats files per video and per step, and merges them across a batch
+
+import os
+import sys
+import glob
+import marshal
+import argparse
+import threading
+import functools
+from time import perf_counter
+from contextlib import contextmanager
+
+## Default location of the profiles, relative to the project folder
+profiles_name = os.path.join('log','profiles')
+
+## Seconds between stack samples in 'sample' mode
+interval = 0.005
+
+class sampler(object):
+    '''Samples the call stack of one thread at a fixed interval from a background thread.
+    Samples are tallied in the same layout as cProfile, so they can be saved and read with
+    pstats: self time for the innermost function, cumulative time for every function on the
+    stack, and caller/callee pairs. Times are wall-clock, so waiting (e.g. on FFmpeg or
+    worker processes) shows up too.
+    '''
+    def __init__(self, interval = interval):
+        self.interval = interval
+        self.stats = dict()
+        self.stopped = threading.Event()
+        return
+
+    def enable(self):
+        '''Starts sampling the calling thread'''
+        self.thread_id = threading.get_ident()
+        self.stopped.clear()
+        self.thread = threading.Thread(target = self.run)
+        self.thread.daemon = True
+        self.thread.start()
+        return
+
+    def disable(self):
+        '''Stops sampling'''
+        self.stopped.set()
+        self.thread.join()
+        return
+
+    def run(self):
+        '''Samples until stopped, weighting each sample by the time since the last one
+        (samples can be late while the sampled thread holds the GIL)'''
+        last = perf_counter()
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            now = perf_counter()
+            if frame != None: self.sample(frame, now - last)
+            last = now
+        return
+
+    def sample(self, frame, weight):
+        '''Adds one sample of a stack (innermost frame first), weight in seconds'''
+        stack = []
+        while frame != None:
+            code = frame.f_code
+            stack.append((code.co_filename, code.co_firstlineno, code.co_name))
+            frame = frame.f_back
+
+        seen = set()
+        for i,func in enumerate(stack):
+            cc, nc, tt, ct, callers = self.stats.get(func, (0, 0, 0., 0., dict()))
+            ## Recursive calls count once towards primitive calls and cumulative time
+            primitive = int(func not in seen)
+            self_time = weight if i == 0 else 0.
+            cum_time = weight * primitive
+            seen.add(func)
+            if i + 1 < len(stack):
+                c_nc, c_cc, c_tt, c_ct = callers.get(stack[i + 1], (0, 0, 0., 0.))
+                callers[stack[i + 1]] = (c_nc + 1, c_cc + primitive, c_tt + self_time, c_ct + cum_time)
+            self.stats[func] = (cc + primitive, nc + 1, tt + self_time, ct + cum_time, callers)
+        return
+
+    def dump_stats(self, file):
+        '''Saves the samples in the pstats file format'''
+        with open(file,'wb') as f:
+            marshal.dump(self.stats, f)
+        f.close()
+        return
+
+class profiler(object):
+    '''Profiles stages (detector steps) of processing one video. Each stage is saved to
+    <path_folder>/<name>/<stage>.prof; merge() combines them into <path_folder>/<name>.prof.
+    Stages nested inside a profiled stage are part of it. A profiler without a folder does
+    nothing, so the detector can always use one.
+    '''
+    def __init__(self, path_folder = None, name = None, mode = 'cprofile', interval = interval):
+        '''Sets up the profiler
+        ----
+        Inputs:
+          path_folder (str): Folder to save profiles in, None disables profiling
+          name (str): Name of the video, default is set by the detector
+          mode (str): 'cprofile' for deterministic profiling, 'sample' for stack sampling
+          interval (float): Seconds between samples in 'sample' mode
+        ----
+        Returns:
+          None'''
+        self.path_folder = path_folder
+        self.name = name
+        self.mode = mode
+        self.interval = interval
+        self.active = False
+        self.files = []
+        return
+
+    @contextmanager
+    def profile(self, stage):
+        '''Context manager profiling one stage
+        ----
+        Inputs:
+          stage (str): Stage name
+        ----
+        Returns:
+          None'''
+        if self.path_folder == None or self.active:
+            yield
+            return
+
+        if self.mode == 'sample': p = sampler(self.interval)
+        else:
+            import cProfile
+            p = cProfile.Profile()
+        try: p.enable()
+        except ValueError: # Another profiler is already running
+            print('!! Could not profile %s, another profiler is active' % stage)
+            yield
+            return
+
+        self.active = True
+        try:
+            yield
+        finally:
+            p.disable()
+            self.active = False
+            path = os.path.join(self.path_folder, self.name, stage + '.prof')
+            if not os.path.isdir(os.path.dirname(path)): os.makedirs(os.path.dirname(path))
+            p.dump_stats(path)
+            self.files.append(path)
+        return
+
+    def merge(self):
+        '''Combines the profiles of all stages into one profile for the video
+        ----
+        Inputs:
+          None
+        ----
+        Returns:
+          path (str): Path to the video's profile, None if nothing was profiled'''
+        if len(self.files) == 0: return None
+        import pstats
+        path = os.path.join(self.path_folder, self.name + '.prof')
+        pstats.Stats(*self.files).dump_stats(path)
+        return path
+
+def profiled(name):
+    '''Decorator profiling a detector method as a stage with the detector's profiler'''
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(self, *args, **kwargs):
+            with self.profiler.profile(name):
+                return function(self, *args, **kwargs)
+        return wrapper
+    return decorator
+
+def profile_files(paths, step = None):
+    '''Finds profiles to summarize
+    ----
+    Inputs:
+      paths (list): Profile files and/or profile folders (e.g. <path_project>/log/profiles)
+      step (str): Use the profiles of one step (e.g. 'step_2') instead of whole videos
+    ----
+    Returns:
+      files (list): Paths to profile files'''
+    files = []
+    for path in paths:
+        if os.path.isfile(path): files.append(path)
+        elif step == None: files += sorted(glob.glob(os.path.join(path, '*.prof')))
+        else: files += sorted(glob.glob(os.path.join(path, '*', step + '.prof')))
+    return files
+
+def summarize(paths, step = None, sort = 'cumulative', top = 25):
+    '''Merges profiles across a batch and prints the top functions
+    ----
+    Inputs:
+      paths (list): Profile files and/or profile folders
+      step (str): Use the profiles of one step instead of whole videos
+      sort (str): pstats sort key, e.g. 'cumulative' or 'tottime'
+      top (int): Number of functions to print
+    ----
+    Returns:
+      stats (pstats.Stats): Merged profile, None if no profiles were found'''
+    import pstats
+    files = profile_files(paths, step = step)
+    if len(files) == 0:
+        print('!! No profiles found')
+        return None
+    print('Merging %s profiles' % len(files))
+    stats = pstats.Stats(*files)
+    stats.strip_dirs().sort_stats(sort).print_stats(top)
+    return stats
+
+def define_argument_parser():
+    '''Defines arguments to be parsed, via argparse module.
+    ----
+    Inputs:
+      None
+    ----
+    Returns:
+      args (object): Namespace object containing the flags and arguments passed to program
+    '''
+    parser = argparse.ArgumentParser(prog='FreeClimber',
+                                    description='profiling.py - Merges the profiles written with --profile and prints the hottest functions',
+                                    epilog='For documentation and a tutorial, see https://github.com/adamspierer/FreeClimber',
+                                    allow_abbrev=False)
+    parser.add_argument('paths',
+                        nargs='+',
+                        help="Profile files or folders (e.g. <path_project>/log/profiles)")
+    parser.add_argument('--step',
+                        type=str,
+                        default=None,
+                        help="Only merge the profiles of one step (e.g. step_2 or decode)")
+    parser.add_argument('--sort',
+                        type=str,
+                        default='cumulative',
+                        help="Sort functions by 'cumulative' or 'tottime' (default = cumulative)")
+    parser.add_argument('--top',
+                        type=int,
+                        default=25,
+                        help="Number of functions to print (default = 25)")
+    parser.add_argument('--save_file',
+                        type=str,
+                        default=None,
+                        help="Saves the merged profile to a file")
+    args = parser.parse_args()
+    return args
+
+def main():
+    '''Prints the hottest functions across a batch'''
+    args = define_argument_parser()
+    stats = summarize(args.paths, step = args.step, sort = args.sort, top = args.top)
+    if stats != None and args.save_file != None:
+        stats.dump_stats(args.save_file)
+        print('Saved:', args.save_file)
+    return
+
+if __name__ == '__main__':
+    main()
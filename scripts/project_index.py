@@ -0,0 +1,220 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+## File name : project_index.py
+## Created by: Adam N. Spierer
+## Date      : October 2026
+## Purpose   : Persistent SQLite index of a project folder (videos, probe metadata,
+##              processing status, and output files) so batches do not re-walk the tree
+
+import os
+import sqlite3
+from time import time, ctime
+
+## Default location of the index, relative to the project folder
+index_name = os.path.join('log','index.sqlite')
+
+## Directories modified this close to their last listing are listed again, as file systems
+##    with coarse timestamps (e.g. network drives) can add files without changing the mtime
+mtime_margin = 2
+
+## Suffixes of files written for each processed video
+output_suffixes = ['.raw.csv','.filtered.csv','.slopes.csv','.diagnostic.png',
+                   '.ROI.png','.processed.png','.spot_check.png']
+
+class project_index(object):
+    '''Keeps a record of every file in a project folder. Directories are only re-listed
+    when their modification time changes (or was too close to their last listing to tell,
+    see mtime_margin), so an update on an unchanged tree costs one
+    stat per directory instead of a full walk.
+    '''
+    def __init__(self, path_project, path_index = None, debug = False):
+        '''Opens (or creates) the index for a project folder
+        ----
+        Inputs:
+          path_project (str): Parent folder of the project
+          path_index (str): Path to the SQLite file, default = <path_project>/log/index.sqlite
+          debug (bool): Prints each function as it runs
+        ----
+        Returns:
+          None'''
+        self.debug = debug
+        if self.debug: print('project_index.__init__')
+
+        ## Kept as given so paths match those from os.walk(path_project)
+        self.path_project = path_project
+        if path_index == None: path_index = os.path.join(self.path_project, index_name)
+        if not os.path.isdir(os.path.dirname(path_index)):
+            os.makedirs(os.path.dirname(path_index))
+        self.path_index = path_index
+
+        self.db = sqlite3.connect(self.path_index)
+        self.db.executescript('''
+            CREATE TABLE IF NOT EXISTS directories (path TEXT PRIMARY KEY, parent TEXT, mtime REAL, scanned REAL);
+            CREATE TABLE IF NOT EXISTS files (path TEXT PRIMARY KEY, directory TEXT, name TEXT, size INTEGER, mtime REAL);
+            CREATE INDEX IF NOT EXISTS files_directory ON files (directory);
+            CREATE TABLE IF NOT EXISTS videos (path TEXT PRIMARY KEY, width INTEGER, height INTEGER,
+                                               n_frames INTEGER, frame_rate REAL, codec TEXT,
+                                               status TEXT, updated TEXT);
+            ''')
+
+        ## Indexes from before the time of each listing was kept
+        columns = [item[1] for item in self.db.execute('PRAGMA table_info(directories)')]
+        if 'scanned' not in columns: self.db.execute('ALTER TABLE directories ADD COLUMN scanned REAL')
+        return
+
+    def close(self):
+        '''Closes the connection to the index'''
+        self.db.close()
+        return
+
+    def update(self):
+        '''Brings the index up to date with the project folder. Directories with an
+        unchanged modification time are not listed again, their known subdirectories are
+        visited from the index instead.
+        ----
+        Inputs:
+          None
+        ----
+        Returns:
+          rescanned (int): Number of directories that were re-listed'''
+        if self.debug: print('project_index.update')
+
+        stack, seen, rescanned = [self.path_project], set(), 0
+        while stack:
+            folder = stack.pop()
+            try: mtime = os.stat(folder).st_mtime
+            except OSError: continue
+            seen.add(folder)
+
+            row = self.db.execute('SELECT mtime, scanned FROM directories WHERE path = ?', (folder,)).fetchone()
+            if row != None and row[0] == mtime and row[1] != None and row[1] - mtime > mtime_margin:
+                stack += [item[0] for item in self.db.execute('SELECT path FROM directories WHERE parent = ?', (folder,))]
+                continue
+
+            ## Re-list the directory and replace its files
+            rescanned += 1
+            if self.debug: print('project_index.update: rescanning', folder)
+            scanned = time()
+            files, subdirs = [], []
+            for entry in os.scandir(folder):
+                try:
+                    if entry.is_dir(): subdirs.append(entry.path)
+                    elif entry.is_file():
+                        stat = entry.stat()
+                        files.append((entry.path, folder, entry.name, stat.st_size, stat.st_mtime))
+                except OSError:
+                    pass
+            self.db.execute('DELETE FROM files WHERE directory = ?', (folder,))
+            self.db.executemany('INSERT OR REPLACE INTO files VALUES (?,?,?,?,?)', files)
+            known = [item[0] for item in self.db.execute('SELECT path FROM directories WHERE parent = ?', (folder,))]
+            self.db.executemany('DELETE FROM directories WHERE path = ?',
+                                [(item,) for item in known if item not in subdirs])
+            self.db.executemany('INSERT OR IGNORE INTO directories VALUES (?,?,NULL,NULL)',
+                                [(item, folder) for item in subdirs])
+            self.db.execute('UPDATE directories SET mtime = ?, scanned = ? WHERE path = ?', (mtime, scanned, folder))
+            self.db.execute('INSERT OR IGNORE INTO directories VALUES (?,?,?,?)', (folder, None, mtime, scanned))
+            stack += subdirs
+
+        ## Pruning directories (and their files) that no longer exist
+        known = [item[0] for item in self.db.execute('SELECT path FROM directories')]
+        removed = [(item,) for item in known if item not in seen]
+        self.db.executemany('DELETE FROM directories WHERE path = ?', removed)
+        self.db.execute('DELETE FROM files WHERE directory NOT IN (SELECT path FROM directories)')
+        self.db.execute('DELETE FROM videos WHERE path NOT IN (SELECT path FROM files)')
+        self.db.commit()
+        if self.debug: print('project_index.update: %s directories rescanned' % rescanned)
+        return rescanned
+
+    def files(self, endswith):
+        '''All indexed files ending with a suffix (or any of a tuple of suffixes)
+        ----
+        Inputs:
+          endswith (str or tuple): File suffix(es)
+        ----
+        Returns:
+          _list (list): Sorted list of file paths'''
+        if isinstance(endswith, str): endswith = [endswith]
+        _list = set()
+        for suffix in endswith:
+            query = 'SELECT path FROM files WHERE substr(name, -length(?)) = ?'
+            _list.update([item[0] for item in self.db.execute(query, (suffix, suffix))])
+        return sorted(_list)
+
+    def file_walker(self, endswith = None, undone = False):
+        '''Index-backed counterpart to FreeClimber.file_walker
+        ----
+        Inputs:
+          endswith (str or tuple): Suffix of a common file type
+          undone (bool): True excludes files with a '.slopes.csv' counterpart (processed)
+        ----
+        Returns:
+          _list (list): sorted list of all file paths with a common suffix'''
+        if self.debug: print('project_index.file_walker')
+        self.update()
+        _list = self.files(endswith)
+        if undone:
+            done = set(self.files('.slopes.csv'))
+            _list = [item for item in _list
+                     if '.'.join(item.split('.')[:-1]) + '.slopes.csv' not in done]
+        return _list
+
+    def outputs(self, video_file):
+        '''Indexed output files written for a video
+        ----
+        Inputs:
+          video_file (str): Path to video file
+        ----
+        Returns:
+          _list (list): Output file paths'''
+        name_nosuffix = '.'.join(video_file.split('.')[:-1])
+        query = 'SELECT path FROM files WHERE path = ?'
+        return [item for item in [name_nosuffix + suffix for suffix in output_suffixes]
+                if self.db.execute(query, (item,)).fetchone() != None]
+
+    def set_video(self, video_file, **kwargs):
+        '''Records probe metadata and/or processing status for a video
+        ----
+        Inputs:
+          video_file (str): Path to video file
+          **kwargs: Any of width, height, n_frames, frame_rate, codec, status
+        ----
+        Returns:
+          None'''
+        if self.debug: print('project_index.set_video:', video_file, kwargs)
+        self.db.execute('INSERT OR IGNORE INTO videos (path) VALUES (?)', (video_file,))
+        kwargs['updated'] = ctime()
+        for key in kwargs.keys():
+            self.db.execute('UPDATE videos SET %s = ? WHERE path = ?' % key, (kwargs[key], video_file))
+        self.db.commit()
+        return
+
+    def video(self, video_file, probe = False):
+        '''Indexed details for a video, optionally probing it with FFmpeg if missing
+        ----
+        Inputs:
+          video_file (str): Path to video file
+          probe (bool): True runs ffmpeg.probe if no metadata has been recorded
+        ----
+        Returns:
+          details (dict): Column names and values, empty if not indexed'''
+        cursor = self.db.execute('SELECT * FROM videos WHERE path = ?', (video_file,))
+        row = cursor.fetchone()
+        details = dict()
+        if row != None: details = dict(zip([item[0] for item in cursor.description], row))
+
+        if probe and details.get('width') == None:
+            import ffmpeg
+            try:
+                info = next(x for x in ffmpeg.probe(video_file)['streams'] if x['codec_type'] == 'video')
+                num,den = info.get('avg_frame_rate','0/1').split('/')
+                self.set_video(video_file,
+                               width = int(info['width']),
+                               height = int(info['height']),
+                               n_frames = int(info.get('nb_frames',0)) or None,
+                               frame_rate = float(num) / float(den) if float(den) else None,
+                               codec = info.get('codec_name'))
+                return self.video(video_file)
+            except:
+                print('!! Could not probe %s' % video_file)
+        return details
@@ -0,0 +1,166 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+## File name : results.py
+## Created by: Adam N. Spierer
+## Date      : October 2026
+## Purpose   : Keeps results.csv up to date incrementally, only reading the .slopes.csv
+##              files of new or reprocessed videos
+
+import os
+import json
+
+def read_slopes(path):
+    '''Reads a .slopes.csv file as bytes and splits off the header line
+    ----
+    Inputs:
+      path (str): Path to .slopes.csv file
+    ----
+    Returns:
+      header (str): Header line
+      body (bytes): Remaining lines'''
+    with open(path,'rb') as f:
+        header = f.readline()
+        body = f.read()
+    f.close()
+    if len(body) > 0 and not body.endswith(b'\n'): body = body + b'\n'
+    return header.decode().rstrip('\r\n'), body
+
+def file_stamp(path):
+    '''Modification time and size used to decide if a file changed'''
+    stat = os.stat(path)
+    return [stat.st_mtime_ns, stat.st_size]
+
+def load_offsets(path_result):
+    '''Loads the offset index (results.csv.idx) if it is consistent with results.csv
+    ----
+    Inputs:
+      path_result (str): Path to results.csv
+    ----
+    Returns:
+      offsets (dict): Header, total size, and [mtime, size, start, end] by slopes file,
+                      or None if there is no usable index'''
+    try:
+        with open(path_result + '.idx','r') as f:
+            offsets = json.load(f)
+        f.close()
+        if os.path.getsize(path_result) != offsets['total']: return None
+        return offsets
+    except:
+        return None
+
+def save_offsets(path_result, offsets):
+    '''Saves the offset index next to results.csv'''
+    offsets['total'] = os.path.getsize(path_result)
+    with open(path_result + '.idx','w') as f:
+        json.dump(offsets, f)
+    f.close()
+    return
+
+def rebuild_results(path_result, slope_files, debug = False):
+    '''Writes results.csv from scratch. If all slopes files share a header, their rows
+    are concatenated as bytes and an offset index is written; otherwise columns are
+    aligned with pandas and no index is kept.
+    ----
+    Inputs:
+      path_result (str): Path to results.csv
+      slope_files (list): Paths to all .slopes.csv files
+      debug (bool): Prints each function as it runs
+    ----
+    Returns:
+      None'''
+    if debug: print('results.rebuild_results')
+    print("    - Concatenating",len(slope_files),"files")
+    if len(slope_files) == 0:
+        print('!! No .slopes.csv files to concatenate')
+        return
+
+    slopes = [(item,) + read_slopes(item) for item in slope_files]
+    headers = set([header for item,header,body in slopes])
+
+    ## Mixed naming conventions, let pandas align the columns
+    if len(headers) != 1:
+        from pandas import read_csv, concat
+        concat([read_csv(item) for item in slope_files]).to_csv(path_result,index=False)
+        if os.path.isfile(path_result + '.idx'): os.remove(path_result + '.idx')
+        return
+
+    offsets = {'header':slopes[0][1], 'files':dict()}
+    with open(path_result,'wb') as f:
+        f.write((offsets['header'] + '\n').encode())
+        for item,header,body in slopes:
+            start = f.tell()
+            f.write(body)
+            offsets['files'][item] = file_stamp(item) + [start, f.tell()]
+    f.close()
+    save_offsets(path_result, offsets)
+    return
+
+def update_results(path_result, slope_files, debug = False):
+    '''Upserts the rows of new or reprocessed videos into results.csv. Rows of new videos
+    are appended; if videos were reprocessed or removed, results.csv is rewritten by
+    copying the unchanged byte ranges. Falls back to rebuild_results if there is no
+    usable offset index or headers differ.
+    ----
+    Inputs:
+      path_result (str): Path to results.csv
+      slope_files (list): Paths to all .slopes.csv files
+      debug (bool): Prints each function as it runs
+    ----
+    Returns:
+      changed (int): Number of slopes files read'''
+    if debug: print('results.update_results')
+
+    offsets = load_offsets(path_result)
+    if offsets == None:
+        rebuild_results(path_result, slope_files, debug = debug)
+        return len(slope_files)
+
+    ## Finding new, reprocessed, and removed videos
+    known = offsets['files']
+    changed = [item for item in slope_files
+               if item not in known or known[item][:2] != file_stamp(item)]
+    current = set(slope_files)
+    removed = [item for item in known.keys() if item not in current]
+    if debug: print('results.update_results: changed',changed,'removed',removed)
+    print("    - Updating %s of %s files (%s removed)" % (len(changed),len(slope_files),len(removed)))
+    if len(changed) == 0 and len(removed) == 0: return 0
+
+    ## Reading only the changed files
+    new = dict()
+    for item in changed:
+        header, body = read_slopes(item)
+        if header != offsets['header']:
+            rebuild_results(path_result, slope_files, debug = debug)
+            return len(slope_files)
+        new[item] = body
+
+    ## Only new videos, append their rows
+    if len(removed) == 0 and all([item not in known for item in changed]):
+        with open(path_result,'ab') as f:
+            for item in changed:
+                start = f.tell()
+                f.write(new[item])
+                known[item] = file_stamp(item) + [start, f.tell()]
+        f.close()
+        save_offsets(path_result, offsets)
+        return len(changed)
+
+    ## Otherwise copy unchanged byte ranges into a new file
+    files = dict()
+    with open(path_result,'rb') as old, open(path_result + '.tmp','wb') as f:
+        f.write((offsets['header'] + '\n').encode())
+        order = sorted([item for item in known.keys() if item not in removed], key = lambda x: known[x][2])
+        order += [item for item in changed if item not in known]
+        for item in order:
+            if item in new: body = new[item]
+            else:
+                old.seek(known[item][2])
+                body = old.read(known[item][3] - known[item][2])
+            start = f.tell()
+            f.write(body)
+            files[item] = (file_stamp(item) if item in new else known[item][:2]) + [start, f.tell()]
+    os.replace(path_result + '.tmp', path_result)
+    offsets['files'] = files
+    save_offsets(path_result, offsets)
+    return len(changed)
@@ -0,0 +1,281 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+## File name : sweep.py
+## Created by: Adam N. Spierer
+## Date      : October 2026
+## Purpose   : Runs the detector over grids of detection parameters on a sample of project
+##              videos, reporting the slopes, r-values, and spot counts of each setting
+
+import os
+import random
+import shutil
+import argparse
+import tempfile
+import itertools
+from time import time
+
+import api
+import detector
+
+## Swept parameters, in the order of the table columns
+detection_parameters = ['diameter','minmass','maxsize']
+filter_parameters = ['threshold','window']
+
+def preprocess(video_file, config_file, path_cache):
+    '''Decodes a video and runs step_1 (crop, grayscale, background subtraction) once,
+    saving the spot stack and background for the workers to memory-map
+    ----
+    Inputs:
+      video_file (str): Path to video file
+      config_file (str): Path to configuration (.cfg) file
+      path_cache (str): Folder for the preprocessed stacks
+    ----
+    Returns:
+      video (dict): 'video_file', 'name', and paths to the 'spot_stack' and 'background'
+    '''
+    d = api.quietly(detector.detector, video_file, config_file = config_file)
+    api.quietly(d.step_1)
+    name = os.path.split(d.name_nosuffix)[1]
+    video = {'video_file':video_file, 'name':name,
+             'spot_stack':os.path.join(path_cache, '%s.%s.spot_stack.npy' % (name, abs(hash(video_file)))),
+             'background':os.path.join(path_cache, '%s.%s.background.npy' % (name, abs(hash(video_file))))}
+    detector.np.save(video['spot_stack'], d.spot_stack)
+    detector.np.save(video['background'], d.background)
+    return video
+
+def run_setting(video, parameters, detection, filters):
+    '''Detects spots in a preprocessed video with one detection setting, then filters them
+    and calculates slopes for each filter setting
+    ----
+    Inputs:
+      video (dict): Preprocessed video, from preprocess()
+      parameters (dict): Detector variables from the configuration file
+      detection (dict): Values of the detection parameters (diameter, minmass, maxsize)
+      filters (list): Dictionaries of the filter parameters (threshold, window)
+    ----
+    Returns:
+      rows (list): One dictionary per vial and setting, see sweep()'''
+    np = detector.np
+    spot_stack = np.load(video['spot_stack'], mmap_mode = 'r')
+    parameters = dict(parameters, **detection)
+    d = api.quietly(api.array_detector, spot_stack, parameters, name = video['name'])
+    d.spot_stack, d.background = spot_stack, np.load(video['background'])
+    d.outputs = detector.output_profiles['lean'] # Only the slopes are compared
+    setting = dict(video = video['video_file'], **detection)
+
+    ## Detection is shared by all filter settings
+    try:
+        api.quietly(d.step_2)
+    except SystemExit:
+        return [dict(setting, **item, vial_ID = None, spots_detected = 0) for item in filters]
+    detected = d.df_big
+
+    rows = []
+    for item in filters:
+        row = dict(setting, **item, spots_detected = detected.shape[0])
+        d.df_big = detected.copy()
+        d.threshold, d.window = item['threshold'], item['window']
+        try:
+            api.quietly(d.step_4)
+            api.quietly(d.step_5)
+            api.quietly(d.step_6)
+            api.quietly(d.step_7)
+        except SystemExit:
+            rows.append(dict(row, vial_ID = None))
+            continue
+
+        ## Slopes with the spots used for each vial's regression
+        frames = d.spot_stack.shape[0]
+        for vial, slope in zip(d.result.keys(), d.df_slopes.itertuples()):
+            if vial == d.vials + 1 or d.vials == 1: spots = d.df_filtered.shape[0]
+            else: spots = int((d.df_filtered.vial == vial).sum())
+            rows.append(dict(row, threshold_used = d.threshold, vial_ID = slope.vial_ID,
+                             slope = slope.slope, r_value = slope.r_value,
+                             first_frame = slope.first_frame, last_frame = slope.last_frame,
+                             spots = spots, spots_per_frame = round(spots / frames, 2)))
+    return rows
+
+def parse_values(values):
+    '''Reads grid values from the command line as numbers, keeping strings (e.g. 'auto')'''
+    parsed = []
+    for item in values:
+        try: parsed.append(int(item))
+        except ValueError:
+            try: parsed.append(float(item))
+            except ValueError: parsed.append(item)
+    return parsed
+
+def sample_videos(parameters, videos, sample, seed):
+    '''Videos to sweep: those given, or a random sample of the project's videos
+    ----
+    Inputs:
+      parameters (dict): Detector variables, for path_project and file_suffix
+      videos (list): Video files, empty to sample the project
+      sample (int): Number of project videos to sample
+      seed (int): Random seed for the sample
+    ----
+    Returns:
+      videos (list): Paths to video files'''
+    if len(videos) > 0: return [os.path.abspath(item) for item in videos]
+    project_videos = []
+    for root, dirs, files in os.walk(parameters['path_project']):
+        project_videos += [os.path.join(root, item) for item in files if item.endswith(parameters['file_suffix'])]
+    project_videos = sorted(project_videos)
+    random.Random(seed).shuffle(project_videos)
+    return sorted(project_videos[:sample])
+
+def sweep(config_file, videos, grid, workers = 1, path_cache = None):
+    '''Runs every combination of the grid on each video, across worker processes. Each video
+    is preprocessed once, and spots are detected once per detection setting.
+    ----
+    Inputs:
+      config_file (str): Path to configuration (.cfg) file, for the parameters not swept
+      videos (list): Video files
+      grid (dict): Values to try for each of diameter, minmass, maxsize, threshold, window
+      workers (int): Number of worker processes
+      path_cache (str): Folder for the preprocessed stacks, None for a temporary folder
+    ----
+    Returns:
+      table (DataFrame): One row per video, setting, and vial (the last being all vials),
+                         with slope, r_value, the regression window, and spot counts'''
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+    import FreeClimber_main
+    parameters = api.read_config(config_file)
+    detections = [dict(zip(detection_parameters, item)) for item in itertools.product(*[grid[key] for key in detection_parameters])]
+    filters = [dict(zip(filter_parameters, item)) for item in itertools.product(*[grid[key] for key in filter_parameters])]
+    print('## Sweeping %s detection x %s filter settings on %s video(s) with %s worker(s)' %
+          (len(detections), len(filters), len(videos), workers))
+
+    temporary = path_cache == None
+    if temporary: path_cache = tempfile.mkdtemp(prefix = 'freeclimber-sweep-')
+    rows, t0 = [], time()
+    try:
+        with ProcessPoolExecutor(max_workers = workers, initializer = FreeClimber_main.ignore_interrupt) as pool:
+            ## Preprocessing each video once
+            preprocessed = []
+            futures = {pool.submit(preprocess, item, config_file, path_cache):item for item in videos}
+            for future in as_completed(futures):
+                try: preprocessed.append(future.result())
+                except (Exception, SystemExit) as e: print('!! Could not preprocess %s: %s' % (futures[future], e))
+            print('-- Preprocessed %s video(s) in %.1f seconds' % (len(preprocessed), time() - t0))
+
+            ## Detection settings across workers
+            futures = [pool.submit(run_setting, video, parameters, detection, filters)
+                       for video in preprocessed for detection in detections]
+            for i, future in enumerate(as_completed(futures)):
+                try: rows += future.result()
+                except Exception as e: print('!! Could not run a setting: %s' % e)
+                print('-- %s / %s detection settings done (%.1f seconds)' % (i + 1, len(futures), time() - t0), end = '\r')
+            print('')
+    finally:
+        if temporary: shutil.rmtree(path_cache, ignore_errors = True)
+
+    table = detector.pd.DataFrame(rows)
+    columns = ['video'] + detection_parameters + filter_parameters
+    if table.shape[0] > 0: table = table.sort_values(columns, kind = 'stable').reset_index(drop = True)
+    return table
+
+def summarize(table):
+    '''Summarizes each setting across videos and vials (not the 'all' row), best first
+    ----
+    Inputs:
+      table (DataFrame): Output of sweep()
+    ----
+    Returns:
+      summary (DataFrame): Mean and minimum r_value, mean spots per frame, and the number
+                           of videos without slopes, for each setting'''
+    settings = detection_parameters + filter_parameters
+    table = table.copy()
+    table['failed'] = table.vial_ID.isna()
+    vials = table[~table.failed & ~table.vial_ID.astype(str).str.endswith('_all')]
+    summary = vials.groupby(settings).agg(r_mean = ('r_value','mean'), r_min = ('r_value','min'),
+                                          slope_mean = ('slope','mean'),
+                                          spots_per_frame = ('spots_per_frame','mean'))
+    summary = summary.reindex(table.groupby(settings).size().index) # Keeping settings that failed on every video
+    summary['videos_failed'] = table.groupby(settings).apply(lambda df: df[df.failed].video.nunique())
+    summary['videos_failed'] = summary.videos_failed.fillna(0).astype(int)
+    return summary.round(4).sort_values(['videos_failed','r_mean'], ascending = [True, False]).reset_index()
+
+def define_argument_parser():
+    '''Defines arguments to be parsed, via argparse module.
+    ----
+    Inputs:
+      None
+    ----
+    Returns:
+      args (object): Namespace object containing the flags and arguments passed to program
+    '''
+    parser = argparse.ArgumentParser(prog='FreeClimber',
+                                    description='sweep.py - Runs the detector over grids of parameters on a sample of videos, to pick robust parameters',
+                                    epilog='For documentation and a tutorial, see https://github.com/adamspierer/FreeClimber',
+                                    allow_abbrev=False)
+    parser.add_argument('--config_file',
+                        type=str,
+                        required=True,
+                        help="Path to configuration file (ends with '.cfg'), for the parameters not swept and the project's videos")
+    parser.add_argument('videos',
+                        nargs='*',
+                        help="Video files to sweep, otherwise a sample of the project's videos")
+    parser.add_argument('--sample',
+                        type=int,
+                        default=3,
+                        help="Number of project videos to sample if none are given (default = 3)")
+    parser.add_argument('--seed',
+                        type=int,
+                        default=0,
+                        help="Random seed for the sample of videos (default = 0)")
+    for item in detection_parameters + filter_parameters:
+        parser.add_argument('--' + item,
+                            nargs='+',
+                            default=None,
+                            help="Values of %s to try, otherwise the configuration file's" % item)
+    parser.add_argument('--workers',
+                        type=int,
+                        default=os.cpu_count() or 1,
+                        help="Number of worker processes (default = number of CPUs)")
+    parser.add_argument('--cache_dir',
+                        type=str,
+                        default=None,
+                        help="Folder for the preprocessed stacks (default = a temporary folder, removed afterwards)")
+    parser.add_argument('--output',
+                        type=str,
+                        default=None,
+                        help="CSV file for the table of slopes (default = sweep.csv next to the configuration file)")
+    parser.add_argument('--top',
+                        type=int,
+                        default=10,
+                        help="Number of best settings to print (default = 10)")
+    args = parser.parse_intermixed_args() # Videos can come before or after the flags
+    return args
+
+def main():
+    '''Runs the sweep and saves its table'''
+    args = define_argument_parser()
+    parameters = api.read_config(args.config_file)
+    grid = dict()
+    for item in detection_parameters + filter_parameters:
+        values = getattr(args, item)
+        grid[item] = parse_values(values) if values != None else [parameters[item]]
+
+    videos = sample_videos(parameters, args.videos, args.sample, args.seed)
+    if len(videos) == 0:
+        print('!! No videos to sweep')
+        raise SystemExit(1)
+
+    table = sweep(args.config_file, videos, grid, workers = args.workers, path_cache = args.cache_dir)
+    if table.shape[0] == 0:
+        print('!! No settings could be run')
+        raise SystemExit(1)
+    output = args.output
+    if output == None: output = os.path.join(os.path.dirname(os.path.abspath(args.config_file)), 'sweep.csv')
+    table.to_csv(output, index = False)
+    print('--> Saved: %s\n' % output)
+
+    summary = summarize(table)
+    print('## Best settings (mean and minimum r_value over vials and videos)')
+    print(summary.head(args.top).to_string(index = False))
+    return
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,225 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+## File name : work_queue.py
+## Created by: Adam N. Spierer
+## Date      : October 2026
+## Purpose   : Splits one project across several machines that mount the same folder,
+##              using only atomic lock files in path_project (no external broker)
+
+import os
+import json
+import socket
+import hashlib
+import threading
+from time import time, sleep
+
+class work_queue(object):
+    '''Coordinates FreeClimber instances on different hosts through lock files in
+    <path_project>/log/claims/<batch>/. A video is claimed by atomically creating its lock file;
+    the owner refreshes the file's modification time while it works (heartbeat), and a
+    claim whose file has not been refreshed for 'stale_after' seconds is taken over by
+    atomically renaming it away. Finished videos leave a '.done' (or '.failed') marker so
+    no other host picks them up again within the same batch; a new batch name starts over.
+    '''
+    def __init__(self, path_project, batch = 'default', stale_after = 300, heartbeat = 30, debug = False):
+        '''Sets up the claims folder and starts the heartbeat thread
+        ----
+        Inputs:
+          path_project (str): Parent folder of the project, shared by all hosts
+          batch (str): Name of the batch, hosts with the same batch name share the work
+          stale_after (float): Seconds without a heartbeat before a claim can be taken over
+          heartbeat (float): Seconds between heartbeats, should be well below stale_after
+          debug (bool): Prints each function as it runs
+        ----
+        Returns:
+          None'''
+        self.debug = debug
+        if self.debug: print('work_queue.__init__')
+
+        self.path_project = path_project
+        self.path_claims = os.path.join(path_project, 'log', 'claims', batch)
+        if not os.path.isdir(self.path_claims): os.makedirs(self.path_claims)
+        self.stale_after, self.heartbeat = stale_after, heartbeat
+
+        ## Identifying this instance
+        self.host = socket.gethostname()
+        self.owner = '%s:%s' % (self.host, os.getpid())
+        self.tag = '%s.%s' % (self.host, os.getpid()) # For file names
+        self.path_clock = os.path.join(self.path_claims, '.clock.' + self.tag)
+
+        ## Claims currently held, refreshed by the heartbeat thread
+        self.held = set()
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target = self.beat)
+        self.thread.daemon = True
+        self.thread.start()
+        return
+
+    def key(self, video_file):
+        '''Lock file name for a video, from its path relative to path_project so hosts
+        with different mount points agree'''
+        relative = os.path.relpath(os.path.abspath(video_file), os.path.abspath(self.path_project))
+        return os.path.join(self.path_claims, hashlib.sha1(relative.encode()).hexdigest())
+
+    def now(self):
+        '''Current time according to the shared file system, avoids clock skew between
+        hosts when comparing against lock file modification times'''
+        try:
+            with open(self.path_clock, 'a'):
+                os.utime(self.path_clock, None)
+            return os.stat(self.path_clock).st_mtime
+        except OSError:
+            return time()
+
+    def beat(self):
+        '''Heartbeat thread: refreshes the modification time of every held claim'''
+        while not self.stopped.wait(self.heartbeat):
+            with self.lock:
+                held = list(self.held)
+            for path in held:
+                if not self.owns(path):
+                    self.lose(path)
+                    continue
+                try: os.utime(path, None)
+                except OSError: self.lose(path)
+        return
+
+    def owns(self, path):
+        '''True if a lock file is still the one this instance created, not one created by
+        another host after taking over the claim'''
+        state = self.read(path)
+        return state != None and state[0] == self.owner
+
+    def lose(self, path):
+        '''Stops refreshing a claim that was removed or taken over by another host'''
+        with self.lock:
+            if path not in self.held: return
+            self.held.discard(path)
+        print('!! Lost claim (lock file removed or taken over): %s' % path)
+        return
+
+    def create(self, path, video_file):
+        '''Atomically creates a lock file, returns False if it already exists'''
+        try:
+            fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            return False
+        with os.fdopen(fd, 'w') as f:
+            json.dump({'owner':self.owner, 'video':video_file, 'claimed':time()}, f)
+        return True
+
+    def read(self, path):
+        '''State of a lock file: its owner, claim time, and last heartbeat, None if it is gone'''
+        try:
+            heartbeat = os.stat(path).st_mtime
+            with open(path) as f: record = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return (record.get('owner'), record.get('claimed'), heartbeat)
+
+    def is_stale(self, state):
+        '''True if a lock file's state (from read) has not been refreshed for stale_after seconds'''
+        return state != None and self.now() - state[2] > self.stale_after
+
+    def reclaim(self, path, video_file):
+        '''Takes over a stale claim. Renaming is atomic, so only one host can move the
+        stale lock file away; that host then creates a fresh claim. Another host may have
+        taken over the same claim between the staleness check and the rename, so the file
+        renamed away must still be the claim judged stale, otherwise it is put back.'''
+        stale = self.read(path)
+        if not self.is_stale(stale): return False
+        tombstone = '%s.stale.%s' % (path, self.tag)
+        try:
+            os.rename(path, tombstone)
+        except OSError:
+            return False
+        if self.read(tombstone) != stale:
+            ## A fresh claim, put back without replacing any claim created since
+            try: os.link(tombstone, path)
+            except FileExistsError: pass
+            except OSError:
+                if not os.path.exists(path): os.rename(tombstone, path)
+            try: os.remove(tombstone)
+            except OSError: pass
+            return False
+        print('----> Reclaiming stale claim from %s: %s' % (stale[0], video_file))
+        os.remove(tombstone)
+        return self.create(path, video_file)
+
+    def claim(self, video_file):
+        '''Tries to claim a video for this host
+        ----
+        Inputs:
+          video_file (str): Path to video file
+        ----
+        Returns:
+          (bool): True if this host should process the video'''
+        path = self.key(video_file)
+        if os.path.exists(path + '.done') or os.path.exists(path + '.failed'):
+            return False
+        claimed = self.create(path, video_file)
+        if not claimed:
+            claimed = self.reclaim(path, video_file)
+        if claimed:
+            with self.lock: self.held.add(path)
+        if self.debug: print('work_queue.claim:', video_file, claimed)
+        return claimed
+
+    def release(self, video_file, completed = True):
+        '''Releases a claim, leaving a '.done' or '.failed' marker
+        ----
+        Inputs:
+          video_file (str): Path to video file
+          completed (bool): True if successfully processed, False if skipped
+        ----
+        Returns:
+          None'''
+        path = self.key(video_file)
+        if os.path.exists(path) and not self.owns(path):
+            self.lose(path) # The new owner leaves the marker
+            return
+        with self.lock: self.held.discard(path)
+        marker = path + ('.done' if completed else '.failed')
+        try: os.rename(path, marker)
+        except OSError: self.create(marker, video_file)
+        return
+
+    def acquire(self, name, timeout = 600):
+        '''Waits for a named project-wide lock (e.g. for writing results.csv). Stale locks
+        are taken over like stale claims.
+        ----
+        Inputs:
+          name (str): Lock name
+          timeout (float): Seconds to wait before giving up
+        ----
+        Returns:
+          (bool): True if the lock was acquired'''
+        path = os.path.join(self.path_claims, name + '.lock')
+        t0 = time()
+        while time() - t0 < timeout:
+            if self.create(path, name) or self.reclaim(path, name):
+                with self.lock: self.held.add(path)
+                return True
+            sleep(1)
+        print('!! Could not acquire the %s lock after %s seconds' % (name, timeout))
+        return False
+
+    def unlock(self, name):
+        '''Releases a named project-wide lock'''
+        path = os.path.join(self.path_claims, name + '.lock')
+        if not self.owns(path):
+            self.lose(path)
+            return
+        with self.lock: self.held.discard(path)
+        try: os.remove(path)
+        except OSError: pass
+        return
+
+    def close(self):
+        '''Stops the heartbeat thread and removes this host's clock file'''
+        self.stopped.set()
+        try: os.remove(self.path_clock)
+        except OSError: pass
+        return
@@ -0,0 +1,264 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+## File name : worker_server.py
+## Created by: Adam N. Spierer
+## Date      : October 2026
+## Purpose   : Keeps a warm FreeClimber process (imports loaded, JIT code compiled) behind
+##              a Unix socket, with a thin client that submits videos to it
+
+import os
+import sys
+import json
+import socket
+import argparse
+import tempfile
+import traceback
+import contextlib
+from time import time, ctime
+
+## Default socket, one per user
+path_socket = os.path.join(tempfile.gettempdir(), 'freeclimber-%s.sock' % (os.getuid() if hasattr(os,'getuid') else 'user'))
+
+## Marks the status line that ends the reply to a request
+status_marker = '\x00'
+
+def warm_up():
+    '''Imports the scientific stack and runs spot detection once on a small image, so
+    trackpy (and numba, if installed) code is compiled before the first video arrives'''
+    import matplotlib
+    matplotlib.use('Agg')
+    import detector
+    for item in vars(detector).values():
+        if isinstance(item, detector.lazy_import): item._load()
+    image = detector.np.full((64, 64), 200.)
+    image[30:35, 30:35] = 80.
+    detector.tp.locate(image, 7, invert = True)
+    import FreeClimber_main
+    import results
+    return
+
+class stream(object):
+    '''File-like object sending printed output to the client as it is written'''
+    def __init__(self, connection):
+        self.connection = connection
+    def write(self, text):
+        try: self.connection.sendall(text.encode())
+        except OSError: pass # Client went away, keep processing
+        return len(text)
+    def flush(self):
+        return
+
+def project_folder(config_file, cwd):
+    '''Reads path_project from a configuration file, as FreeClimber_main does
+    ----
+    Inputs:
+      config_file (str): Path to configuration (.cfg) file
+      cwd (str): Working directory of the client, which relative paths are from
+    ----
+    Returns:
+      path_project (str): Absolute path to the project folder'''
+    variables = {'path_project':os.path.dirname(config_file)}
+    with open(config_file) as f:
+        for line in f:
+            if not line.startswith('path_project'): continue
+            try: exec(line.rstrip(), dict(), variables)
+            except: pass
+    f.close()
+    return os.path.normpath(os.path.join(cwd, variables['path_project']))
+
+def process(request):
+    '''Processes the videos of a request, printing the detector's output
+    ----
+    Inputs:
+      request (dict): 'videos', 'config_file', 'optimization_plots', 'concat', and the
+                      client's working directory 'cwd'
+    ----
+    Returns:
+      status (dict): 'completed' and 'skipped' videos, with video details'''
+    import FreeClimber_main
+    import matplotlib.pyplot as plt
+    status = {'completed':dict(), 'skipped':dict()}
+    for video_file in request['videos']:
+        t0 = time()
+        try:
+            details = FreeClimber_main.run_detector(video_file, request['config_file'],
+                                                    optimization_plots = request.get('optimization_plots', False))
+            details['seconds'] = round(time() - t0, 2)
+            status['completed'][video_file] = details
+        except (Exception, SystemExit):
+            traceback.print_exc(file = sys.stdout)
+            status['skipped'][video_file] = {'seconds':round(time() - t0, 2)}
+        plt.close('all')
+
+    ## Updating results.csv in the configuration's path_project, as FreeClimber_main does
+    if request.get('concat') and len(status['completed']) > 0:
+        import results
+        path_project = project_folder(request['config_file'], request.get('cwd', os.getcwd()))
+        slope_files = []
+        for root, dirs, files in os.walk(path_project):
+            slope_files += [os.path.join(root, name) for name in files if name.endswith('.slopes.csv')]
+        results.update_results(os.path.join(path_project, 'results.csv'), sorted(slope_files))
+    return status
+
+def handle(connection):
+    '''Reads one request from a client, runs it, and replies with its output and status
+    ----
+    Inputs:
+      connection (socket): Client connection
+    ----
+    Returns:
+      running (bool): False if the client asked the server to stop'''
+    with connection.makefile('r') as f:
+        request = json.loads(f.readline())
+    command = request.get('command', 'process')
+    print('%s :: %s %s' % (ctime(), command, ' '.join(request.get('videos', []))))
+
+    status = {'command':command, 'pid':os.getpid()}
+    if command == 'process':
+        with contextlib.redirect_stdout(stream(connection)):
+            status.update(process(request))
+    connection.sendall((status_marker + json.dumps(status) + '\n').encode())
+    connection.close()
+    return command != 'stop'
+
+def serve(path = path_socket):
+    '''Runs the worker server until stopped. Requests are processed one at a time, in the
+    order they arrive.
+    ----
+    Inputs:
+      path (str): Path to the Unix socket
+    ----
+    Returns:
+      None'''
+    if not hasattr(socket, 'AF_UNIX'):
+        print('!! Unix sockets are not available on this system')
+        raise SystemExit(1)
+
+    ## Only one server per socket, replacing a socket left by a server that crashed
+    if os.path.exists(path):
+        if request_server({'command':'ping'}, path = path, quiet = True) != None:
+            print('!! A worker server is already listening on %s' % path)
+            raise SystemExit(1)
+        os.remove(path)
+
+    t0 = time()
+    print('Warming up...', end = ' ')
+    sys.stdout.flush()
+    warm_up()
+    print('done in %.1f seconds' % (time() - t0))
+
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(path)
+    os.chmod(path, 0o600)
+    server.listen(16)
+    print('Listening on %s, press Ctrl+C to stop' % path)
+    try:
+        running = True
+        while running:
+            connection, address = server.accept()
+            try: running = handle(connection)
+            except Exception: traceback.print_exc()
+    except KeyboardInterrupt:
+        print('\nStopping')
+    finally:
+        server.close()
+        if os.path.exists(path): os.remove(path)
+    return
+
+def request_server(request, path = path_socket, quiet = False):
+    '''Sends a request to the worker server, printing its output as it arrives
+    ----
+    Inputs:
+      request (dict): Request, see process()
+      path (str): Path to the Unix socket
+      quiet (bool): True does not print output or connection errors
+    ----
+    Returns:
+      status (dict): Status reply of the server, None if it could not be reached'''
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        client.connect(path)
+    except OSError:
+        if not quiet: print('!! No worker server on %s, start one with: worker_server.py serve' % path)
+        return None
+    client.sendall((json.dumps(request) + '\n').encode())
+
+    status = None
+    with client.makefile('r') as f:
+        for line in f:
+            if line.startswith(status_marker):
+                status = json.loads(line[len(status_marker):])
+            elif not quiet:
+                print(line, end = '')
+    client.close()
+    return status
+
+def define_argument_parser():
+    '''Defines arguments to be parsed, via argparse module.
+    ----
+    Inputs:
+      None
+    ----
+    Returns:
+      args (object): Namespace object containing the flags and arguments passed to program
+    '''
+    parser = argparse.ArgumentParser(prog='FreeClimber',
+                                    description='worker_server.py - Processes videos in a warm FreeClimber process, submitted over a Unix socket',
+                                    epilog='For documentation and a tutorial, see https://github.com/adamspierer/FreeClimber',
+                                    allow_abbrev=False)
+    parser.add_argument('command',
+                        choices=['serve','submit','ping','stop'],
+                        help="'serve' starts the server, 'submit' sends videos to it, 'ping' checks it is running, 'stop' stops it")
+    parser.add_argument('videos',
+                        nargs='*',
+                        help="Video files to process with 'submit'")
+    parser.add_argument('--config_file',
+                        type=str,
+                        default=None,
+                        help="Path to configuration file (ends with '.cfg'), required with 'submit'")
+    parser.add_argument('--optimization_plots',
+                        default=False,
+                        action='store_true',
+                        help="Creates the detector optimization plots with spot metrics for each video")
+    parser.add_argument('--concat',
+                        default=False,
+                        action='store_true',
+                        help="Updates results.csv in the configuration's path_project once the videos are processed")
+    parser.add_argument('--socket',
+                        type=str,
+                        default=path_socket,
+                        help="Path to the Unix socket (default = %s)" % path_socket)
+    args = parser.parse_intermixed_args() # Videos can come before or after the flags
+    return args
+
+def main():
+    '''Runs the server or sends it a request'''
+    args = define_argument_parser()
+    if args.command == 'serve':
+        serve(args.socket)
+        return
+
+    request = {'command':args.command}
+    if args.command == 'submit':
+        if args.config_file == None or len(args.videos) == 0:
+            print("!! 'submit' requires --config_file and at least one video")
+            raise SystemExit(1)
+        request.update(command = 'process',
+                       videos = [os.path.abspath(item) for item in args.videos],
+                       config_file = os.path.abspath(args.config_file),
+                       optimization_plots = args.optimization_plots,
+                       concat = args.concat,
+                       cwd = os.getcwd()) # For a relative path_project
+
+    status = request_server(request, path = args.socket)
+    if status == None: raise SystemExit(1)
+    if args.command == 'ping': print('Worker server running (pid %s)' % status['pid'])
+    if args.command == 'stop': print('Worker server stopped')
+    if len(status.get('skipped', {})) > 0:
+        print('!! Skipped: %s' % ' '.join(status['skipped'].keys()))
+        raise SystemExit(1)
+    return
+
+if __name__ == '__main__':
+    main()